@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,6 +44,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'myapp.instrumentation.InstrumentationMiddleware',
+    'myapp.throttling.LoadSheddingMiddleware',
+    'myapp.routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -76,6 +80,20 @@ WSGI_APPLICATION = 'djangoProject.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
+# With DB_POOL=1 (the default) every process keeps a psycopg pool of DB_POOL_MIN_SIZE to
+# DB_POOL_MAX_SIZE connections and a request waits up to DB_POOL_TIMEOUT seconds for one.
+# Keep worker processes * DB_POOL_MAX_SIZE below the server's max_connections.
+# With DB_POOL=0 connections are kept open for DB_CONN_MAX_AGE seconds instead.
+# CONN_HEALTH_CHECKS checks a connection before reuse, or before the pool hands it out.
+
+DB_POOL = os.environ.get('DB_POOL', '1') == '1'
+DB_POOL_OPTIONS = {
+    'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+    'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '10')),
+    'timeout': float(os.environ.get('DB_POOL_TIMEOUT', '10')),
+    'max_idle': float(os.environ.get('DB_POOL_MAX_IDLE', '300')),
+    'max_lifetime': float(os.environ.get('DB_POOL_MAX_LIFETIME', '3600')),
+}
 
 DATABASES = {
     'default': {
@@ -85,9 +103,147 @@ DATABASES = {
         'PASSWORD': 'password.01',
         'HOST': 'localhost',
         'PORT': '5432',
+        'CONN_MAX_AGE': 0 if DB_POOL else int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {'pool': DB_POOL_OPTIONS} if DB_POOL else {},
     }
 }
 
+# Read replicas: DB_REPLICA_HOSTS=host1,host2 adds 'replica1', 'replica2', ... copies of
+# 'default' on those hosts. GET/HEAD requests under /api/ read from them in turn, other
+# reads and all writes use 'default'. A client that wrote reads from 'default' for
+# REPLICA_STICKY_SECONDS, so it sees its own writes despite replication lag. That flag is
+# kept per user in REPLICA_STICKY_CACHE, which every worker process sees with the file or
+# redis API_CACHE_BACKEND, and in a cookie for clients that keep cookies.
+
+for index, host in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), 1):
+    DATABASES[f'replica{index}'] = {**DATABASES['default'], 'HOST': host.strip(), 'TEST': {'MIRROR': 'default'}}
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['myapp.routers.ReplicaRouter']
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', '10'))
+REPLICA_STICKY_CACHE = 'api'
+
+
+# Caches
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# The 'api' cache holds product/customer API responses. locmem is per process, so
+# deployments with several worker processes need the file or redis backend to share
+# invalidations between them.
+
+API_CACHE_BACKEND = os.environ.get('API_CACHE_BACKEND', 'locmem')
+API_CACHE_OPTIONS = {'MAX_ENTRIES': int(os.environ.get('API_CACHE_MAX_ENTRIES', '10000'))}
+API_CACHES = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'api',
+        'OPTIONS': API_CACHE_OPTIONS,
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('API_CACHE_LOCATION', str(BASE_DIR / '.cache' / 'api')),
+        'OPTIONS': API_CACHE_OPTIONS,
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('API_CACHE_LOCATION', 'redis://127.0.0.1:6379/1'),
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'api': {
+        **API_CACHES[API_CACHE_BACKEND],
+        'TIMEOUT': int(os.environ.get('API_CACHE_TIMEOUT', '300')),
+    },
+    # revoked JWTs until they expire; every worker process has to see them, so this is
+    # never per process: files on this host by default, redis when AUTH_CACHE_LOCATION
+    # is set, for deployments on several hosts. Entries must not be culled before they expire.
+    'auth': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['AUTH_CACHE_LOCATION'],
+    } if 'AUTH_CACHE_LOCATION' in os.environ else {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': str(BASE_DIR / '.cache' / 'auth'),
+        'OPTIONS': {'MAX_ENTRIES': 1000000},
+    },
+}
+
+
+# Jobs
+# Database-backed job queue (myapp.jobs) processed by `manage.py run_worker`. JOB_QUEUES
+# limits how many jobs of a queue run at once over all workers. A job whose worker has not
+# finished it JOB_LEASE_SECONDS after claiming it is given to another worker; failed jobs are
+# retried after JOB_RETRY_SECONDS, doubled for every further attempt. Orders of a product
+# change are refreshed in the request up to ORDER_REFRESH_INLINE_LIMIT, by the workers above.
+
+JOB_QUEUES = {
+    'default': int(os.environ.get('JOB_QUEUE_DEFAULT_CONCURRENCY', '4')),
+    'orders': int(os.environ.get('JOB_QUEUE_ORDERS_CONCURRENCY', '2')),
+}
+JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', '300'))
+JOB_RETRY_SECONDS = int(os.environ.get('JOB_RETRY_SECONDS', '10'))
+ORDER_REFRESH_INLINE_LIMIT = int(os.environ.get('ORDER_REFRESH_INLINE_LIMIT', '1000'))
+ORDER_REFRESH_BATCH_SIZE = 1000
+
+
+# Throttling and load shedding
+# Requests are classed as staff, write (other users' unsafe methods), read or anon.
+# THROTTLE_RATES gives each client a token bucket per class as (burst, requests per second);
+# None is unlimited. Views naming a throttle_scope in THROTTLE_SCOPES get a second bucket
+# for that scope. Buckets live in each process unless THROTTLE_CACHE names a cache alias to
+# share them through.
+# Once the requests in flight in a process reach SHED_MAX_IN_FLIGHT, or the recent mean query
+# time reaches SHED_DB_LATENCY_MS, the load is 1.0 and every class whose SHED_LOAD is reached
+# gets 503 with Retry-After; staff is never shed. 0 turns either signal off.
+
+THROTTLE_RATES = {
+    'staff': None,
+    'write': (30, 5.0),
+    'read': (120, 20.0),
+    'anon': (20, 1.0),
+}
+THROTTLE_SCOPES = {
+    'search': (10, 2.0),
+}
+THROTTLE_CACHE = os.environ.get('THROTTLE_CACHE') or None
+SHED_MAX_IN_FLIGHT = int(os.environ.get('SHED_MAX_IN_FLIGHT', '64'))
+SHED_DB_LATENCY_MS = float(os.environ.get('SHED_DB_LATENCY_MS', '100'))
+SHED_DB_LATENCY_HALF_LIFE = 5.0
+SHED_LOAD = {
+    'anon': 1.0,
+    'read': 1.5,
+    'write': 2.0,
+}
+SHED_RETRY_AFTER = int(os.environ.get('SHED_RETRY_AFTER', '5'))
+SHED_EXEMPT_PATHS = ['/metrics/']
+
+
+# Instrumentation
+# Requests slower than SLOW_REQUEST_MS are logged with their slowest queries.
+# /metrics/ serves per-route histograms in Prometheus text format to these addresses only.
+
+SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', '500'))
+SLOW_REQUEST_LOGGED_QUERIES = 5
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'myapp': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
 
 
 # Password validation
@@ -135,10 +291,31 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'myapp.authentication.ClaimsJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # same bytes as JSONRenderer, encoded with orjson
+    'DEFAULT_RENDERER_CLASSES': [
+        'myapp.rendering.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'myapp.pagination.IdCursorPagination',
+    'PAGE_SIZE': 50,
+    'DEFAULT_THROTTLE_CLASSES': [
+        'myapp.throttling.TokenBucketThrottle',
+    ],
+}
+
+# Access tokens carry username/is_staff/is_superuser, so authenticating a request
+# needs no user lookup. The few places that need the user object read it through an
+# in-process LRU cache.
+SIMPLE_JWT = {
+    'TOKEN_OBTAIN_SERIALIZER': 'myapp.authentication.ClaimsTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'myapp.authentication.ClaimsTokenRefreshSerializer',
+    'TOKEN_USER_CLASS': 'myapp.authentication.ClaimsUser',
 }
 
+JWT_USER_CACHE_SIZE = 1024
+JWT_USER_CACHE_TTL = 60
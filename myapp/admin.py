@@ -1,7 +1,8 @@
 from django.contrib import admin
-from .models import Product, Customer, Order
+from .models import Product, Customer, Order, Job
 
 # Register your models here.
 admin.site.register(Product)
 admin.site.register(Customer)
-admin.site.register(Order)
\ No newline at end of file
+admin.site.register(Order)
+admin.site.register(Job)
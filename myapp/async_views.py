@@ -0,0 +1,107 @@
+from django.http import Http404, StreamingHttpResponse
+from django.views import View
+from rest_framework import exceptions
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.views import exception_handler
+
+from .models import Product
+from .pagination import OrderCursorPagination, IdCursorPagination
+from .permissions import IsAdminOrReadOnly
+from .rendering import FastJSONRenderer
+from .serializers import ProductSerializer, OrderSerializer
+from .views import OrderViewSet
+
+renderer = FastJSONRenderer()
+
+
+def render(data):
+    # JSONRenderer renders None as an empty body
+    return b'null' if data is None else renderer.render(data)
+
+
+class AsyncReadView(View):
+    # list/retrieve on the async ORM with the same authentication, permissions,
+    # pagination and JSON as the DRF viewsets; objects are serialized one at a
+    # time while the response is streamed
+    queryset = None
+    serializer_class = None
+    pagination_class = IdCursorPagination
+    authentication_classes = api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES
+    permission_classes = [IsAuthenticated, IsAdminOrReadOnly]
+
+    async def get(self, request, pk=None):
+        drf_request = Request(request)
+        try:
+            await self.check_request(drf_request)
+            if pk is None:
+                return await self.list(drf_request)
+            return await self.retrieve(drf_request, pk)
+        except (exceptions.APIException, Http404) as exc:
+            return self.handle_exception(drf_request, exc)
+
+    async def check_request(self, request):
+        request.user, request.auth = None, None
+        authenticators = [authentication_class() for authentication_class in self.authentication_classes]
+        # the first authenticator names the scheme in WWW-Authenticate, as in DRF
+        self.authenticator = authenticators[0]
+        for authenticator in authenticators:
+            result = await authenticator.aauthenticate(request)
+            if result is not None:
+                request.user, request.auth = result
+                break
+        if request.user is None:
+            raise exceptions.NotAuthenticated()
+        for permission_class in self.permission_classes:
+            if not permission_class().has_permission(request, self):
+                raise exceptions.PermissionDenied()
+        for throttle_class in self.throttle_classes:
+            throttle = throttle_class()
+            if not throttle.allow_request(request, self):
+                raise exceptions.Throttled(throttle.wait())
+
+    async def list(self, request):
+        paginator = self.pagination_class()
+        page = await paginator.apaginate_queryset(self.queryset.all(), request, self)
+        links = {'next': paginator.get_next_link(), 'previous': paginator.get_previous_link()}
+        return StreamingHttpResponse(self.stream_page(page, links), content_type='application/json')
+
+    async def retrieve(self, request, pk):
+        try:
+            instance = await self.queryset.aget(pk=pk)
+        except self.queryset.model.DoesNotExist:
+            raise Http404(f'No {self.queryset.model._meta.object_name} matches the given query.')
+        return StreamingHttpResponse(self.stream_object(instance), content_type='application/json')
+
+    async def stream_page(self, page, links):
+        serializer = self.serializer_class()
+        yield b'{"next":' + render(links['next']) + b',"previous":' + render(links['previous']) + b',"results":['
+        for index, instance in enumerate(page):
+            yield (b',' if index else b'') + render(serializer.to_representation(instance))
+        yield b']}'
+
+    async def stream_object(self, instance):
+        yield render(self.serializer_class(instance).data)
+
+    def handle_exception(self, request, exc):
+        response = exception_handler(exc, {'view': self, 'request': request})
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            response.status_code = 401
+            response['WWW-Authenticate'] = self.authenticator.authenticate_header(request)
+        response.accepted_renderer = renderer
+        response.accepted_media_type = renderer.media_type
+        response.renderer_context = {}
+        return response.render()
+
+
+class AsyncProductView(AsyncReadView):
+    queryset = Product.objects.all()
+    serializer_class = ProductSerializer
+
+
+class AsyncOrderView(AsyncReadView):
+    queryset = OrderViewSet.queryset
+    serializer_class = OrderSerializer
+    pagination_class = OrderCursorPagination
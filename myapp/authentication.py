@@ -0,0 +1,199 @@
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.utils.functional import cached_property
+from rest_framework import exceptions, serializers
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+AUTH_CACHE_ALIAS = 'auth'
+# claims copied from the user into every token; requests carrying them need no user lookup
+USER_CLAIMS = ('username', 'is_staff', 'is_superuser')
+
+
+class LRUCache:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def pop(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+# per process; user changes in this process evict entries through signals,
+# changes made elsewhere are picked up after JWT_USER_CACHE_TTL seconds
+users = LRUCache(settings.JWT_USER_CACHE_SIZE, settings.JWT_USER_CACHE_TTL)
+
+
+def get_cached_user(user_id):
+    user = users.get(user_id)
+    if user is None:
+        try:
+            user = get_user_model().objects.get(**{api_settings.USER_ID_FIELD: user_id})
+        except get_user_model().DoesNotExist:
+            raise exceptions.AuthenticationFailed('User not found', code='user_not_found')
+        users.set(user_id, user)
+    if not user.is_active:
+        raise exceptions.AuthenticationFailed('User is inactive', code='user_inactive')
+    return user
+
+
+def add_user_claims(token, user):
+    for claim in USER_CLAIMS:
+        token[claim] = getattr(user, claim)
+    return token
+
+
+def tokens_for_user(user):
+    return add_user_claims(RefreshToken.for_user(user), user)
+
+
+# Revoked tokens are kept in the 'auth' cache only until they would have expired anyway.
+# A user-wide entry rejects every token of that user issued up to the stored time.
+def denied_token_key(jti):
+    return f'jwt:denied:{jti}'
+
+
+def denied_user_key(user_id):
+    return f'jwt:denied-user:{user_id}'
+
+
+def deny_token(token):
+    timeout = max(int(token['exp'] - time.time()), 1)
+    caches[AUTH_CACHE_ALIAS].set(denied_token_key(token[api_settings.JTI_CLAIM]), True, timeout)
+
+
+def deny_user(user_id):
+    lifetime = max(api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME)
+    caches[AUTH_CACHE_ALIAS].set(denied_user_key(user_id), int(time.time()), int(lifetime.total_seconds()))
+
+
+def denied_keys(token):
+    return [denied_token_key(token.get(api_settings.JTI_CLAIM)), denied_user_key(token.get(api_settings.USER_ID_CLAIM))]
+
+
+def raise_if_denied(token, denied):
+    jti_key, user_key = denied_keys(token)
+    if jti_key in denied or (user_key in denied and token.get('iat', 0) <= denied[user_key]):
+        raise InvalidToken('Token has been revoked', code='token_revoked')
+
+
+def check_not_denied(token):
+    raise_if_denied(token, caches[AUTH_CACHE_ALIAS].get_many(denied_keys(token)))
+
+
+async def acheck_not_denied(token):
+    raise_if_denied(token, await caches[AUTH_CACHE_ALIAS].aget_many(denied_keys(token)))
+
+
+class ClaimsUser(TokenUser):
+    # answers is_staff and friends from the token and only loads the
+    # user for anything else
+    @cached_property
+    def user(self):
+        return get_cached_user(self.id)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.user, name)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+        check_not_denied(token)
+        return token
+
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken('Token contained no recognizable user identification')
+        if all(claim in validated_token for claim in USER_CLAIMS):
+            return ClaimsUser(validated_token)
+        # tokens issued before the claims were added
+        return get_cached_user(validated_token[api_settings.USER_ID_CLAIM])
+
+    async def aauthenticate(self, request):
+        # authenticate() for the async views: the same checks with the cache and ORM calls awaited
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = super().get_validated_token(raw_token)
+        await acheck_not_denied(validated_token)
+        if all(claim in validated_token for claim in USER_CLAIMS):
+            return self.get_user(validated_token), validated_token
+        return await sync_to_async(self.get_user)(validated_token), validated_token
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        return add_user_claims(super().get_token(user), user)
+
+
+class ClaimsTokenRefreshSerializer(serializers.Serializer):
+    refresh = serializers.CharField()
+    access = serializers.CharField(read_only=True)
+
+    def validate(self, attrs):
+        refresh = RefreshToken(attrs['refresh'])
+        check_not_denied(refresh)
+        # the claims are read again, so a changed is_staff is picked up on the next refresh
+        try:
+            user = get_user_model().objects.get(**{api_settings.USER_ID_FIELD: refresh[api_settings.USER_ID_CLAIM]})
+        except get_user_model().DoesNotExist:
+            raise InvalidToken('User not found')
+        if not user.is_active:
+            raise InvalidToken('User is inactive')
+        return {'access': str(add_user_claims(refresh.access_token, user))}
+
+
+class TokenRevokeSerializer(serializers.Serializer):
+    refresh = serializers.CharField(required=False)
+
+    def validate_refresh(self, value):
+        try:
+            refresh = RefreshToken(value)
+        except TokenError:
+            raise serializers.ValidationError('Token is invalid or expired')
+        if str(refresh[api_settings.USER_ID_CLAIM]) != str(self.context['request'].user.pk):
+            raise serializers.ValidationError('Token belongs to another user')
+        return refresh
@@ -0,0 +1,250 @@
+import json
+import math
+import platform
+import random
+import time
+import tracemalloc
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.db.models import Max, Min
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+
+from .cache import API_CACHE_ALIAS
+from .models import Product, Customer, Order
+
+BENCHMARK_USERNAME = 'benchmark'
+BENCHMARK_PASSWORD = 'benchmark-password'
+
+SCENARIOS = {}
+
+
+def scenario(name, writes=False):
+    def register(func):
+        SCENARIOS[name] = (func, writes)
+        return func
+    return register
+
+
+class BenchmarkContext:
+    # used as a context manager: the rate limits and load shedding are lifted from logging
+    # in until the end, as the benchmarks measure the API rather than the limits in front of it
+    def __init__(self, seed=0, sample=1000):
+        self.rng = random.Random(seed)
+        self.sample = sample
+        self.host = next((host for host in settings.ALLOWED_HOSTS if host != '*' and not host.startswith('.')), 'localhost')
+        self.client = Client(SERVER_NAME=self.host)
+        self.unlimited = override_settings(THROTTLE_RATES={}, THROTTLE_SCOPES={}, SHED_LOAD={})
+
+    def __enter__(self):
+        self.unlimited.enable()
+        try:
+            self.prepare()
+        except BaseException:
+            self.unlimited.disable()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        self.unlimited.disable()
+
+    def prepare(self):
+        self.user, created = User.objects.get_or_create(
+            username=BENCHMARK_USERNAME, defaults={'is_staff': True}
+        )
+        if created or not self.user.is_staff or not self.user.check_password(BENCHMARK_PASSWORD):
+            self.user.is_staff = True
+            self.user.set_password(BENCHMARK_PASSWORD)
+            self.user.save()
+        tokens = self.client.post(
+            '/api/token/',
+            {'username': BENCHMARK_USERNAME, 'password': BENCHMARK_PASSWORD},
+            content_type='application/json',
+        ).json()
+        self.access = tokens['access']
+        self.refresh = tokens['refresh']
+        self.product_ids = self.sample_ids(Product, self.sample)
+        self.customer_ids = self.sample_ids(Customer, self.sample)
+        self.order_ids = self.sample_ids(Order, self.sample)
+
+    def sample_ids(self, model, size):
+        # random ids drawn from the id range; ORDER BY random() would sort the whole table
+        bounds = model.objects.aggregate(low=Min('id'), high=Max('id'))
+        if bounds['low'] is None:
+            return []
+        candidates = {self.rng.randint(bounds['low'], bounds['high']) for _ in range(size * 2)}
+        return sorted(model.objects.filter(id__in=candidates).values_list('id', flat=True)[:size])
+
+    def get(self, path, data=None):
+        return self.client.get(path, data, HTTP_AUTHORIZATION=f'Bearer {self.access}')
+
+    def post(self, path, data, authenticated=True):
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {self.access}'} if authenticated else {}
+        return self.client.post(path, data, content_type='application/json', **headers)
+
+    def pick(self, ids):
+        return self.rng.choice(ids) if ids else 0
+
+
+def uncached():
+    # the 'api' cache swapped for one that stores nothing, so every request runs its view
+    # rather than timing cache hits
+    return override_settings(CACHES={
+        **settings.CACHES, API_CACHE_ALIAS: {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+    })
+
+
+@scenario('product_list')
+def product_list(ctx):
+    return ctx.get('/api/products/')
+
+
+@scenario('product_search')
+def product_search(ctx):
+    return ctx.get('/api/products/', {'search': ctx.rng.choice(['rac', 'hel', 'glo', 'carbon suit'])})
+
+
+@scenario('product_autocomplete')
+def product_autocomplete(ctx):
+    return ctx.get('/api/products/search/', {'q': ctx.rng.choice(['r', 'ra', 'rac', 'raci'])})
+
+
+@scenario('product_detail')
+def product_detail(ctx):
+    return ctx.get(f'/api/products/{ctx.pick(ctx.product_ids)}/')
+
+
+@scenario('order_list')
+def order_list(ctx):
+    return ctx.get('/api/orders/')
+
+
+@scenario('order_detail')
+def order_detail(ctx):
+    return ctx.get(f'/api/orders/{ctx.pick(ctx.order_ids)}/')
+
+
+@scenario('order_create', writes=True)
+def order_create(ctx):
+    products = ctx.rng.sample(ctx.product_ids, min(3, len(ctx.product_ids)))
+    return ctx.post('/api/orders/', {
+        'customer': ctx.pick(ctx.customer_ids), 'status': 'New', 'products': products,
+    })
+
+
+@scenario('token_obtain')
+def token_obtain(ctx):
+    return ctx.post(
+        '/api/token/', {'username': BENCHMARK_USERNAME, 'password': BENCHMARK_PASSWORD}, authenticated=False
+    )
+
+
+@scenario('token_refresh')
+def token_refresh(ctx):
+    return ctx.post('/api/token/refresh/', {'refresh': ctx.refresh}, authenticated=False)
+
+
+def percentile(sorted_values, pct):
+    # nearest-rank percentile
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def call(ctx, func, writes, cold_cache):
+    if cold_cache:
+        caches[API_CACHE_ALIAS].clear()
+    if not writes:
+        return func(ctx)
+    # write scenarios are rolled back so repeated runs see the same dataset
+    with transaction.atomic():
+        response = func(ctx)
+        transaction.set_rollback(True)
+    return response
+
+
+def run_scenario(ctx, name, requests, warmup=10, cold_cache=False, memory_requests=20):
+    func, writes = SCENARIOS[name]
+    for _ in range(warmup):
+        call(ctx, func, writes, cold_cache)
+
+    latencies = []
+    queries = 0
+    errors = 0
+    started = time.perf_counter()
+    for _ in range(requests):
+        with CaptureQueriesContext(connection) as captured:
+            request_started = time.perf_counter()
+            response = call(ctx, func, writes, cold_cache)
+            latencies.append(time.perf_counter() - request_started)
+        queries += len(captured)
+        if response.status_code >= 400:
+            errors += 1
+    elapsed = time.perf_counter() - started
+
+    # a separate, shorter pass: tracemalloc slows the interpreter down too much to time under it
+    tracemalloc.start()
+    for _ in range(memory_requests):
+        call(ctx, func, writes, cold_cache)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        'requests': requests,
+        'errors': errors,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'mean_ms': sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+        'throughput_rps': requests / elapsed if elapsed else 0.0,
+        'queries_per_request': queries / requests if requests else 0.0,
+        'peak_memory_kib': peak / 1024,
+    }
+
+
+def environment():
+    return {
+        'timestamp': timezone.now().isoformat(),
+        'database': connection.vendor,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'dataset': {
+            'products': Product.objects.count(),
+            'customers': Customer.objects.count(),
+            'orders': Order.objects.count(),
+        },
+    }
+
+
+def compare(results, baseline, threshold):
+    # a scenario regresses when its p95 grows by more than `threshold` (a fraction)
+    # or when it issues at least half a query per request more than before
+    regressions = []
+    for name, current in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if previous is None:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + threshold):
+            regressions.append(f"{name}: p95 {previous['p95_ms']:.2f} ms -> {current['p95_ms']:.2f} ms")
+        if current['queries_per_request'] >= previous['queries_per_request'] + 0.5:
+            regressions.append(
+                f"{name}: queries/request {previous['queries_per_request']:.2f} -> {current['queries_per_request']:.2f}"
+            )
+    return regressions
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_results(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
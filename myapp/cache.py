@@ -0,0 +1,140 @@
+import hashlib
+import threading
+import time
+
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from rest_framework.response import Response
+
+from .models import Product, Customer, Order
+from .routers import reading_primary
+
+API_CACHE_ALIAS = 'api'
+# models whose changes bump the version counters used by response caching and ETags
+VERSIONED_MODELS = (Product, Customer, Order)
+
+
+class CacheStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def snapshot(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0,
+            }
+
+    def reset(self):
+        with self.lock:
+            self.hits = self.misses = 0
+
+
+stats = CacheStats()
+
+
+def api_cache():
+    return caches[API_CACHE_ALIAS]
+
+
+# every cached response is stored under the versions current when it was read,
+# so bumping a version makes older entries unreachable instead of deleting them
+def list_version_key(model):
+    return f'api:{model._meta.label_lower}:list'
+
+
+def all_objects_version_key(model):
+    return f'api:{model._meta.label_lower}:all'
+
+
+def object_version_key(model, pk):
+    return f'api:{model._meta.label_lower}:{pk}'
+
+
+def current_versions(keys):
+    cache = api_cache()
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        # a fresh, never used value: entries written under an evicted version stay unreachable
+        for key in missing:
+            cache.add(key, time.time_ns(), timeout=None)
+        versions.update(cache.get_many(missing))
+    return [versions.get(key) for key in keys]
+
+
+def bump(key):
+    cache = api_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def invalidate(model, pks=None):
+    if model not in VERSIONED_MODELS:
+        return
+    bump(list_version_key(model))
+    if pks is None:
+        bump(all_objects_version_key(model))
+    else:
+        for pk in pks:
+            bump(object_version_key(model, pk))
+
+
+def invalidate_on_commit(model, pks=None):
+    # once now, so readers stop using the old entries, and once after commit, so an entry
+    # filled from the pre-commit state in between is dropped as well
+    invalidate(model, pks)
+    transaction.on_commit(lambda: invalidate(model, pks))
+
+
+class CachedResponseMixin:
+    def list(self, request, *args, **kwargs):
+        model = self.get_queryset().model
+        path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        [version] = current_versions([list_version_key(model)])
+        key = f'api:{model._meta.label_lower}:list:{version}:{path}'
+        return self.cached_response(key, super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        model = self.get_queryset().model
+        lookup = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        try:
+            pk = model._meta.pk.to_python(lookup)
+        except ValidationError:
+            return super().retrieve(request, *args, **kwargs)
+        versions = current_versions([all_objects_version_key(model), object_version_key(model, pk)])
+        # the query string selects the fields (?fields=, ?expand=)
+        path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        key = f'api:{model._meta.label_lower}:detail:{pk}:{versions[0]}:{versions[1]}:{path}'
+        return self.cached_response(key, super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, key, view, request, *args, **kwargs):
+        cache = api_cache()
+        data = cache.get(key)
+        if data is not None:
+            stats.record(hit=True)
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+        stats.record(hit=False)
+        # a lagging replica would store stale data under the versions bumped by the write
+        with reading_primary():
+            response = view(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data)
+        response['X-Cache'] = 'MISS'
+        return response
@@ -0,0 +1,63 @@
+import hashlib
+
+from django.db.models import Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .cache import current_versions, list_version_key
+from .routers import read_alias
+
+
+def make_etag(request, *parts):
+    # different renderers (JSON, browsable API) must not share an ETag
+    value = ':'.join(str(part) for part in (request.accepted_renderer.format, *parts))
+    return '"%s"' % hashlib.md5(value.encode()).hexdigest()
+
+
+class ConditionalGetMixin:
+    # fields whose greatest value is the Last-Modified of a single object
+    last_modified_fields = ['updated_at']
+    # other models whose changes alter the list response of this viewset
+    list_depends_on = ()
+
+    def list(self, request, *args, **kwargs):
+        models = [self.get_queryset().model, *self.list_depends_on]
+        versions = current_versions([list_version_key(model) for model in models])
+        etag = make_etag(request, request.get_full_path(), *versions)
+        response = self.conditional_response(request, etag, None, super().list, *args, **kwargs)
+        if response.status_code == 200 and read_alias.get() is not None and 'X-Cache' not in response:
+            # read from a replica that may lag behind the versions; responses of the cache
+            # were read from the primary
+            del response['ETag']
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        last_modified = self.get_last_modified(kwargs[self.lookup_url_kwarg or self.lookup_field])
+        if last_modified is None:
+            return super().retrieve(request, *args, **kwargs)
+        etag = make_etag(request, request.get_full_path(), last_modified.isoformat())
+        return self.conditional_response(request, etag, last_modified, super().retrieve, *args, **kwargs)
+
+    def get_last_modified(self, pk):
+        model = self.get_queryset().model
+        try:
+            values = model._default_manager.filter(pk=pk).aggregate(
+                **{f'last_modified_{i}': Max(field) for i, field in enumerate(self.last_modified_fields)}
+            )
+        except (TypeError, ValueError):
+            return None
+        values = [value for value in values.values() if value is not None]
+        return max(values) if values else None
+
+    def conditional_response(self, request, etag, last_modified, view, *args, **kwargs):
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
@@ -0,0 +1,145 @@
+import csv
+import json
+from datetime import datetime, time
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.renderers import BaseRenderer
+
+from .models import Product, Order
+
+CHUNK_SIZE = 2000
+BUFFER_SIZE = 64 * 1024
+
+
+class ExportRenderer(BaseRenderer):
+    # only used for content negotiation (?format= or Accept); exports stream their own body
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, cls=DjangoJSONEncoder).encode()
+
+
+class NDJSONRenderer(ExportRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+class CSVRenderer(ExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+def parse_since(value):
+    if not value:
+        return None
+    since = parse_datetime(value)
+    if since is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        since = datetime.combine(day, time.min)
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
+
+
+# iterator(chunk_size) reads through a server-side cursor on PostgreSQL and runs
+# the prefetch once per chunk, so only one chunk of rows is held at a time
+def order_records(since=None, chunk_size=CHUNK_SIZE):
+    queryset = (
+        Order.objects.select_related('customer')
+        .prefetch_related(Prefetch('products', queryset=Product.objects.only('id').order_by('id')))
+        .order_by('date_created', 'id')
+    )
+    if since is not None:
+        queryset = queryset.filter(date_created__gte=since)
+    for order in queryset.iterator(chunk_size=chunk_size):
+        yield {
+            'id': order.id,
+            'customer_id': order.customer_id,
+            'customer_name': order.customer.name,
+            'status': order.status,
+            'date_created': order.date_created,
+            'updated_at': order.updated_at,
+            'total_price': order.total_price,
+            'products': [product.id for product in order.products.all()],
+        }
+
+
+def product_records(since=None, chunk_size=CHUNK_SIZE):
+    queryset = Product.objects.order_by('id')
+    if since is not None:
+        queryset = queryset.filter(updated_at__gte=since)
+    for product in queryset.values('id', 'name', 'price', 'available', 'stock', 'updated_at').iterator(chunk_size=chunk_size):
+        yield product
+
+
+EXPORTS = {
+    'orders': (order_records, [
+        'id', 'customer_id', 'customer_name', 'status', 'date_created', 'updated_at', 'total_price', 'products',
+    ]),
+    'products': (product_records, ['id', 'name', 'price', 'available', 'stock', 'updated_at']),
+}
+
+
+def ndjson_lines(records, fields):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    for record in records:
+        yield encoder.encode(record) + '\n'
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def csv_value(value):
+    if isinstance(value, list):
+        return ' '.join(str(item) for item in value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def csv_lines(records, fields):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for record in records:
+        yield writer.writerow([csv_value(record[field]) for field in fields])
+
+
+FORMATS = {
+    'ndjson': (ndjson_lines, NDJSONRenderer.media_type),
+    'csv': (csv_lines, CSVRenderer.media_type),
+}
+
+
+def buffered(lines, size=BUFFER_SIZE):
+    # fewer, larger writes than one per row
+    buffer, length = [], 0
+    for line in lines:
+        buffer.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def export_lines(name, export_format, since=None, chunk_size=CHUNK_SIZE):
+    records, fields = EXPORTS[name]
+    lines, _ = FORMATS[export_format]
+    return buffered(lines(records(since, chunk_size), fields))
+
+
+def export_response(name, export_format, since=None):
+    response = StreamingHttpResponse(
+        export_lines(name, export_format, since), content_type=f'{FORMATS[export_format][1]}; charset=utf-8'
+    )
+    response['Content-Disposition'] = f'attachment; filename="{name}.{export_format}"'
+    return response
@@ -0,0 +1,24 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+
+class FieldFilter(BaseFilterBackend):
+    # view.filter_fields maps query parameters, named after their ORM lookup
+    # (e.g. ?total_price__gte=100), to the form field that parses the value
+    def filter_queryset(self, request, queryset, view):
+        filters, errors = {}, {}
+        for param, field in getattr(view, 'filter_fields', {}).items():
+            value = request.query_params.get(param)
+            if value in (None, ''):
+                continue
+            try:
+                value = field.clean(value)
+            except DjangoValidationError as exc:
+                errors[param] = exc.messages
+                continue
+            if value is not None:
+                filters[param] = value
+        if errors:
+            raise ValidationError(errors)
+        return queryset.filter(**filters)
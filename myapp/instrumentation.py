@@ -0,0 +1,268 @@
+import bisect
+import heapq
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from operator import itemgetter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+
+class Histogram:
+    # Prometheus style histogram with one series per label set; counts are kept
+    # per bucket and only made cumulative when rendered
+    def __init__(self, name, help_text, buckets, labels):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.labels = labels
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def observe(self, label_values, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = {'buckets': [0] * (len(self.buckets) + 1), 'sum': 0, 'count': 0}
+            series['buckets'][index] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            series = {labels: {**data, 'buckets': list(data['buckets'])} for labels, data in self.series.items()}
+        for label_values, data in sorted(series.items()):
+            labels = ','.join(f'{name}="{escape(value)}"' for name, value in zip(self.labels, label_values))
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), data['buckets']):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{labels}}} {data["sum"]}')
+            lines.append(f'{self.name}_count{{{labels}}} {data["count"]}')
+        return lines
+
+    def reset(self):
+        with self.lock:
+            self.series = {}
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+LABELS = ('route', 'method')
+
+request_duration = Histogram(
+    'http_request_duration_seconds', 'Time from request to rendered response.', DURATION_BUCKETS, LABELS
+)
+request_db_duration = Histogram(
+    'http_request_db_duration_seconds', 'Time spent in SQL queries per request.', DURATION_BUCKETS, LABELS
+)
+request_queries = Histogram(
+    'http_request_db_queries', 'Number of SQL queries per request.', QUERY_BUCKETS, LABELS
+)
+HISTOGRAMS = (request_duration, request_db_duration, request_queries)
+
+
+# (name, type, help, value from psycopg_pool's get_stats())
+POOL_METRICS = (
+    ('db_pool_max_connections', 'gauge', 'Upper bound of the pool size.', lambda stats: stats['pool_max']),
+    ('db_pool_connections', 'gauge', 'Connections currently open in the pool.', lambda stats: stats['pool_size']),
+    ('db_pool_connections_in_use', 'gauge', 'Connections lent to requests.',
+     lambda stats: stats['pool_size'] - stats['pool_available']),
+    ('db_pool_saturation', 'gauge', 'Connections in use as a fraction of the maximum.',
+     lambda stats: (stats['pool_size'] - stats['pool_available']) / stats['pool_max']),
+    ('db_pool_requests_waiting', 'gauge', 'Requests currently waiting for a connection.',
+     lambda stats: stats.get('requests_waiting', 0)),
+    ('db_pool_requests_total', 'counter', 'Connections requested from the pool.',
+     lambda stats: stats.get('requests_num', 0)),
+    ('db_pool_requests_queued_total', 'counter', 'Requests that had to wait for a connection.',
+     lambda stats: stats.get('requests_queued', 0)),
+    ('db_pool_wait_seconds_total', 'counter', 'Time spent waiting for a connection.',
+     lambda stats: stats.get('requests_wait_ms', 0) / 1000),
+    ('db_pool_timeouts_total', 'counter', 'Requests that gave up waiting for a connection.',
+     lambda stats: stats.get('requests_errors', 0)),
+)
+
+
+def pool_stats():
+    # Django creates one psycopg pool per alias and process for OPTIONS['pool']
+    stats = {}
+    for connection in connections.all():
+        pool = getattr(connection, 'pool', None)
+        if pool is not None and not pool.closed:
+            stats[connection.alias] = pool.get_stats()
+    return stats
+
+
+def render_pool_metrics():
+    stats = pool_stats()
+    lines = []
+    if not stats:
+        return lines
+    for name, kind, help_text, value in POOL_METRICS:
+        lines.extend([f'# HELP {name} {help_text}', f'# TYPE {name} {kind}'])
+        for alias, alias_stats in sorted(stats.items()):
+            lines.append(f'{name}{{alias="{escape(alias)}"}} {value(alias_stats)}')
+    return lines
+
+
+def render_metrics():
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    lines.extend(render_pool_metrics())
+    return '\n'.join(lines) + '\n'
+
+
+def reset_metrics():
+    for histogram in HISTOGRAMS:
+        histogram.reset()
+
+
+class QueryRecorder:
+    # unlike CaptureQueriesContext this needs no debug cursor and keeps only
+    # the duration and SQL text
+    def __init__(self):
+        self.queries = []
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.duration += elapsed
+            self.queries.append((elapsed, sql))
+
+    def slowest(self, count):
+        return heapq.nlargest(count, self.queries, key=itemgetter(0))
+
+
+# the profile of the request being handled; being a ContextVar it also reaches the
+# threads that sync_to_async runs ORM calls in under ASGI
+current_profile = ContextVar('current_profile', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    profile = current_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    return profile.queries(execute, sql, params, many, context)
+
+
+def install_query_recorder(connection):
+    # connections are per thread, so the wrapper is added to each one once when it connects
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.queries = QueryRecorder()
+        self.started = time.perf_counter()
+        self.view_started = None
+        self.view_finished = None
+        self.finished = None
+
+    @property
+    def total(self):
+        return self.finished - self.started
+
+    @property
+    def view(self):
+        if self.view_started is None:
+            return 0.0
+        return (self.view_finished or self.finished) - self.view_started
+
+    @property
+    def serialize(self):
+        # DRF responses are rendered after the view returns
+        if self.view_finished is None:
+            return 0.0
+        return self.finished - self.view_finished
+
+
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    # unmatched paths share one series, so scanners cannot blow up the label set
+    return match.view_name if match else 'unmatched'
+
+
+class InstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profile = request._profile = RequestProfile()
+        token = current_profile.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        return self.finish(request, response, profile)
+
+    async def __acall__(self, request):
+        profile = request._profile = RequestProfile()
+        token = current_profile.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        return self.finish(request, response, profile)
+
+    def finish(self, request, response, profile):
+        profile.finished = time.perf_counter()
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={profile.queries.duration * 1000:.1f};desc="{len(profile.queries.queries)} queries"',
+            f'view;dur={profile.view * 1000:.1f}',
+            f'serialize;dur={profile.serialize * 1000:.1f}',
+            f'total;dur={profile.total * 1000:.1f}',
+        ])
+
+        labels = (route_name(request), request.method)
+        request_duration.observe(labels, profile.total)
+        request_db_duration.observe(labels, profile.queries.duration)
+        request_queries.observe(labels, len(profile.queries.queries))
+
+        if profile.total * 1000 >= settings.SLOW_REQUEST_MS:
+            self.log_slow_request(request, response, profile)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._profile.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        request._profile.view_finished = time.perf_counter()
+        return response
+
+    def log_slow_request(self, request, response, profile):
+        queries = profile.queries
+        slowest = ''.join(
+            f'\n  {duration * 1000:.1f} ms  {sql[:500]}'
+            for duration, sql in queries.slowest(settings.SLOW_REQUEST_LOGGED_QUERIES)
+        )
+        logger.warning(
+            'Slow request: %s %s %s in %.1f ms (view %.1f ms, serialize %.1f ms, db %.1f ms in %d queries)%s',
+            request.method, request.get_full_path(), response.status_code, profile.total * 1000,
+            profile.view * 1000, profile.serialize * 1000, queries.duration * 1000, len(queries.queries), slowest,
+        )
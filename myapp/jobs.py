@@ -0,0 +1,138 @@
+import inspect
+import logging
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# task name -> (function, queue, max_attempts, check); tasks are registered in myapp.tasks
+TASKS = {}
+
+
+def task(queue='default', max_attempts=3, check=None):
+    # a task runs in a transaction together with marking its job done, so a failed or
+    # abandoned attempt leaves nothing behind; it may still run more than once.
+    # check takes the task's arguments and raises ValueError for ones that would fail on
+    # every attempt, so they are refused when enqueued instead
+    def register(func):
+        TASKS[func.__name__] = (func, queue, max_attempts, check)
+        return func
+    return register
+
+
+def check_payload(name, payload):
+    if name not in TASKS:
+        raise ValueError(f'Unknown task: {name}.')
+    if not isinstance(payload, dict):
+        raise ValueError(f'Invalid payload for {name}: expected an object of arguments.')
+    func, _, _, check = TASKS[name]
+    try:
+        arguments = inspect.signature(func).bind(**payload)
+    except TypeError as exc:
+        raise ValueError(f'Invalid payload for {name}: {exc}.')
+    if check is not None:
+        try:
+            check(*arguments.args, **arguments.kwargs)
+        except ValueError as exc:
+            raise ValueError(f'Invalid payload for {name}: {exc}')
+
+
+def enqueue(name, payload=None, key=None, run_at=None):
+    # part of the caller's transaction, so a rolled back request leaves no job behind
+    payload = payload or {}
+    check_payload(name, payload)
+    _, queue, max_attempts, _ = TASKS[name]
+    job = Job(
+        queue=queue, task=name, payload=payload, key=key, max_attempts=max_attempts,
+        run_at=run_at or timezone.now(),
+    )
+    if key is None:
+        job.save()
+        return job
+    try:
+        with transaction.atomic():
+            job.save()
+    except IntegrityError:
+        return Job.objects.get(key=key)
+    return job
+
+
+def claimable(now):
+    # queued jobs that are due, and running ones whose worker let the lease run out
+    return Q(status=Job.QUEUED, run_at__lte=now) | Q(status=Job.RUNNING, locked_until__lte=now)
+
+
+def lock_queue(queue):
+    # until the end of the transaction, so claims of a queue take turns and the running count
+    # one of them reads cannot go up before its UPDATE
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', [f'myapp.jobs:{queue}'])
+    elif connection.vendor == 'sqlite':
+        # SQLite has a single write lock, taken by the first write of a transaction; an UPDATE
+        # of no rows takes it before the count, so claims wait for it rather than failing to
+        # write after reading a count another claim has changed
+        Job.objects.filter(queue=queue, pk__lt=0).update(queue=queue)
+
+
+def claim(queue, limit, worker):
+    # the lock is held for a couple of short statements only; workers polling other queues
+    # are not affected
+    with transaction.atomic():
+        lock_queue(queue)
+        now = timezone.now()
+        running = Job.objects.filter(queue=queue, status=Job.RUNNING, locked_until__gt=now).count()
+        limit = min(limit, settings.JOB_QUEUES.get(queue, 1) - running)
+        if limit <= 0:
+            return []
+        pks = list(
+            Job.objects.filter(claimable(now), queue=queue).order_by('run_at', 'id').values_list('pk', flat=True)[:limit]
+        )
+        if not pks:
+            return []
+        until = now + timedelta(seconds=settings.JOB_LEASE_SECONDS)
+        # still conditional, for backends lock_queue does not lock
+        Job.objects.filter(claimable(now), pk__in=pks).update(
+            status=Job.RUNNING, locked_by=worker, locked_until=until, attempts=F('attempts') + 1,
+        )
+    claimed = Job.objects.filter(pk__in=pks, status=Job.RUNNING, locked_by=worker, locked_until=until)
+    return list(claimed.order_by('run_at', 'id'))
+
+
+def execute(pk):
+    # returns the job's new status
+    job = Job.objects.get(pk=pk)
+    # only while this worker still holds the lease
+    claimed = Job.objects.filter(pk=pk, status=Job.RUNNING, locked_by=job.locked_by, locked_until=job.locked_until)
+    try:
+        if job.attempts > job.max_attempts:
+            raise RuntimeError('The lease ran out on every attempt.')
+        func = TASKS[job.task][0]
+        with transaction.atomic():
+            func(**job.payload)
+            if not claimed.update(status=Job.DONE, finished_at=timezone.now(), locked_until=None):
+                # taken over by another worker after the lease ran out
+                transaction.set_rollback(True)
+                return Job.RUNNING
+        return Job.DONE
+    except Exception:
+        logger.exception('Job %s (%s) failed on attempt %s', job.pk, job.task, job.attempts)
+        error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            # with jitter, so jobs that failed together (e.g. on a lock) are not retried together
+            delay = settings.JOB_RETRY_SECONDS * 2 ** (job.attempts - 1) * random.uniform(1, 1.5)
+            claimed.update(
+                status=Job.QUEUED, run_at=timezone.now() + timedelta(seconds=delay),
+                locked_until=None, last_error=error,
+            )
+            return Job.QUEUED
+        claimed.update(status=Job.FAILED, finished_at=timezone.now(), locked_until=None, last_error=error)
+        return Job.FAILED
@@ -0,0 +1,107 @@
+import json
+import re
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from myapp.models import Product, Customer, Order
+from myapp.search import filter_products
+from myapp.views import OrderViewSet
+
+PAGE = 50
+
+
+def standard_queries():
+    # the queries behind the API's list, detail, search and dashboard paths
+    week_ago = timezone.now() - timedelta(days=7)
+    orders = OrderViewSet.queryset
+    return [
+        ('product list', Product.objects.order_by('id')[:PAGE]),
+        ('product list, later cursor page', Product.objects.filter(id__gt=1000).order_by('id')[:PAGE]),
+        ('product detail', Product.objects.filter(pk=1)),
+        ('available products by name', Product.objects.filter(available=True).order_by('name')[:PAGE]),
+        ('products by name', Product.objects.order_by('name')[:PAGE]),
+        ('product search', filter_products(Product.objects.all(), ['rac']).order_by('id')[:PAGE]),
+        ('products by price range', Product.objects.filter(price__gte=10, price__lte=50).order_by('price', 'id')[:PAGE]),
+        ('customer list', Customer.objects.order_by('id')[:PAGE]),
+        ('customers by name prefix', Customer.objects.filter(name__istartswith='lan').order_by('name', 'id')[:PAGE]),
+        ('order list', orders.order_by('-date_created', '-id')[:PAGE]),
+        ('order detail', orders.filter(pk=1)),
+        ('orders of a customer', Order.objects.filter(customer_id=1).order_by('-date_created')[:PAGE]),
+        ('open orders by status', Order.objects.filter(status='New').order_by('-date_created')[:PAGE]),
+        ('orders by total', Order.objects.filter(total_price__gte=100).order_by('total_price')[:PAGE]),
+        ('unfulfillable orders', Order.objects.filter(is_fulfillable=False).order_by('date_created', 'id')[:PAGE]),
+        ('orders of the last week', Order.objects.filter(date_created__gte=week_ago).order_by('-date_created', '-id')[:PAGE]),
+    ]
+
+
+def postgresql_plan(plan):
+    scans, sorted_ = [], False
+    stack = [json.loads(plan)[0]['Plan']]
+    while stack:
+        node = stack.pop()
+        if node['Node Type'] == 'Seq Scan':
+            scans.append(node['Relation Name'])
+        sorted_ = sorted_ or node['Node Type'] in ('Sort', 'Incremental Sort')
+        stack.extend(node.get('Plans', []))
+    return scans, sorted_
+
+
+def sqlite_plan(plan):
+    # "SCAN myapp_order" is a full table scan, "SCAN myapp_order USING INDEX ..." is not
+    scans = re.findall(r'SCAN (\w+)(?! USING)(?:\s|$)', plan)
+    return scans, 'USE TEMP B-TREE' in plan
+
+
+def table_rows(table):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [table])
+        else:
+            cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}')
+        row = cursor.fetchone()
+    return max(row[0], 0) if row else 0
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the standard API queries and flag sequential scans on large tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-rows', type=int, default=10000, help='Only flag scans of tables at least this large.')
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every plan.')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'postgresql':
+            explain, parse_plan = {'format': 'json'}, postgresql_plan
+        else:
+            explain, parse_plan = {}, sqlite_plan
+        tables = set(connection.introspection.table_names())
+
+        rows = {}
+        flagged = 0
+        for label, queryset in standard_queries():
+            plan = queryset.explain(**explain)
+            if options['verbose_plans']:
+                self.stdout.write(f'-- {label}\n{plan}\n')
+            scans, sorted_ = parse_plan(plan)
+            if queryset.query.is_sliced and not queryset.query.where and not sorted_:
+                # an unfiltered scan already in the requested order stops after LIMIT rows
+                scans = []
+            large = []
+            for table in dict.fromkeys(scan for scan in scans if scan in tables):
+                if table not in rows:
+                    rows[table] = table_rows(table)
+                if rows[table] >= options['min_rows']:
+                    large.append(f'{table} (~{rows[table]} rows)')
+            if large:
+                flagged += 1
+                self.stdout.write(self.style.WARNING(f'SEQ SCAN  {label}: {", ".join(large)}'))
+            else:
+                self.stdout.write(f'ok        {label}')
+
+        if flagged:
+            self.stdout.write(self.style.WARNING(f'{flagged} queries scan large tables sequentially.'))
+        else:
+            self.stdout.write(self.style.SUCCESS('No sequential scans on large tables.'))
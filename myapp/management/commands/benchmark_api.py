@@ -0,0 +1,54 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.benchmarks import (
+    SCENARIOS, BenchmarkContext, compare, environment, load_results, run_scenario, save_results,
+)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the API endpoints: latency percentiles, throughput, queries per request and peak memory.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help='Repeat to run several; default all.')
+        parser.add_argument('--requests', type=int, default=200, help='Timed requests per scenario.')
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument('--cold-cache', action='store_true', help='Clear the API response cache before every request.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--products', type=int, help='Regenerate the dataset first (replaces all data).')
+        parser.add_argument('--customers', type=int)
+        parser.add_argument('--orders', type=int)
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+        parser.add_argument('--baseline', help='JSON results of an earlier run to compare against.')
+        parser.add_argument('--threshold', type=float, default=0.2, help='Allowed relative p95 increase over the baseline.')
+
+    def handle(self, *args, **options):
+        sizes = {name: options[name] for name in ('products', 'customers', 'orders') if options[name] is not None}
+        if sizes:
+            call_command('populate_sample_data', seed=options['seed'], stdout=self.stdout, **sizes)
+
+        with BenchmarkContext(seed=options['seed']) as ctx:
+            results = {'environment': environment(), 'scenarios': {}}
+            self.stdout.write(
+                f"{'scenario':<22}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}{'queries':>9}{'peak KiB':>10}"
+            )
+            for name in options['scenario'] or SCENARIOS:
+                result = run_scenario(
+                    ctx, name, options['requests'], warmup=options['warmup'], cold_cache=options['cold_cache']
+                )
+                results['scenarios'][name] = result
+                self.stdout.write(
+                    f"{name:<22}{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}{result['p99_ms']:>9.2f}"
+                    f"{result['throughput_rps']:>9.0f}{result['queries_per_request']:>9.1f}{result['peak_memory_kib']:>10.0f}"
+                    + (f"  ({result['errors']} errors)" if result['errors'] else '')
+                )
+
+        if options['output']:
+            save_results(results, options['output'])
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if options['baseline']:
+            regressions = compare(results, load_results(options['baseline']), options['threshold'])
+            if regressions:
+                raise CommandError('Performance regressions:\n  ' + '\n  '.join(regressions))
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
@@ -0,0 +1,102 @@
+import asyncio
+import time
+from contextlib import nullcontext
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+
+from myapp.benchmarks import BenchmarkContext, percentile, uncached
+
+# scenario: (sync viewset path, async view path, ids to pick details from)
+ENDPOINTS = {
+    'product_list': ('/api/products/', '/api/async/products/', None),
+    'product_detail': ('/api/products/{pk}/', '/api/async/products/{pk}/', 'product_ids'),
+    'order_list': ('/api/orders/', '/api/async/orders/', None),
+    'order_detail': ('/api/orders/{pk}/', '/api/async/orders/{pk}/', 'order_ids'),
+}
+
+
+class ASGIClient:
+    # drives the ASGI application in process, the way an ASGI server would
+    def __init__(self, host, token):
+        self.application = get_asgi_application()
+        self.headers = [(b'host', host.encode()), (b'authorization', f'Bearer {token}'.encode())]
+        self.host = host
+
+    async def get(self, path):
+        finished = asyncio.Event()
+        requested = False
+        status = None
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await finished.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            elif message['type'] == 'http.response.body' and not message.get('more_body'):
+                finished.set()
+
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+            'headers': self.headers, 'client': ('127.0.0.1', 50000), 'server': (self.host, 80),
+        }
+        await self.application(scope, receive, send)
+        return status
+
+
+class Command(BaseCommand):
+    help = 'Compare throughput of the sync viewsets and the async views under concurrent ASGI requests.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', choices=sorted(ENDPOINTS), help='Scenarios to run (default: all).')
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=50)
+        # only the sync viewsets cache their responses, so by default neither side does
+        parser.add_argument('--cached', action='store_true', help='Let the sync viewsets use the API response cache.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        with BenchmarkContext(seed=options['seed']) as ctx, nullcontext() if options['cached'] else uncached():
+            client = ASGIClient(ctx.host, ctx.access)
+            self.stdout.write(f'{"scenario":<16}{"view":<7}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"errors":>8}')
+            for name in options['scenario'] or ENDPOINTS:
+                sync_path, async_path, ids = ENDPOINTS[name]
+                for label, path in (('sync', sync_path), ('async', async_path)):
+                    paths = [path.format(pk=ctx.pick(getattr(ctx, ids))) if ids else path for _ in range(options['requests'])]
+                    result = asyncio.run(self.run_paths(client, paths, options))
+                    self.stdout.write(
+                        f'{name:<16}{label:<7}{result["throughput_rps"]:>10.0f}{result["p50_ms"]:>10.2f}'
+                        f'{result["p95_ms"]:>10.2f}{result["errors"]:>8}'
+                    )
+
+    async def run_paths(self, client, paths, options):
+        semaphore = asyncio.Semaphore(options['concurrency'])
+        latencies = []
+        errors = 0
+
+        async def request(path):
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                status = await client.get(path)
+                latencies.append(time.perf_counter() - started)
+                errors += status >= 400
+
+        started = time.perf_counter()
+        await asyncio.gather(*(request(path) for path in paths))
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+        return {
+            'throughput_rps': len(paths) / elapsed if elapsed else 0.0,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'errors': errors,
+        }
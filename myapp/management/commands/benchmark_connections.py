@@ -0,0 +1,98 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from myapp.benchmarks import percentile
+from myapp.models import Product
+
+MODES = ('none', 'persistent', 'pool')
+
+
+def mode_settings(mode, pool_size):
+    # a copy of the default database under another alias, so every mode gets fresh connections
+    database = {**connections['default'].settings_dict, 'OPTIONS': dict(connections['default'].settings_dict['OPTIONS'])}
+    database['OPTIONS'].pop('pool', None)
+    database['CONN_MAX_AGE'] = 0
+    if mode == 'persistent':
+        database['CONN_MAX_AGE'] = None
+    elif mode == 'pool':
+        database['OPTIONS']['pool'] = {**settings.DB_POOL_OPTIONS, 'min_size': pool_size, 'max_size': pool_size}
+    return database
+
+
+class Command(BaseCommand):
+    help = 'Compare request throughput without persistent connections, with them and with a connection pool.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', action='append', choices=MODES, help='Modes to run (default: all).')
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent workers, like WSGI threads.')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per worker.')
+        parser.add_argument('--pool-size', type=int, default=settings.DB_POOL_OPTIONS['max_size'])
+
+    def handle(self, *args, **options):
+        modes = options['mode'] or MODES
+        if 'pool' in modes and connections['default'].vendor != 'postgresql':
+            if options['mode']:
+                raise CommandError('Connection pooling needs PostgreSQL with psycopg 3.')
+            modes = [mode for mode in modes if mode != 'pool']
+
+        self.stdout.write(f'{"mode":<12}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"pool wait ms":>14}')
+        for mode in modes:
+            result = self.run_mode(mode, options)
+            wait = f'{result["pool_wait_ms"]:.0f}' if mode == 'pool' else '-'
+            self.stdout.write(
+                f'{mode:<12}{result["throughput_rps"]:>10.0f}{result["p50_ms"]:>10.2f}'
+                f'{result["p95_ms"]:>10.2f}{wait:>14}'
+            )
+
+    def run_mode(self, mode, options):
+        alias = f'benchmark_{mode}'
+        connections.settings[alias] = mode_settings(mode, options['pool_size'])
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+
+        def worker():
+            connection = connections[alias]
+            timings = []
+            try:
+                for _ in range(options['requests']):
+                    started = time.perf_counter()
+                    list(Product.objects.using(alias).order_by('id')[:50])
+                    # what Django does on request_finished: close, keep or return to the pool
+                    connection.close_if_unusable_or_obsolete()
+                    timings.append(time.perf_counter() - started)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+            with lock:
+                latencies.extend(timings)
+
+        threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        pool_wait_ms = 0
+        if mode == 'pool':
+            pool_wait_ms = connections[alias].pool.get_stats().get('requests_wait_ms', 0)
+            connections[alias].close_pool()
+            del connections[alias]
+        del connections.settings[alias]
+        if errors:
+            raise CommandError(f'{len(errors)} of {len(threads)} workers failed in mode {mode}: {errors[0]}')
+
+        latencies.sort()
+        return {
+            'throughput_rps': len(latencies) / elapsed if elapsed else 0.0,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'pool_wait_ms': pool_wait_ms,
+        }
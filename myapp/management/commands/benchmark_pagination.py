@@ -0,0 +1,76 @@
+import time
+from urllib.parse import parse_qs, urlparse
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from myapp.benchmarks import BenchmarkContext, uncached
+from myapp.views import ProductViewSet, CustomerViewSet, OrderViewSet
+
+VIEWSETS = {
+    'products': ProductViewSet,
+    'customers': CustomerViewSet,
+    'orders': OrderViewSet,
+}
+
+
+class Command(BaseCommand):
+    help = 'Compare the unpaginated list endpoints with cursor pagination (first and deep page).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoint', choices=VIEWSETS.keys(), action='append')
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--depth', type=int, default=20, help='Number of pages to walk before timing the deep page.')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        # without rate limits, and without the response cache the list views would answer
+        # the repeated requests from
+        with BenchmarkContext() as ctx, uncached():
+            self.benchmark(ctx, options)
+
+    def benchmark(self, ctx, options):
+        factory = APIRequestFactory(SERVER_NAME=ctx.host)
+
+        for name in options['endpoint'] or VIEWSETS.keys():
+            viewset = VIEWSETS[name]
+            unpaginated = viewset.as_view({'get': 'list'}, pagination_class=None)
+            paginated = viewset.as_view({'get': 'list'})
+
+            def call(view, params):
+                request = factory.get(f'/api/{name}/', params)
+                force_authenticate(request, user=ctx.user)
+                response = view(request)
+                response.render()
+                return response
+
+            first_params = {'page_size': options['page_size']}
+            deep_params = dict(first_params)
+            for _ in range(options['depth']):
+                response = call(paginated, deep_params)
+                if response.status_code != 200:
+                    raise CommandError(f'/api/{name}/ answered {response.status_code}: {response.data}')
+                next_url = response.data['next']
+                if not next_url:
+                    break
+                deep_params['cursor'] = parse_qs(urlparse(next_url).query)['cursor'][0]
+
+            self.stdout.write(f'/api/{name}/')
+            for label, view, params in (
+                ('unpaginated', unpaginated, {}),
+                ('first page', paginated, first_params),
+                ('deep page', paginated, deep_params),
+            ):
+                timings = []
+                for _ in range(options['repeat']):
+                    with CaptureQueriesContext(connection) as queries:
+                        start = time.perf_counter()
+                        response = call(view, params)
+                        timings.append(time.perf_counter() - start)
+                timings.sort()
+                self.stdout.write(
+                    f'  {label:<12} median {timings[len(timings) // 2] * 1000:9.2f} ms'
+                    f'  {len(response.content):>12} bytes  {len(queries)} queries'
+                )
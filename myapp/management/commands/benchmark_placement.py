@@ -0,0 +1,131 @@
+import random
+import threading
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Count
+
+from myapp.benchmarks import percentile
+from myapp.models import Product, Customer, Order
+from myapp.placement import OutOfStock, place_order
+
+
+def check_then_write(customer, product_ids):
+    # what placing an order without a reservation amounts to: the availability is read,
+    # checked and written back by separate statements, so concurrent buyers see the same stock
+    with transaction.atomic():
+        products = list(Product.objects.filter(pk__in=product_ids))
+        if any(not product.available or product.stock == 0 for product in products):
+            raise OutOfStock(product_ids)
+        for product in products:
+            Product.objects.filter(pk=product.pk).update(stock=product.stock - 1)
+        order = Order.objects.create(customer=customer, status='New')
+        order.products.add(*product_ids)
+    return order
+
+
+MODES = {'reserve': place_order, 'check-then-write': check_then_write}
+
+
+class Command(BaseCommand):
+    help = 'Place orders for a few scarce products from parallel buyers and check that none is oversold.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', action='append', choices=sorted(MODES), help='Modes to run (default: reserve).')
+        parser.add_argument('--buyers', type=int, default=16, help='Concurrent buyers, each with its own connection.')
+        parser.add_argument('--orders', type=int, default=25, help='Orders each buyer tries to place.')
+        parser.add_argument('--products', type=int, default=3, help='Scarce products the buyers compete for.')
+        parser.add_argument('--stock', type=int, default=100, help='Initial stock of every scarce product.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        for name in ('buyers', 'orders', 'products', 'stock'):
+            if options[name] < 1:
+                raise CommandError(f'--{name} must be positive.')
+        self.stdout.write(
+            f'{options["buyers"]} buyers x {options["orders"]} orders for {options["products"]} products '
+            f'with a stock of {options["stock"]} each'
+        )
+        self.stdout.write(
+            f'{"mode":<18}{"orders/s":>10}{"placed":>8}{"rejected":>10}{"errors":>8}'
+            f'{"p50 ms":>9}{"p95 ms":>9}{"oversold":>10}'
+        )
+        oversold = {}
+        for mode in options['mode'] or ['reserve']:
+            result = self.run_mode(mode, options)
+            oversold[mode] = result['oversold']
+            self.stdout.write(
+                f'{mode:<18}{result["throughput"]:>10.0f}{result["placed"]:>8}{result["rejected"]:>10}'
+                f'{result["errors"]:>8}{result["p50_ms"]:>9.2f}{result["p95_ms"]:>9.2f}{result["oversold"]:>10}'
+            )
+        if oversold.get('reserve'):
+            raise CommandError(f'{oversold["reserve"]} units were oversold with reservations.')
+
+    def run_mode(self, mode, options):
+        place = MODES[mode]
+        customer = Customer.objects.create(name='Benchmark Buyer', address='Placement benchmark')
+        products = [
+            Product.objects.create(name=f'Scarce product {i}', price=Decimal('10.00'), stock=options['stock'])
+            for i in range(options['products'])
+        ]
+        product_ids = [product.pk for product in products]
+        latencies = []
+        counts = {'placed': 0, 'rejected': 0, 'errors': 0}
+        lock = threading.Lock()
+
+        def buyer(index):
+            rng = random.Random(f'{options["seed"]}:{index}')
+            timings = []
+            outcomes = {'placed': 0, 'rejected': 0, 'errors': 0}
+            try:
+                for _ in range(options['orders']):
+                    wanted = rng.sample(product_ids, rng.randint(1, len(product_ids)))
+                    started = time.perf_counter()
+                    try:
+                        place(customer, wanted)
+                        outcomes['placed'] += 1
+                    except OutOfStock:
+                        outcomes['rejected'] += 1
+                    except DatabaseError:
+                        # e.g. a lock timeout or a deadlock
+                        outcomes['errors'] += 1
+                    timings.append(time.perf_counter() - started)
+            finally:
+                connection.close()
+            with lock:
+                latencies.extend(timings)
+                for key, value in outcomes.items():
+                    counts[key] += value
+
+        threads = [threading.Thread(target=buyer, args=(index,)) for index in range(options['buyers'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        # units sold beyond the initial stock, counted from the orders whatever the stock column says
+        sold = dict(
+            Order.products.through.objects.filter(product_id__in=product_ids, order__customer=customer)
+            .values_list('product_id').annotate(count=Count('id')).order_by()
+        )
+        oversold = 0
+        for pk, stock in Product.objects.filter(pk__in=product_ids).values_list('pk', 'stock'):
+            oversold += max(0, sold.get(pk, 0) - options['stock'])
+            if mode == 'reserve' and stock != options['stock'] - sold.get(pk, 0):
+                raise CommandError(f'The stock of product {pk} does not match its orders.')
+
+        Order.objects.filter(customer=customer).delete()
+        Product.objects.filter(pk__in=product_ids).delete()
+        customer.delete()
+        latencies.sort()
+        return {
+            **counts,
+            'throughput': len(latencies) / elapsed if elapsed else 0.0,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'oversold': oversold,
+        }
@@ -0,0 +1,63 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from myapp.models import Product, Order
+from myapp.rendering import FastJSONRenderer, values_data
+from myapp.serializers import ProductSerializer, OrderSerializer
+
+SCENARIOS = {
+    'products': (Product, ProductSerializer),
+    'orders': (Order, OrderSerializer),
+}
+
+
+def serializer_path(model, serializer_class, rows):
+    # the queryset the viewsets use: products prefetched as ids
+    queryset = serializer_class.restrict_queryset(model.objects.order_by('id'), None)
+    return JSONRenderer().render(serializer_class(queryset[:rows], many=True).data)
+
+
+def values_path(model, serializer_class, rows):
+    return FastJSONRenderer().render(values_data(model.objects.order_by('id')[:rows], serializer_class()))
+
+
+PATHS = {'serializer': serializer_path, 'values': values_path}
+
+
+class Command(BaseCommand):
+    help = 'Compare rows/s and allocations of the serializer and values() list paths (query, representation and JSON).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', choices=sorted(SCENARIOS), action='append')
+        parser.add_argument('--rows', type=int, default=5000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        for name in options['scenario'] or sorted(SCENARIOS):
+            model, serializer_class = SCENARIOS[name]
+            outputs = {path: run(model, serializer_class, options['rows']) for path, run in PATHS.items()}
+            if outputs['serializer'] != outputs['values']:
+                raise CommandError(f'{name}: the values() path renders different JSON.')
+            rows = model.objects.order_by('id')[:options['rows']].count()
+            self.stdout.write(f'{name}: {rows} rows, {len(outputs["values"]):,} bytes, identical output')
+            results = {}
+            for path, run in PATHS.items():
+                timings = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    run(model, serializer_class, options['rows'])
+                    timings.append(time.perf_counter() - started)
+                # the most memory allocated at once while building and rendering the list
+                tracemalloc.start()
+                run(model, serializer_class, options['rows'])
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                results[path] = best = min(timings)
+                self.stdout.write(
+                    f'  {path:<10} {rows / best if best else 0:>10,.0f} rows/s  {peak / 2 ** 20:6.1f} MiB allocated at peak'
+                )
+            if results['values']:
+                self.stdout.write(f'  speedup    {results["serializer"] / results["values"]:.1f}x')
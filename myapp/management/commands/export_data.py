@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.export import CHUNK_SIZE, EXPORTS, FORMATS, export_lines, parse_since
+
+
+class Command(BaseCommand):
+    help = 'Stream orders or products to a file (or stdout) as NDJSON or CSV with constant memory.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(EXPORTS))
+        parser.add_argument('--format', dest='export_format', choices=sorted(FORMATS), default='ndjson')
+        parser.add_argument('--since', help='Only rows created (orders) or updated (products) at or after this date.')
+        parser.add_argument('--output', help='File to write; stdout by default.')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            since = parse_since(options['since'])
+        except ValueError:
+            raise CommandError('--since must be an ISO 8601 date or datetime.')
+
+        lines = export_lines(options['name'], options['export_format'], since, options['chunk_size'])
+        started = time.perf_counter()
+        if options['output']:
+            size = 0
+            with open(options['output'], 'w', newline='', encoding='utf-8') as f:
+                for chunk in lines:
+                    f.write(chunk)
+                    size += len(chunk)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'Wrote {size / 1024 / 1024:.1f} MiB to {options["output"]} in {elapsed:.1f}s')
+        else:
+            for chunk in lines:
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,213 @@
+import csv
+import json
+import os
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+
+from myapp.cache import invalidate
+from myapp.export import parse_since
+from myapp.management.commands.populate_sample_data import batched, explicit_timestamps
+from myapp.models import Product, Customer, Order
+from myapp.summaries import tracked
+
+OrderProduct = Order.products.through
+
+MODELS = {'products': Product, 'customers': Customer, 'orders': Order}
+# fields written on conflict, i.e. when a row with the same id already exists
+UPDATE_FIELDS = {
+    Product: ['name', 'price', 'available', 'stock', 'updated_at'],
+    Customer: ['name', 'address', 'updated_at'],
+    Order: ['customer', 'status', 'date_created', 'updated_at'],
+}
+
+
+class KeyMap:
+    # ids of the customers and products that exist or were imported in this run,
+    # so order rows are checked without a query per row
+    def __init__(self):
+        self.keys = {}
+
+    def get(self, model):
+        if model not in self.keys:
+            self.keys[model] = set(model.objects.values_list('id', flat=True).iterator(chunk_size=10000))
+        return self.keys[model]
+
+    def add(self, model, ids):
+        if model in self.keys:
+            self.keys[model].update(ids)
+
+
+def read_records(path, file_format):
+    with open(path, newline='', encoding='utf-8') as f:
+        if file_format == 'csv':
+            yield from csv.DictReader(f)
+            return
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            # malformed lines are passed on and rejected like any other invalid row
+            yield record if isinstance(record, dict) else {'_raw': line.rstrip('\n')}
+
+
+def required_id(record, field):
+    value = record.get(field)
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValidationError({field: ['A whole number is required.']})
+
+
+def id_list(value):
+    # CSV exports join the ids with spaces, NDJSON keeps a list
+    if isinstance(value, str):
+        value = value.split()
+    try:
+        return list(dict.fromkeys(int(item) for item in value or []))
+    except (TypeError, ValueError):
+        raise ValidationError({'products': ['A list of product ids is required.']})
+
+
+def build(model, record, keys, now):
+    # the model's own field validation and clean(), i.e. Product.validate_positive_price
+    # and the status check in Order.clean
+    if '_raw' in record:
+        raise ValidationError({'__all__': ['The line is not a JSON object.']})
+    pk = required_id(record, 'id')
+    product_ids = None
+    if model is Product:
+        obj = Product(
+            id=pk, name=record.get('name'), price=record.get('price'), available=record.get('available', True),
+            # an empty CSV cell is an untracked stock
+            stock=None if record.get('stock') == '' else record.get('stock'),
+        )
+    elif model is Customer:
+        obj = Customer(id=pk, name=record.get('name'), address=record.get('address'))
+    else:
+        customer_id = required_id(record, 'customer_id')
+        if customer_id not in keys.get(Customer):
+            raise ValidationError({'customer_id': [f'Customer {customer_id} does not exist.']})
+        product_ids = id_list(record.get('products'))
+        missing = [product_id for product_id in product_ids if product_id not in keys.get(Product)]
+        if missing:
+            raise ValidationError({'products': [f'Products {missing} do not exist.']})
+        try:
+            date_created = parse_since(record.get('date_created')) or now
+        except ValueError:
+            raise ValidationError({'date_created': ['An ISO 8601 date or datetime is required.']})
+        obj = Order(id=pk, customer_id=customer_id, status=record.get('status'), date_created=date_created)
+    obj.updated_at = now
+    # clean() compares converted values, so it only runs once the fields are valid
+    obj.clean_fields(exclude=['customer'])
+    obj.clean()
+    return obj, product_ids
+
+
+class Command(BaseCommand):
+    help = 'Upsert products, customers or orders from a CSV or NDJSON file in batches, resuming after failures.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(MODELS))
+        parser.add_argument('path')
+        parser.add_argument('--format', dest='file_format', choices=['csv', 'ndjson'],
+                            help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--checkpoint', help='Defaults to PATH.checkpoint.')
+        parser.add_argument('--rejects', help='Rejected rows, one JSON object per line; defaults to PATH.rejects.ndjson.')
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint.')
+
+    def handle(self, *args, **options):
+        model = MODELS[options['name']]
+        path = os.path.abspath(options['path'])
+        if not os.path.exists(path):
+            raise CommandError(f'{path} does not exist.')
+        file_format = options['file_format'] or ('csv' if path.endswith('.csv') else 'ndjson')
+        checkpoint_path = options['checkpoint'] or f'{path}.checkpoint'
+        rejects_path = options['rejects'] or f'{path}.rejects.ndjson'
+
+        done = 0 if options['restart'] else self.read_checkpoint(checkpoint_path, path, options['name'])
+        if done:
+            self.stdout.write(f'Resuming after record {done}.')
+
+        keys = KeyMap()
+        imported = rejected = 0
+        started = time.perf_counter()
+        records = enumerate(read_records(path, file_format), 1)
+        with open(rejects_path, 'a' if done else 'w', encoding='utf-8') as rejects:
+            for batch in batched((item for item in records if item[0] > done), options['batch_size']):
+                now = timezone.now()
+                # by id, so a row repeated within the batch is written once, as its last version;
+                # PostgreSQL refuses to update a row twice in one INSERT ... ON CONFLICT
+                valid = {}
+                for number, record in batch:
+                    try:
+                        obj, product_ids = build(model, record, keys, now)
+                        valid[obj.id] = (obj, product_ids)
+                    except ValidationError as e:
+                        rejected += 1
+                        errors = e.message_dict if hasattr(e, 'error_dict') else {'__all__': e.messages}
+                        rejects.write(json.dumps({'record': number, 'errors': errors, 'row': record}, default=str) + '\n')
+                with transaction.atomic():
+                    self.write(model, list(valid.values()))
+                rejects.flush()
+                imported += len(valid)
+                done = batch[-1][0]
+                self.write_checkpoint(checkpoint_path, path, options['name'], done)
+                keys.add(model, list(valid))
+                invalidate(model)
+
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [model]):
+                cursor.execute(sql)
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+        elapsed = time.perf_counter() - started
+        rate = (imported + rejected) / elapsed if elapsed else 0
+        self.stdout.write(
+            f'{imported} {options["name"]} imported, {rejected} rejected in {elapsed:.1f}s ({rate:,.0f} rows/s)'
+        )
+        if rejected:
+            self.stdout.write(self.style.WARNING(f'Rejected rows were written to {rejects_path}'))
+
+    def write(self, model, valid):
+        objs = [obj for obj, _ in valid]
+        with tracked(model, [obj.id for obj in objs]):
+            with explicit_timestamps(model):
+                model.objects.bulk_create(
+                    objs, update_conflicts=True, unique_fields=['id'], update_fields=UPDATE_FIELDS[model]
+                )
+            if model is Order:
+                # the imported product list replaces what an existing order had
+                OrderProduct.objects.filter(order_id__in=[obj.id for obj in objs]).delete()
+                OrderProduct.objects.bulk_create([
+                    OrderProduct(order_id=obj.id, product_id=product_id)
+                    for obj, product_ids in valid for product_id in product_ids
+                ])
+                Order.objects.filter(pk__in=[obj.id for obj in objs]).refresh_totals()
+            elif model is Product:
+                # prices and availability are part of the stored totals of existing orders
+                Order.objects.filter(products__in=[obj.id for obj in objs]).refresh_totals_in_batches()
+
+    def read_checkpoint(self, checkpoint_path, path, name):
+        if not os.path.exists(checkpoint_path):
+            return 0
+        with open(checkpoint_path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('path') != path or checkpoint.get('name') != name:
+            raise CommandError(f'{checkpoint_path} belongs to another import; use --restart to ignore it.')
+        return checkpoint['records']
+
+    def write_checkpoint(self, checkpoint_path, path, name, records):
+        # written only after the batch committed, and replaced atomically
+        with open(f'{checkpoint_path}.tmp', 'w') as f:
+            json.dump({'path': path, 'name': name, 'records': records}, f)
+        os.replace(f'{checkpoint_path}.tmp', checkpoint_path)
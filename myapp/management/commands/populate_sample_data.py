@@ -1,12 +1,215 @@
-from django.core.management.base import BaseCommand
-from myapp.models import Product, Customer, Order
+import csv
+import io
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+from myapp.cache import invalidate
+from myapp.models import Product, Customer, Order, OrderStatusChange, DailyRevenue, StatusCount, ProductSales
+from myapp.summaries import rebuild as rebuild_summaries
+
+ADJECTIVES = ['Racing', 'Carbon', 'Classic', 'Pro', 'Lightweight', 'Team', 'Vintage', 'Aero']
+NOUNS = ['Gloves', 'Suit', 'Helmet', 'Boots', 'Cap', 'Jacket', 'Visor', 'Steering Wheel']
+FIRST_NAMES = ['Lando', 'Carlos', 'Lewis', 'Max', 'Charles', 'George', 'Oscar', 'Fernando']
+LAST_NAMES = ['Norris', 'Sainz', 'Hamilton', 'Verstappen', 'Leclerc', 'Russell', 'Piastri', 'Alonso']
+STATUS_WEIGHTS = {'New': 5, 'In Process': 10, 'Sent': 15, 'Completed': 70}
+
+OrderProduct = Order.products.through
+
+
+@contextmanager
+def explicit_timestamps(model):
+    # let bulk_create keep generated date_created/updated_at values instead of now()
+    fields = [
+        field for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def clear_tables():
+    # children before the tables they reference, for the DELETEs
+    models = (OrderStatusChange, OrderProduct, ProductSales, Order, Customer, Product, DailyRevenue, StatusCount)
+    tables = [model._meta.db_table for model in models]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'TRUNCATE {", ".join(tables)} RESTART IDENTITY CASCADE')
+        else:
+            for table in tables:
+                cursor.execute(f'DELETE FROM {connection.ops.quote_name(table)}')
+
+
+class Generator:
+    # rows are plain tuples in column order and are produced lazily, so memory
+    # stays constant whatever the requested size; ids are assigned from 1 so
+    # orders can reference products and customers without keeping their ids
+    def __init__(self, options):
+        self.seed = options['seed']
+        self.products = options['products']
+        self.customers = options['customers']
+        self.orders = options['orders']
+        self.products_per_order = min(options['products_per_order'], self.products)
+        self.end = timezone.now()
+        self.start = self.end - timedelta(days=options['days'])
+        self.links_rng = self.random('order products')
+
+    def random(self, stream):
+        # one stream per table, so the data does not depend on the batch size
+        return random.Random(f'{self.seed}:{stream}')
+
+    def product_rows(self):
+        rng = self.random('products')
+        for pk in range(1, self.products + 1):
+            name = f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {pk}'
+            price = Decimal(rng.randint(100, 50000)) / 100
+            yield (pk, name, price, rng.random() < 0.9, None, self.end)
+
+    def customer_rows(self):
+        rng = self.random('customers')
+        for pk in range(1, self.customers + 1):
+            name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+            yield (pk, name, f'{rng.randint(1, 999)} Pit Lane, Paddock {pk}', self.end)
+
+    def order_rows(self):
+        rng = self.random('orders')
+        statuses = list(STATUS_WEIGHTS)
+        weights = list(STATUS_WEIGHTS.values())
+        span = self.end - self.start
+        for pk in range(1, self.orders + 1):
+            created = self.start + span * (pk / self.orders)
+            status = rng.choices(statuses, weights)[0]
+            # the stored totals are computed once the batch's order products are written
+            yield (pk, rng.randint(1, self.customers), status, created, created, Decimal('0.00'), 0, True)
+
+    def order_product_rows(self, order_ids):
+        population = range(1, self.products + 1)
+        for order_id in order_ids:
+            for product_id in self.links_rng.sample(population, self.products_per_order):
+                yield (order_id, product_id)
+
 
 class Command(BaseCommand):
+    help = 'Replace all data with sample data; with size options, generate a synthetic dataset for load tests.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int)
+        parser.add_argument('--customers', type=int)
+        parser.add_argument('--orders', type=int)
+        parser.add_argument('--products-per-order', type=int, default=3)
+        parser.add_argument('--days', type=int, default=365, help='Spread order dates over this many days.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--no-copy', action='store_true', help='Use bulk_create even on PostgreSQL.')
 
     def handle(self, *args, **kwargs):
-        Product.objects.all().delete()
-        Customer.objects.all().delete()
-        Order.objects.all().delete()
+        if any(kwargs[name] is not None for name in ('products', 'customers', 'orders')):
+            self.generate(kwargs)
+        else:
+            self.create_sample_data()
+        # the tables were cleared and filled without model signals
+        rebuild_summaries()
+        for model in (Product, Customer, Order):
+            invalidate(model)
+
+    def generate(self, options):
+        for name, default in (('products', 1000), ('customers', 1000), ('orders', 10000)):
+            if options[name] is None:
+                options[name] = default
+            if options[name] < 0:
+                raise CommandError(f'--{name} must not be negative.')
+        if options['orders'] and not (options['products'] and options['customers']):
+            raise CommandError('Orders need at least one product and one customer.')
+
+        clear_tables()
+        generator = Generator(options)
+        use_copy = connection.vendor == 'postgresql' and not options['no_copy']
+        write = self.copy_batch if use_copy else self.bulk_create_batch
+        size = options['batch_size']
+
+        total_rows = 0
+        started = time.perf_counter()
+        for label, model, rows in (
+            ('products', Product, generator.product_rows()),
+            ('customers', Customer, generator.customer_rows()),
+            ('orders and order products', Order, generator.order_rows()),
+        ):
+            count = 0
+            model_started = time.perf_counter()
+            for batch in batched(rows, size):
+                with transaction.atomic():
+                    write(model, batch)
+                    if model is Order:
+                        links = list(generator.order_product_rows(row[0] for row in batch))
+                        write(OrderProduct, links)
+                        Order.objects.filter(pk__range=(batch[0][0], batch[-1][0])).refresh_totals()
+                        count += len(links)
+                count += len(batch)
+            self.report(label, count, model_started)
+            total_rows += count
+
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [Product, Customer, Order, OrderProduct]):
+                cursor.execute(sql)
+            if connection.vendor == 'postgresql':
+                cursor.execute('ANALYZE')
+        self.report('rows in total', total_rows, started)
+
+    def report(self, label, count, started):
+        elapsed = time.perf_counter() - started
+        rate = count / elapsed if elapsed else 0
+        self.stdout.write(f'{count} {label} in {elapsed:.1f}s ({rate:,.0f} rows/s)')
+
+    def bulk_create_batch(self, model, batch):
+        if model is OrderProduct:
+            objs = [OrderProduct(order_id=order_id, product_id=product_id) for order_id, product_id in batch]
+        else:
+            columns = [field.attname for field in model._meta.concrete_fields]
+            objs = [model(**dict(zip(columns, row))) for row in batch]
+        with explicit_timestamps(model):
+            model.objects.bulk_create(objs)
+
+    def copy_batch(self, model, batch):
+        if model is OrderProduct:
+            columns = ['order_id', 'product_id']
+        else:
+            columns = [field.column for field in model._meta.concrete_fields]
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(batch)
+        sql = f'COPY {model._meta.db_table} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)'
+        with connection.cursor() as cursor:
+            if hasattr(cursor.cursor, 'copy_expert'):
+                buffer.seek(0)
+                cursor.cursor.copy_expert(sql, buffer)
+            else:
+                with cursor.cursor.copy(sql) as copy:
+                    copy.write(buffer.getvalue())
+
+    def create_sample_data(self):
+        clear_tables()
 
         # products
         product1 = Product.objects.create(
@@ -58,4 +261,4 @@ class Command(BaseCommand):
         )
         order3.products.add(product1, product3)
 
-        self.stdout.write("Data created successfully.")
\ No newline at end of file
+        self.stdout.write("Data created successfully.")
@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from myapp.summaries import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute the dashboard summary tables (daily revenue, orders per status, units per product) from all orders.'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        delta = rebuild()
+        self.stdout.write(
+            f'Summarized {len(delta.day_orders)} days, {len(delta.statuses)} statuses and '
+            f'{len(delta.units)} products in {time.perf_counter() - started:.1f}s'
+        )
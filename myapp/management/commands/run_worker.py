@@ -0,0 +1,100 @@
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+
+from myapp import jobs
+
+
+def run(pk):
+    # in a pool thread or process; closing connections is what request_finished does for a request
+    try:
+        return jobs.execute(pk)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = 'Run queued jobs in a thread or process pool, at most JOB_QUEUES[queue] of a queue at a time.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queue', action='append', help='Queues to work on (default: all in JOB_QUEUES).')
+        parser.add_argument('--pool', choices=['thread', 'process'], default='thread')
+        parser.add_argument('--workers', type=int, help='Pool size (default: the sum of the queue limits).')
+        parser.add_argument('--poll', type=float, default=1.0, help='Seconds between polls of idle queues.')
+        parser.add_argument('--burst', action='store_true', help='Exit once the queues are empty.')
+
+    def handle(self, *args, **options):
+        queues = options['queue'] or list(settings.JOB_QUEUES)
+        unknown = [queue for queue in queues if queue not in settings.JOB_QUEUES]
+        if unknown:
+            raise CommandError(f'Unknown queues: {", ".join(unknown)}.')
+        size = options['workers'] or sum(settings.JOB_QUEUES[queue] for queue in queues)
+        if size < 1:
+            raise CommandError('--workers must be positive.')
+        worker = f'{socket.gethostname()}:{os.getpid()}'
+
+        if options['pool'] == 'process':
+            # fresh interpreters rather than forks sharing this process' database connections
+            connections.close_all()
+            executor = ProcessPoolExecutor(size, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup)
+        else:
+            executor = ThreadPoolExecutor(size, thread_name_prefix='job')
+
+        self.stdout.write(f'Worker {worker}: {size} {options["pool"]}s on {", ".join(queues)}')
+        # Ctrl-C or SIGTERM stops claiming jobs; the ones already claimed are finished first
+        stopping = threading.Event()
+        handlers = {
+            signum: signal.signal(signum, lambda *args: stopping.set()) for signum in (signal.SIGINT, signal.SIGTERM)
+        }
+        try:
+            self.work(executor, queues, size, worker, stopping, options)
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+
+    def work(self, executor, queues, size, worker, stopping, options):
+        running = {}
+        outcomes = Counter()
+        with executor:
+            while not stopping.is_set():
+                claimed = 0
+                for queue in queues:
+                    in_flight = sum(1 for running_queue, _ in running.values() if running_queue == queue)
+                    free = min(size - len(running), settings.JOB_QUEUES[queue] - in_flight)
+                    if free <= 0:
+                        continue
+                    for job in jobs.claim(queue, free, worker):
+                        running[executor.submit(run, job.pk)] = (queue, job.pk)
+                        claimed += 1
+                if not running and not claimed:
+                    if options['burst']:
+                        break
+                    stopping.wait(options['poll'])
+                    continue
+                done, _ = wait(running, timeout=options['poll'], return_when=FIRST_COMPLETED)
+                for future in done:
+                    self.record(future, *running.pop(future), outcomes)
+            # the jobs already handed to the pool are finished before exiting
+            for future, (queue, pk) in running.items():
+                self.record(future, queue, pk, outcomes)
+        self.stdout.write(', '.join(f'{count} {status}' for status, count in sorted(outcomes.items())) or 'No jobs run.')
+
+    def record(self, future, queue, pk, outcomes):
+        try:
+            status = future.result()
+        except Exception as exc:
+            # e.g. the database went away; the job is run again once its lease runs out
+            status = 'lost'
+            self.stderr.write(f'{queue}: job {pk} lost: {exc}')
+        else:
+            self.stdout.write(f'{queue}: job {pk} {status}')
+        outcomes[status] += 1
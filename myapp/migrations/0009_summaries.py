@@ -0,0 +1,80 @@
+# Generated by Django 5.1.2 on 2026-10-18 19:54
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+BATCH_SIZE = 5000
+
+
+def rebuild_summaries(apps, schema_editor):
+    # what myapp.summaries.rebuild() computes, for the orders that exist already; the
+    # signals only keep the tables up to date from here on
+    Order = apps.get_model('myapp', 'Order')
+    OrderProduct = Order.products.through
+    DailyRevenue = apps.get_model('myapp', 'DailyRevenue')
+    StatusCount = apps.get_model('myapp', 'StatusCount')
+    ProductSales = apps.get_model('myapp', 'ProductSales')
+    for model in (DailyRevenue, StatusCount, ProductSales):
+        model.objects.all().delete()
+
+    statuses = Order.objects.values('status').annotate(orders=Count('id')).order_by()
+    StatusCount.objects.bulk_create(
+        [StatusCount(status=row['status'], orders=row['orders']) for row in statuses], batch_size=BATCH_SIZE,
+    )
+    revenue = dict(
+        OrderProduct.objects.annotate(day=TruncDate('order__date_created'))
+        .values('day').annotate(revenue=Sum('product__price')).order_by().values_list('day', 'revenue')
+    )
+    days = Order.objects.annotate(day=TruncDate('date_created')).values('day').annotate(orders=Count('id')).order_by()
+    DailyRevenue.objects.bulk_create(
+        [
+            DailyRevenue(day=row['day'], orders=row['orders'], revenue=revenue.get(row['day'], Decimal('0.00')))
+            for row in days
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    units = OrderProduct.objects.values('product_id').annotate(units=Count('id')).order_by()
+    ProductSales.objects.bulk_create(
+        [ProductSales(product_id=row['product_id'], units=row['units']) for row in units], batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0008_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRevenue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('orders', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StatusCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(max_length=20, unique=True)),
+                ('orders', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProductSales',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='myapp.product')),
+                ('units', models.IntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-units'], name='product_sales_units_idx')],
+            },
+        ),
+        migrations.RunPython(rebuild_summaries, migrations.RunPython.noop),
+    ]
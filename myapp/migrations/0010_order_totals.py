@@ -0,0 +1,60 @@
+# Generated by Django 5.1.2 on 2026-10-18 20:03
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Exists, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+BATCH_SIZE = 5000
+
+
+def backfill_totals(apps, schema_editor):
+    Order = apps.get_model('myapp', 'Order')
+    OrderProduct = Order.products.through
+    links = OrderProduct.objects.filter(order_id=OuterRef('pk')).values('order_id')
+    totals = {
+        'total_price': Coalesce(
+            Subquery(links.annotate(total=Sum('product__price')).values('total')),
+            Value(Decimal('0.00')),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        ),
+        'item_count': Coalesce(Subquery(links.annotate(count=Count('id')).values('count')), Value(0)),
+        'is_fulfillable': ~Exists(OrderProduct.objects.filter(order_id=OuterRef('pk'), product__available=False)),
+    }
+    pks = list(Order.objects.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(pks), BATCH_SIZE):
+        Order.objects.filter(pk__in=pks[start:start + BATCH_SIZE]).update(**totals)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0009_summaries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='is_fulfillable',
+            field=models.BooleanField(default=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=12),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['total_price', 'id'], name='order_total_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('is_fulfillable', False)), fields=['date_created', 'id'], name='order_unfulfillable_idx'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.1.2 on 2026-10-18 20:29
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fix_lowercase_status(apps, schema_editor):
+    # orders saved with the old default 'new', which is not one of the choices
+    Order = apps.get_model('myapp', 'Order')
+    StatusCount = apps.get_model('myapp', 'StatusCount')
+    Order.objects.filter(status='new').update(status='New')
+    stale = StatusCount.objects.filter(status='new').first()
+    if stale is not None:
+        if not StatusCount.objects.filter(status='New').update(orders=F('orders') + stale.orders):
+            StatusCount.objects.create(status='New', orders=stale.orders)
+        stale.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0013_jobs'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('New', 'New'), ('In Process', 'In Process'), ('Sent', 'Sent'), ('Completed', 'Completed')], default='New', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='OrderStatusChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_status', models.CharField(max_length=20)),
+                ('to_status', models.CharField(max_length=20)),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('changed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_changes', to='myapp.order')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['order', 'changed_at'], name='status_change_order_idx')],
+            },
+        ),
+        migrations.RunPython(fix_lowercase_status, migrations.RunPython.noop),
+    ]
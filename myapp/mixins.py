@@ -0,0 +1,120 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from rest_framework import serializers, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from . import summaries
+from .cache import invalidate_on_commit
+from .export import CSVRenderer, NDJSONRenderer, export_response, parse_since
+from .rendering import ValuesPlan
+from .serializers import query_names
+
+
+class BulkModelMixin:
+    # the batch is validated before anything is written; errors are listed per item in request order
+    @action(detail=False, methods=['post', 'patch', 'delete'], url_path='bulk')
+    def bulk(self, request, *args, **kwargs):
+        if request.method == 'POST':
+            return self.bulk_create(request)
+        if request.method == 'PATCH':
+            return self.bulk_update(request)
+        return self.bulk_destroy(request)
+
+    def bulk_create(self, request):
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        model = self.get_queryset().model
+        with transaction.atomic():
+            instances = serializer.save()
+            # bulk_create/bulk_update send no model signals
+            self.refresh_stored_values(instances, created=True)
+            summaries.Delta().add(model, [instance.pk for instance in instances]).apply()
+        # new rows only change the list responses
+        invalidate_on_commit(model, [])
+        return Response(self.bulk_representation(instances), status=status.HTTP_201_CREATED)
+
+    def bulk_update(self, request):
+        model = self.get_queryset().model
+        ids = []
+        if isinstance(request.data, list):
+            for item in request.data:
+                try:
+                    ids.append(model._meta.pk.to_python(item.get('id')))
+                except (AttributeError, DjangoValidationError):
+                    continue
+        instances = model._default_manager.in_bulk([pk for pk in ids if pk is not None])
+        serializer = self.get_serializer(instances, data=request.data, many=True, partial=True)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic(), self.tracked_changes(model, instances):
+            instances = serializer.save()
+            self.refresh_stored_values(instances, created=False)
+        invalidate_on_commit(model, [instance.pk for instance in instances])
+        return Response(self.bulk_representation(instances))
+
+    def bulk_destroy(self, request):
+        ids = serializers.ListField(
+            child=serializers.IntegerField(), allow_empty=False
+        ).run_validation(request.data)
+        queryset = self.get_queryset().model._default_manager.filter(pk__in=ids)
+        with transaction.atomic():
+            existing = set(queryset.select_for_update().values_list('pk', flat=True))
+            errors = [{} if pk in existing else {'id': ['Not found.']} for pk in ids]
+            if any(errors):
+                raise serializers.ValidationError(errors)
+            queryset.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def tracked_changes(self, model, instances):
+        # instances is {pk: instance} as loaded before the update
+        return summaries.tracked(model, instances)
+
+    def refresh_stored_values(self, instances, created):
+        # for values other rows keep about these, like the orders' stored totals
+        pass
+
+    def bulk_representation(self, instances):
+        pks = [instance.pk for instance in instances]
+        reloaded = self.get_queryset().in_bulk(pks)
+        return self.get_serializer([reloaded[pk] for pk in pks], many=True).data
+
+
+class SparseFieldsViewMixin:
+    # pairs with SparseFieldsMixin on the serializer: the queryset selects only the
+    # requested columns and joins or prefetches only the relations that are shown
+    def get_queryset(self):
+        return self.get_serializer_class().restrict_queryset(super().get_queryset(), self.request)
+
+
+class ValuesListMixin:
+    # JSON list responses built from values() rows by a ValuesPlan instead of a serializer
+    # per object; falls back to the serializers for expanded relations, other renderers
+    # and fields that are not plain columns
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json' or query_names(request, 'expand') is not None:
+            return super().list(request, *args, **kwargs)
+        try:
+            plan = ValuesPlan(self.get_serializer())
+        except ValueError:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset()).select_related(None).prefetch_related(None)
+        get_ordering = getattr(self.paginator, 'get_ordering', None)
+        if self.paginator is None:
+            return Response(plan.represent(list(queryset.values(*plan.columns()))))
+        # the cursor is read from the rows, so its columns are selected as well
+        ordering = [name.lstrip('-') for name in get_ordering(request, queryset, self)] if get_ordering else []
+        page = self.paginate_queryset(queryset.values(*plan.columns(*ordering)))
+        return self.get_paginated_response(plan.represent(page))
+
+
+class ExportMixin:
+    # streams every row as NDJSON (default) or CSV, e.g. ?format=csv&since=2024-01-01
+    export_name = None
+
+    @action(detail=False, methods=['get'], renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request, *args, **kwargs):
+        try:
+            since = parse_since(request.query_params.get('since'))
+        except ValueError:
+            raise serializers.ValidationError({'since': ['Expected an ISO 8601 date or datetime.']})
+        return export_response(self.export_name, request.accepted_renderer.format, since)
@@ -1,11 +1,29 @@
+from decimal import Decimal
+
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import Count, Exists, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
 # Create your models here.
 class Product(models.Model):
     name = models.CharField(max_length=255)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     available = models.BooleanField(default=True)
+    # units left to sell, reserved by myapp.placement; None when stock is not tracked
+    stock = models.PositiveIntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['name'], name='product_name_idx'),
+            models.Index(
+                fields=['name'], name='product_available_name_idx', condition=Q(available=True)
+            ),
+            models.Index(fields=['price', 'id'], name='product_price_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -24,11 +42,74 @@ class Product(models.Model):
 class Customer(models.Model):
     name = models.CharField(max_length=100)
     address = models.CharField(max_length=255)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # ?name__istartswith= is served by myapp_customer_name_prefix on PostgreSQL (migration 0011)
+        indexes = [models.Index(fields=['name', 'id'], name='customer_name_idx')]
 
     def __str__(self):
         return self.name
 
 
+def products_total():
+    totals = (
+        Order.products.through.objects.filter(order_id=OuterRef('pk'))
+        .values('order_id')
+        .annotate(total=Sum('product__price'))
+        .values('total')
+    )
+    return Coalesce(
+        Subquery(totals),
+        Value(Decimal('0.00')),
+        output_field=models.DecimalField(max_digits=12, decimal_places=2),
+    )
+
+
+def products_count():
+    counts = (
+        Order.products.through.objects.filter(order_id=OuterRef('pk'))
+        .values('order_id')
+        .annotate(count=Count('id'))
+        .values('count')
+    )
+    return Coalesce(Subquery(counts), Value(0))
+
+
+def products_fulfillable():
+    unavailable = Order.products.through.objects.filter(
+        order_id=OuterRef('pk'),
+        product__available=False,
+    )
+    return ~Exists(unavailable)
+
+
+class OrderQuerySet(models.QuerySet):
+    # correlated subqueries rather than a join + GROUP BY, so that ordering and
+    # LIMIT of the outer query can still be served from an index
+    def with_totals(self):
+        return self.annotate(products_total=products_total())
+
+    def with_fulfillment(self):
+        return self.annotate(products_fulfillable=products_fulfillable())
+
+    def refresh_totals(self, **fields):
+        # recompute the stored total_price/item_count/is_fulfillable in one UPDATE
+        return self.update(
+            total_price=products_total(),
+            item_count=products_count(),
+            is_fulfillable=products_fulfillable(),
+            **fields,
+        )
+
+    def refresh_totals_in_batches(self, batch_size=1000, **fields):
+        # for fan-outs like a product price change, so no single UPDATE locks every affected order
+        pks = list(self.order_by('pk').values_list('pk', flat=True).distinct())
+        for start in range(0, len(pks), batch_size):
+            Order.objects.filter(pk__in=pks[start:start + batch_size]).refresh_totals(**fields)
+        return len(pks)
+
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('New', 'New'),
@@ -36,25 +117,172 @@ class Order(models.Model):
         ('Sent', 'Sent'),
         ('Completed', 'Completed'),
     ]
+    # statuses only move forward; small orders may be sent without being processed first
+    TRANSITIONS = {
+        'New': ['In Process', 'Sent'],
+        'In Process': ['Sent'],
+        'Sent': ['Completed'],
+        'Completed': [],
+    }
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
-    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='new')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='New')
     products = models.ManyToManyField(Product)
     date_created = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # denormalized from products, kept in sync by myapp.signals
+    total_price = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'), editable=False)
+    item_count = models.PositiveIntegerField(default=0, editable=False)
+    is_fulfillable = models.BooleanField(default=True, editable=False)
+
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # cursor pagination of the order list and date range reports
+            models.Index(fields=['date_created', 'id'], name='order_created_id_idx'),
+            models.Index(fields=['customer', 'date_created'], name='order_customer_created_idx'),
+            # dashboards filter the (few) open orders by status, newest first
+            models.Index(
+                fields=['status', 'date_created'],
+                name='order_open_status_idx',
+                condition=~Q(status='Completed'),
+            ),
+            models.Index(fields=['total_price', 'id'], name='order_total_price_idx'),
+            models.Index(
+                fields=['date_created', 'id'],
+                name='order_unfulfillable_idx',
+                condition=Q(is_fulfillable=False),
+            ),
+        ]
 
     def __str__(self):
         return f"Order #{self.id} - {self.status}"
 
+    def set_totals(self):
+        totals = Order.products.through.objects.filter(order_id=self.pk).aggregate(
+            total=Sum('product__price'),
+            count=Count('id'),
+            unavailable=Count('id', filter=Q(product__available=False)),
+        )
+        self.total_price = totals['total'] or Decimal('0.00')
+        self.item_count = totals['count']
+        self.is_fulfillable = not totals['unavailable']
+
+    def save(self, *args, **kwargs):
+        # save() writes every column, so refresh the stored totals first instead of
+        # writing back values that a change of the products has made stale
+        update_fields = kwargs.get('update_fields')
+        if not self._state.adding and (update_fields is None or TOTAL_FIELDS & set(update_fields)):
+            self.set_totals()
+        super().save(*args, **kwargs)
+
     def calculate_total_price(self):
-        total_price = sum(product.price for product in self.products.all())
-        return total_price
+        if hasattr(self, 'products_total'):
+            return self.products_total
+        total_price = self.products.aggregate(total=Sum('price'))['total']
+        return total_price or Decimal('0.00')
 
     def check_order_fulfillment(self):
-        for product in self.products.all():
-            if not product.available:
-                return False
-        return True
+        if hasattr(self, 'products_fulfillable'):
+            return self.products_fulfillable
+        return not self.products.filter(available=False).exists()
+
+    @classmethod
+    def sources(cls, status):
+        # the statuses an order can be moved to status from
+        return [source for source, targets in cls.TRANSITIONS.items() if status in targets]
+
+    @classmethod
+    def validate_transition(cls, before, after):
+        if before != after and after not in cls.TRANSITIONS.get(before, []):
+            allowed = ', '.join(cls.TRANSITIONS.get(before, [])) or 'none'
+            raise ValidationError(
+                f"Cannot change the status from '{before}' to '{after}'. Allowed values are: {allowed}")
 
     def clean(self):
         if self.status not in dict(self.STATUS_CHOICES):
             raise ValidationError(
                 f"Invalid status value: '{self.status}'. Allowed values are: {', '.join(dict(self.STATUS_CHOICES).keys())}")
+        if not self._state.adding:
+            saved = Order.objects.filter(pk=self.pk).values_list('status', flat=True).first()
+            if saved is not None:
+                self.validate_transition(saved, self.status)
+
+
+TOTAL_FIELDS = {'total_price', 'item_count', 'is_fulfillable'}
+
+
+class OrderStatusChange(models.Model):
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='status_changes')
+    from_status = models.CharField(max_length=20)
+    to_status = models.CharField(max_length=20)
+    changed_at = models.DateTimeField(default=timezone.now)
+    changed_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+
+    class Meta:
+        indexes = [models.Index(fields=['order', 'changed_at'], name='status_change_order_idx')]
+
+    def __str__(self):
+        return f"Order #{self.order_id}: {self.from_status} -> {self.to_status}"
+
+
+# Summary tables for dashboards, kept up to date by myapp.summaries as orders,
+# their products and product prices change; rebuild with `rebuild_summaries`.
+# Revenue uses current product prices, like Order.calculate_total_price.
+class DailyRevenue(models.Model):
+    day = models.DateField(unique=True)
+    orders = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+
+    def __str__(self):
+        return f"{self.day}: {self.revenue}"
+
+
+class StatusCount(models.Model):
+    status = models.CharField(max_length=20, unique=True)
+    orders = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.status}: {self.orders}"
+
+
+class ProductSales(models.Model):
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True)
+    # number of orders containing the product
+    units = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=['-units'], name='product_sales_units_idx')]
+
+    def __str__(self):
+        return f"{self.product_id}: {self.units}"
+
+
+# Background work for myapp.jobs, run by `manage.py run_worker`
+class Job(models.Model):
+    QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+    queue = models.CharField(max_length=50, default='default')
+    task = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    # enqueueing a job with the key of an existing one returns the existing job
+    key = models.CharField(max_length=255, unique=True, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # what the workers poll; finished jobs are not indexed
+            models.Index(fields=['queue', 'run_at'], name='job_queued_idx', condition=Q(status='queued')),
+            models.Index(fields=['queue', 'locked_until'], name='job_running_idx', condition=Q(status='running')),
+        ]
+
+    def __str__(self):
+        return f"Job #{self.id} {self.task} - {self.status}"
@@ -0,0 +1,17 @@
+from asgiref.sync import sync_to_async
+from rest_framework.pagination import CursorPagination
+
+
+class IdCursorPagination(CursorPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = 'id'
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        # DRF's own paginate_queryset, run where the async ORM runs its queries: in the
+        # thread sync_to_async keeps for database access
+        return await sync_to_async(self.paginate_queryset)(queryset, request, view)
+
+
+class OrderCursorPagination(IdCursorPagination):
+    ordering = ('-date_created', '-id')
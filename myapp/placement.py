@@ -0,0 +1,40 @@
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Product, Order
+
+# available and, where the stock is tracked, with a unit left
+SELLABLE = Q(available=True) & (Q(stock__isnull=True) | Q(stock__gt=0))
+
+
+class OutOfStock(Exception):
+    def __init__(self, product_ids):
+        super().__init__(f'Products {product_ids} are unavailable or out of stock.')
+        self.product_ids = product_ids
+
+
+def reserve(product_ids):
+    # a single guarded UPDATE instead of read, check and write: the row locks it takes make
+    # concurrent buyers of the same product wait for each other, and a buyer that finds no
+    # unit left updates nothing; an untracked (NULL) stock stays NULL
+    return Product.objects.filter(SELLABLE, pk__in=product_ids).update(
+        stock=F('stock') - 1,
+        updated_at=timezone.now(),
+    )
+
+
+def place_order(customer, product_ids, status='New'):
+    # one unit of every product is reserved and the order created in the same transaction,
+    # so an order is either fulfillable when committed or not created at all
+    product_ids = sorted(set(product_ids))
+    with transaction.atomic():
+        if reserve(product_ids) == len(product_ids):
+            order = Order.objects.create(customer=customer, status=status)
+            # a single INSERT for all the order's products
+            order.products.add(*product_ids)
+            return order
+        transaction.set_rollback(True)
+    sellable = set(Product.objects.filter(SELLABLE, pk__in=product_ids).values_list('pk', flat=True))
+    # the units may have been released again by a concurrent order that rolled back
+    raise OutOfStock([pk for pk in product_ids if pk not in sellable] or product_ids)
@@ -0,0 +1,86 @@
+import orjson
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField
+from rest_framework.renderers import JSONRenderer
+
+# fields whose to_representation returns database values unchanged
+PLAIN_FIELDS = (serializers.CharField, serializers.IntegerField, serializers.BooleanField)
+ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+
+class FastJSONRenderer(JSONRenderer):
+    # orjson, with the types it would format differently (dates, times) handed to DRF's
+    # encoder, so the bytes are the same as JSONRenderer's compact, unicode output
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if not self.compact or self.ensure_ascii or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            # e.g. integers beyond 64 bits or non-string keys
+            return super().render(data, accepted_media_type, renderer_context)
+        # escaped by JSONRenderer so the output stays a strict JavaScript subset
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class ValuesPlan:
+    # how to build a serializer's representation from values() rows: one column and,
+    # where needed, the field's own to_representation per field, worked out once per
+    # request instead of running the serializer for every object
+    def __init__(self, serializer):
+        self.model = serializer.Meta.model
+        self.fields = []
+        self.many = []
+        for name, field in serializer.fields.items():
+            if len(field.source_attrs) != 1:
+                raise ValueError(f'{name} is not a model field')
+            model_field = self.model._meta.get_field(field.source)
+            if isinstance(field, ManyRelatedField):
+                if not isinstance(field.child_relation, PrimaryKeyRelatedField) or field.child_relation.pk_field:
+                    raise ValueError(f'{name} is not a list of primary keys')
+                self.many.append((name, model_field))
+            elif isinstance(field, PrimaryKeyRelatedField):
+                if field.pk_field:
+                    raise ValueError(f'{name} is not a primary key')
+                self.fields.append((name, model_field.attname, None))
+            elif not model_field.concrete:
+                raise ValueError(f'{name} is not a column')
+            else:
+                convert = None if type(field) in PLAIN_FIELDS else field.to_representation
+                self.fields.append((name, model_field.attname, convert))
+
+    def columns(self, *extra):
+        columns = [self.model._meta.pk.attname, *(column for _, column, _ in self.fields)]
+        return list(dict.fromkeys([*columns, *extra]))
+
+    def represent(self, rows):
+        fields = self.fields
+        related = {name: self.related_ids(field, [row[self.model._meta.pk.attname] for row in rows])
+                   for name, field in self.many}
+        data = []
+        for row in rows:
+            item = {
+                name: row[column] if convert is None or row[column] is None else convert(row[column])
+                for name, column, convert in fields
+            }
+            for name, ids in related.items():
+                item[name] = ids.get(row[self.model._meta.pk.attname], [])
+            data.append(item)
+        return data
+
+    def related_ids(self, field, pks):
+        # one query on the through table for the whole page, in the order of the related ids
+        through = field.remote_field.through
+        source, target = f'{field.m2m_field_name()}_id', f'{field.m2m_reverse_field_name()}_id'
+        ids = {}
+        links = through.objects.filter(**{f'{source}__in': pks}).order_by(target).values_list(source, target)
+        for pk, related_pk in links:
+            ids.setdefault(pk, []).append(related_pk)
+        return ids
+
+
+def values_data(queryset, serializer):
+    plan = ValuesPlan(serializer)
+    return plan.represent(list(queryset.select_related(None).prefetch_related(None).values(*plan.columns())))
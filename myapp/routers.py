@@ -0,0 +1,134 @@
+import itertools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+# the replica chosen for the current request, None while reads have to see the primary
+read_alias = ContextVar('read_alias', default=None)
+# set on writes as well, for clients that keep cookies and reach other worker processes
+STICKY_COOKIE = 'replica_sticky'
+
+_replicas = None
+_replicas_lock = threading.Lock()
+
+
+def next_replica():
+    # round robin over DATABASE_REPLICAS, per process
+    global _replicas
+    with _replicas_lock:
+        if _replicas is None or _replicas[0] != settings.DATABASE_REPLICAS:
+            _replicas = (settings.DATABASE_REPLICAS, itertools.cycle(settings.DATABASE_REPLICAS))
+        return next(_replicas[1])
+
+
+@contextmanager
+def reading_primary():
+    # for reads whose result outlives the request, e.g. in a cache shared with other clients
+    token = read_alias.set(None)
+    try:
+        yield
+    finally:
+        read_alias.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = read_alias.get()
+        # reads inside a transaction have to see its writes
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get their schema through replication
+        return db not in settings.DATABASE_REPLICAS
+
+
+def sticky_key(request):
+    # per user rather than per token, so a refreshed token still reads its own writes;
+    # anonymous clients and invalid tokens go by address
+    client = f'address:{request.META.get("REMOTE_ADDR", "")}'
+    header = request.META.get(api_settings.AUTH_HEADER_NAME, '').split()
+    if len(header) == 2 and header[0] in api_settings.AUTH_HEADER_TYPES:
+        try:
+            client = f'user:{AccessToken(header[1])[api_settings.USER_ID_CLAIM]}'
+        except (TokenError, KeyError):
+            pass
+    return f'replica:sticky:{client}'
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+    read_methods = ('GET', 'HEAD')
+    path_prefix = '/api/'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.routes(request):
+            return self.get_response(request)
+
+        cache = caches[settings.REPLICA_STICKY_CACHE]
+        key = sticky_key(request)
+        if request.method in self.read_methods:
+            sticky = STICKY_COOKIE in request.COOKIES or cache.get(key)
+            token = read_alias.set(None if sticky else next_replica())
+            try:
+                return self.get_response(request)
+            finally:
+                read_alias.reset(token)
+
+        response = self.get_response(request)
+        if response.status_code < 400:
+            cache.set(key, True, settings.REPLICA_STICKY_SECONDS)
+            self.set_cookie(response)
+        return response
+
+    async def __acall__(self, request):
+        if not self.routes(request):
+            return await self.get_response(request)
+
+        cache = caches[settings.REPLICA_STICKY_CACHE]
+        key = sticky_key(request)
+        if request.method in self.read_methods:
+            sticky = STICKY_COOKIE in request.COOKIES or await cache.aget(key)
+            token = read_alias.set(None if sticky else next_replica())
+            try:
+                return await self.get_response(request)
+            finally:
+                read_alias.reset(token)
+
+        response = await self.get_response(request)
+        if response.status_code < 400:
+            await cache.aset(key, True, settings.REPLICA_STICKY_SECONDS)
+            self.set_cookie(response)
+        return response
+
+    def set_cookie(self, response):
+        if settings.REPLICA_STICKY_SECONDS > 0:
+            response.set_cookie(
+                STICKY_COOKIE, '1', max_age=settings.REPLICA_STICKY_SECONDS, httponly=True, samesite='Lax',
+            )
+
+    def routes(self, request):
+        return settings.DATABASE_REPLICAS and request.path.startswith(self.path_prefix)
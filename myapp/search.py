@@ -0,0 +1,60 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField
+from django.db import connections
+from django.db.models import Case, F, Func, IntegerField, Q, Value, When
+from rest_framework.filters import SearchFilter
+
+SEARCH_CONFIG = 'simple'
+
+
+class NameVector(Func):
+    # must stay identical to the expression of the myapp_product_name_fts index
+    function = 'to_tsvector'
+    template = f"%(function)s('{SEARCH_CONFIG}', %(expressions)s)"
+    output_field = SearchVectorField()
+
+
+def search_words(terms):
+    return [word for term in terms for word in re.findall(r'[^\W_]+', term)]
+
+
+def prefix_query(words):
+    # every word must match the start of a word in the name: 'rac gl' -> 'rac:* & gl:*'
+    return ' & '.join(f'{word}:*' for word in words)
+
+
+def is_postgresql(queryset):
+    return connections[queryset.db].vendor == 'postgresql'
+
+
+def filter_products(queryset, words):
+    if is_postgresql(queryset):
+        query = SearchQuery(prefix_query(words), search_type='raw', config=SEARCH_CONFIG)
+        return queryset.alias(name_vector=NameVector('name')).filter(name_vector=query)
+    condition = Q()
+    for word in words:
+        condition &= Q(name__istartswith=word) | Q(name__icontains=f' {word}')
+    return queryset.filter(condition)
+
+
+def rank_products(queryset, words):
+    queryset = filter_products(queryset, words)
+    if is_postgresql(queryset):
+        query = SearchQuery(prefix_query(words), search_type='raw', config=SEARCH_CONFIG)
+        rank = SearchRank(F('name_vector'), query)
+    else:
+        rank = Case(
+            When(name__istartswith=words[0], then=Value(1)),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    return queryset.annotate(rank=rank).order_by('-rank', 'name', 'id')
+
+
+class ProductSearchFilter(SearchFilter):
+    def filter_queryset(self, request, queryset, view):
+        words = search_words(self.get_search_terms(request))
+        if not words:
+            return queryset
+        return filter_products(queryset, words)
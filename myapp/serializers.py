@@ -1,17 +1,292 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Product, Customer, Order
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.relations import ManyRelatedField, RelatedField
+from .jobs import check_payload
+from .models import Product, Customer, Order, OrderStatusChange, DailyRevenue, ProductSales, Job
 
-class ProductSerializer(serializers.ModelSerializer):
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    def to_internal_value(self, data):
+        related_objects = getattr(self.root, 'related_objects', None)
+        model = self.get_queryset().model
+        if related_objects is None or model not in related_objects or isinstance(data, bool):
+            return super().to_internal_value(data)
+        try:
+            pk = model._meta.pk.to_python(data)
+        except DjangoValidationError:
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return related_objects[model][pk]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+
+
+class BulkListSerializer(serializers.ListSerializer):
+    batch_size = 1000
+
+    def to_internal_value(self, data):
+        self.seen_ids = set()
+        if isinstance(data, list):
+            self.related_objects = self.load_related_objects(data)
+        return super().to_internal_value(data)
+
+    def load_related_objects(self, data):
+        # resolve every pk referenced by the batch with one query per related model
+        wanted = {}
+        for field in self.child.fields.values():
+            if field.read_only or not isinstance(field, (RelatedField, ManyRelatedField)):
+                continue
+            many = isinstance(field, ManyRelatedField)
+            queryset = (field.child_relation if many else field).get_queryset()
+            model = queryset.model
+            pks = wanted.setdefault(model, (queryset, set()))[1]
+            for item in data:
+                value = item.get(field.field_name) if isinstance(item, dict) else None
+                for pk in (value if many and isinstance(value, list) else [value]):
+                    if pk is None or isinstance(pk, (bool, list, dict)):
+                        continue
+                    try:
+                        pks.add(model._meta.pk.to_python(pk))
+                    except DjangoValidationError:
+                        pass
+        return {model: queryset.in_bulk(pks) for model, (queryset, pks) in wanted.items()}
+
+    def run_child_validation(self, data):
+        if self.instance is None:
+            return super().run_child_validation(data)
+        model = self.child.Meta.model
+        try:
+            pk = model._meta.pk.to_python(data.get('id'))
+        except (AttributeError, DjangoValidationError):
+            pk = None
+        if pk is None or pk not in self.instance:
+            raise serializers.ValidationError({'id': ['Object with this id does not exist.']})
+        if pk in self.seen_ids:
+            raise serializers.ValidationError({'id': ['Duplicate id in batch.']})
+        self.seen_ids.add(pk)
+        self.child.instance = self.instance[pk]
+        self.child.initial_data = data
+        validated = super().run_child_validation(data)
+        validated['id'] = pk
+        return validated
+
+    def split_many_to_many(self, attrs):
+        model = self.child.Meta.model
+        return {
+            field.name: attrs.pop(field.name)
+            for field in model._meta.many_to_many if field.name in attrs
+        }
+
+    def set_many_to_many(self, instances, relations, replace):
+        model = self.child.Meta.model
+        for field in model._meta.many_to_many:
+            through = field.remote_field.through
+            source = field.m2m_field_name()
+            target = field.m2m_reverse_field_name()
+            touched = [
+                (instance, relation[field.name])
+                for instance, relation in zip(instances, relations) if field.name in relation
+            ]
+            if not touched:
+                continue
+            if replace:
+                through.objects.filter(
+                    **{f'{source}__in': [instance.pk for instance, _ in touched]}
+                ).delete()
+            through.objects.bulk_create(
+                [
+                    through(**{f'{source}_id': instance.pk, f'{target}_id': pk})
+                    for instance, related in touched
+                    for pk in dict.fromkeys(obj.pk for obj in related)
+                ],
+                batch_size=self.batch_size,
+            )
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        relations = [self.split_many_to_many(attrs) for attrs in validated_data]
+        instances = [model(**attrs) for attrs in validated_data]
+        with transaction.atomic():
+            model.objects.bulk_create(instances, batch_size=self.batch_size)
+            self.set_many_to_many(instances, relations, replace=False)
+        return instances
+
+    def update(self, instance, validated_data):
+        model = self.child.Meta.model
+        instances = []
+        relations = []
+        fields = set()
+        # bulk_update does not run pre_save, so auto_now columns are set here
+        auto_now = [field for field in model._meta.concrete_fields if getattr(field, 'auto_now', False)]
+        now = timezone.now()
+        for attrs in validated_data:
+            obj = instance[attrs.pop('id')]
+            relations.append(self.split_many_to_many(attrs))
+            for attr, value in attrs.items():
+                setattr(obj, attr, value)
+                fields.add(attr)
+            for field in auto_now:
+                setattr(obj, field.attname, now)
+                fields.add(field.name)
+            instances.append(obj)
+        with transaction.atomic():
+            if fields:
+                model.objects.bulk_update(instances, fields, batch_size=self.batch_size)
+            self.set_many_to_many(instances, relations, replace=True)
+        return instances
+
+
+def query_names(request, param):
+    # comma separated names of a read request's query parameter, None if it is absent
+    if request is None or request.method not in SAFE_METHODS or param not in request.query_params:
+        return None
+    return [name.strip() for name in request.query_params[param].split(',') if name.strip()]
+
+
+class SparseFieldsMixin:
+    # ?fields=id,status limits a read response to those fields and ?expand=customer,products
+    # nests the objects of Meta.expandable_fields instead of their ids; restrict_queryset
+    # makes the view select only those columns and load only those relations
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # only the serializer a view creates gets the request; nested ones keep all their fields
+        request = self.context.get('request')
+        fields, expand = query_names(request, 'fields'), query_names(request, 'expand') or []
+        expandable = getattr(self.Meta, 'expandable_fields', {})
+        errors = {}
+        if fields is not None and set(fields) - set(self.fields):
+            errors['fields'] = [f'Unknown fields: {", ".join(sorted(set(fields) - set(self.fields)))}.']
+        if set(expand) - set(expandable):
+            errors['expand'] = [f'Cannot expand: {", ".join(sorted(set(expand) - set(expandable)))}.']
+        if errors:
+            raise serializers.ValidationError(errors)
+        for name in expand:
+            many = self.Meta.model._meta.get_field(name).many_to_many
+            self.fields[name] = expandable[name](many=many, read_only=True)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def restrict_queryset(cls, queryset, request):
+        model = queryset.model
+        fields, expand = query_names(request, 'fields'), query_names(request, 'expand') or []
+        if fields is not None:
+            queryset = queryset.only(*[
+                field.name for field in model._meta.concrete_fields if field.primary_key or field.name in fields
+            ])
+        queryset = queryset.select_related(None).prefetch_related(None)
+        for field in model._meta.get_fields():
+            if field.auto_created or not (field.many_to_one or field.many_to_many):
+                continue
+            if fields is not None and field.name not in fields:
+                continue
+            if field.name in expand:
+                queryset = queryset.select_related(field.name) if field.many_to_one else queryset.prefetch_related(field.name)
+            elif field.many_to_many:
+                # ids only
+                queryset = queryset.prefetch_related(
+                    Prefetch(field.name, queryset=field.related_model.objects.only('pk').order_by('pk'))
+                )
+        return queryset
+
+
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = '__all__'
+        list_serializer_class = BulkListSerializer
 
-class CustomerSerializer(serializers.ModelSerializer):
+    def validate_price(self, value):
+        try:
+            Product(price=value).validate_positive_price()
+        except DjangoValidationError as exc:
+            raise serializers.ValidationError(exc.messages)
+        return value
+
+class CustomerSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Customer
         fields = '__all__'
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    serializer_related_field = BulkPrimaryKeyRelatedField
+
     class Meta:
         model = Order
         fields = '__all__'
+        list_serializer_class = BulkListSerializer
+        expandable_fields = {'customer': CustomerSerializer, 'products': ProductSerializer}
+
+    def validate_status(self, value):
+        if isinstance(self.instance, Order):
+            try:
+                Order.validate_transition(self.instance.status, value)
+            except DjangoValidationError as exc:
+                raise serializers.ValidationError(exc.messages)
+        return value
+
+    def validate_products(self, value):
+        # a unit of a stock-tracked product is only reserved by POST /api/orders/place/, so
+        # these writes must not add one to an order; the order's products are only read
+        # back when there is such a product
+        tracked = {product.pk for product in value if product.stock is not None}
+        if tracked and isinstance(self.instance, Order):
+            tracked -= {product.pk for product in self.instance.products.all()}
+        if tracked:
+            raise serializers.ValidationError(
+                f'Products {sorted(tracked)} have a tracked stock, place the order with /api/orders/place/.'
+            )
+        return value
+
+class OrderPlacementSerializer(serializers.Serializer):
+    customer = serializers.PrimaryKeyRelatedField(queryset=Customer.objects.all())
+    # checked and reserved all at once by myapp.placement rather than one query per id here
+    products = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=100)
+
+class OrderTransitionSerializer(serializers.Serializer):
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES)
+    # without ids every order matching the query's filters is moved
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=100000, required=False)
+
+class OrderStatusChangeSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OrderStatusChange
+        fields = ['from_status', 'to_status', 'changed_at', 'changed_by']
+
+class DailyRevenueSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DailyRevenue
+        fields = ['day', 'orders', 'revenue']
+
+class ProductSalesSerializer(serializers.ModelSerializer):
+    name = serializers.CharField(source='product.name', read_only=True)
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = ProductSales
+        fields = ['product', 'name', 'units', 'revenue']
+
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = [
+            'id', 'queue', 'task', 'payload', 'key', 'status', 'attempts', 'max_attempts', 'run_at',
+            'last_error', 'created_at', 'finished_at',
+        ]
+        read_only_fields = [
+            'queue', 'status', 'attempts', 'max_attempts', 'run_at', 'last_error', 'created_at', 'finished_at',
+        ]
+        # a known key returns its job instead of failing validation
+        extra_kwargs = {'key': {'validators': []}}
+
+    def validate(self, attrs):
+        try:
+            check_payload(attrs['task'], attrs.get('payload', {}))
+        except ValueError as exc:
+            raise serializers.ValidationError({'task': [str(exc)]})
+        return attrs
@@ -0,0 +1,152 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.contrib.auth import get_user_model
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import summaries
+from .authentication import deny_user, users
+from .cache import VERSIONED_MODELS, invalidate_on_commit
+from .instrumentation import install_query_recorder
+from .models import Product, Order
+from .tasks import refresh_totals_later
+from .transitions import record_changes
+
+# user fields whose change revokes the user's tokens
+AUTHORIZATION_CLAIMS = ('is_active', 'is_staff', 'is_superuser')
+
+
+@receiver(connection_created)
+def record_request_queries(sender, connection, **kwargs):
+    install_query_recorder(connection)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_cached_object(sender, instance, **kwargs):
+    if sender in VERSIONED_MODELS:
+        invalidate_on_commit(sender, [instance.pk])
+
+
+@receiver(m2m_changed)
+def invalidate_cached_relations(sender, instance, action, model, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if type(instance) in VERSIONED_MODELS:
+        invalidate_on_commit(type(instance), [instance.pk])
+    if model in VERSIONED_MODELS:
+        invalidate_on_commit(model, pk_set)
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def refresh_orders_on_products_change(sender, instance, action, reverse, pk_set, **kwargs):
+    # an order's representation includes its products, so changing them has to move
+    # the order's updated_at (used for Last-Modified/ETag) and its stored totals as well
+    now = timezone.now()
+    if not reverse and action in ('post_add', 'post_remove', 'post_clear'):
+        # computed on the instance too, so a later save() or serializer sees the new values
+        instance.set_totals()
+        instance.updated_at = now
+        Order.objects.filter(pk=instance.pk).update(
+            updated_at=now,
+            total_price=instance.total_price,
+            item_count=instance.item_count,
+            is_fulfillable=instance.is_fulfillable,
+        )
+    elif reverse and action in ('post_add', 'post_remove'):
+        Order.objects.filter(pk__in=pk_set).refresh_totals(updated_at=now)
+    elif reverse and action == 'pre_clear':
+        instance._cleared_order_ids = list(Order.objects.filter(products=instance).values_list('pk', flat=True))
+    elif reverse and action == 'post_clear':
+        refresh_totals_later(Order.objects.filter(pk__in=instance._cleared_order_ids), touch=True)
+
+
+@receiver(pre_delete, sender=Product)
+def remember_product_orders(sender, instance, **kwargs):
+    instance._order_ids = list(Order.objects.filter(products=instance).values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Product)
+def refresh_orders_on_product_delete(sender, instance, **kwargs):
+    refresh_totals_later(Order.objects.filter(pk__in=instance._order_ids), touch=True)
+
+
+# columns other rows depend on: the summary tables and the orders' stored totals
+WATCHED_FIELDS = {Order: ['status', 'date_created'], Product: ['price', 'available']}
+
+
+@receiver(pre_save, sender=Order)
+@receiver(pre_save, sender=Product)
+def find_changed_fields(sender, instance, **kwargs):
+    instance._changed_fields = set()
+    instance._saved_values = {}
+    if not instance._state.adding:
+        fields = [sender._meta.get_field(name) for name in WATCHED_FIELDS[sender]]
+        saved = sender.objects.filter(pk=instance.pk).values(*[field.attname for field in fields]).first()
+        if saved is not None:
+            instance._saved_values = saved
+            instance._changed_fields = {
+                field.name for field in fields
+                if saved[field.attname] != field.to_python(getattr(instance, field.attname))
+            }
+    summaries.before_save(instance, instance._changed_fields)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_save, sender=Product)
+def update_summaries(sender, instance, created, **kwargs):
+    summaries.after_save(instance, created)
+
+
+@receiver(post_save, sender=Product)
+def refresh_orders_on_product_change(sender, instance, created, **kwargs):
+    if not created and instance._changed_fields & {'price', 'available'}:
+        refresh_totals_later(Order.objects.filter(products=instance))
+
+
+@receiver(post_save, sender=Order)
+def record_status_change(sender, instance, created, **kwargs):
+    if not created and 'status' in instance._changed_fields:
+        record_changes([(instance.pk, instance._saved_values['status'], instance.status)])
+
+
+@receiver(pre_delete, sender=Order)
+@receiver(pre_delete, sender=Product)
+def remove_from_summaries(sender, instance, **kwargs):
+    # order products are deleted without m2m_changed, so their share goes here as well
+    summaries.Delta().add(sender, [instance.pk], -1).apply()
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def update_summaries_on_products_change(sender, instance, action, **kwargs):
+    # every changed link involves the instance, whichever side of the relation it is on
+    if action in ('pre_add', 'pre_remove', 'pre_clear'):
+        instance._summary_delta = summaries.Delta().add(type(instance), [instance.pk], -1)
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        instance._summary_delta.add(type(instance), [instance.pk]).apply()
+        instance._summary_delta = None
+
+
+@receiver(pre_save, sender=get_user_model())
+def find_changed_claims(sender, instance, **kwargs):
+    instance._claims_changed = False
+    if not instance._state.adding:
+        saved = sender.objects.filter(pk=instance.pk).values(*AUTHORIZATION_CLAIMS).first()
+        instance._claims_changed = saved is not None and any(
+            saved[claim] != getattr(instance, claim) for claim in AUTHORIZATION_CLAIMS
+        )
+
+
+@receiver(post_save, sender=get_user_model())
+def refresh_cached_user(sender, instance, **kwargs):
+    users.pop(instance.pk)
+    if getattr(instance, '_claims_changed', False) or not instance.is_active:
+        # access tokens carry these claims and are not checked against the database, so
+        # the tokens issued so far are revoked instead
+        deny_user(instance.pk)
+
+
+@receiver(post_delete, sender=get_user_model())
+def forget_deleted_user(sender, instance, **kwargs):
+    users.pop(instance.pk)
+    deny_user(instance.pk)
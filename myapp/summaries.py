@@ -0,0 +1,142 @@
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import connection, models, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Product, Order, DailyRevenue, StatusCount, ProductSales
+
+OrderProduct = Order.products.through
+
+
+class Delta:
+    # what a set of orders or products contributes to the summary tables; a
+    # change is the contribution after it minus the one before, so only the
+    # affected rows are read and only the summary rows that moved are written
+    def __init__(self):
+        self.statuses = Counter()
+        self.day_orders = Counter()
+        self.day_revenue = defaultdict(Decimal)
+        self.units = Counter()
+
+    def add(self, model, pks, sign=1):
+        pks = list(pks)
+        if not pks:
+            return self
+        if model is Order:
+            return self.add_rows(Order.objects.filter(pk__in=pks), OrderProduct.objects.filter(order_id__in=pks), sign)
+        if model is Product:
+            # a product contributes its price and a unit to every order containing it
+            return self.add_rows(Order.objects.none(), OrderProduct.objects.filter(product_id__in=pks), sign)
+        return self
+
+    def add_rows(self, orders, links, sign=1):
+        by_day = orders.annotate(day=TruncDate('date_created')).values('status', 'day').annotate(count=Count('id'))
+        for row in by_day.order_by():
+            self.statuses[row['status']] += sign * row['count']
+            self.day_orders[row['day']] += sign * row['count']
+        revenue = links.annotate(day=TruncDate('order__date_created')).values('day').annotate(revenue=Sum('product__price'))
+        for row in revenue.order_by():
+            self.day_revenue[row['day']] += sign * row['revenue']
+        for row in links.values('product_id').annotate(count=Count('id')).order_by():
+            self.units[row['product_id']] += sign * row['count']
+        return self
+
+    def add_created_order(self, order):
+        # a new order has no products yet
+        self.statuses[order.status] += 1
+        self.day_orders[timezone.localdate(order.date_created)] += 1
+        return self
+
+    def apply(self):
+        increment(StatusCount, 'status', [
+            {'status': status, 'orders': count} for status, count in self.statuses.items() if count
+        ])
+        increment(DailyRevenue, 'day', [
+            {'day': day, 'orders': self.day_orders[day], 'revenue': self.day_revenue.get(day, Decimal('0.00'))}
+            for day in set(self.day_orders) | set(self.day_revenue)
+            if self.day_orders[day] or self.day_revenue.get(day)
+        ])
+        increment(ProductSales, 'product', [
+            {'product': product_id, 'units': count} for product_id, count in self.units.items() if count
+        ])
+
+
+def increment(model, key, rows, batch_size=500):
+    # one INSERT ... ON CONFLICT DO UPDATE SET x = x + excluded.x per table and batch, so
+    # missing rows are created and concurrent writers do not lose each other's changes
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        fields = [model._meta.get_field(name) for name in batch[0]]
+        columns = [quote(field.column) for field in fields]
+        row_sql = '(' + ', '.join(['%s'] * len(fields)) + ')'
+        updates = ', '.join(f'{column} = {table}.{column} + excluded.{column}' for column in columns[1:])
+        sql = (
+            f'INSERT INTO {table} ({", ".join(columns)}) VALUES {", ".join([row_sql] * len(batch))} '
+            f'ON CONFLICT ({quote(model._meta.get_field(key).column)}) DO UPDATE SET {updates}'
+        )
+        params = [field.get_db_prep_save(row[field.name], connection) for row in batch for field in fields]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+
+@contextmanager
+def tracked(model, pks):
+    # for writes that send no model signals (bulk_create, bulk_update, upserts);
+    # has to run inside the writing transaction
+    pks = list(pks)
+    delta = Delta().add(model, pks, -1)
+    yield
+    delta.add(model, pks).apply()
+
+
+# fields of the saved row the summaries depend on
+SUMMARY_FIELDS = {Order: ['status', 'date_created'], Product: ['price']}
+
+
+def before_save(instance, changed_fields):
+    instance._summary_delta = None
+    if changed_fields & set(SUMMARY_FIELDS[type(instance)]):
+        instance._summary_delta = Delta().add(type(instance), [instance.pk], -1)
+
+
+def after_save(instance, created):
+    if created and isinstance(instance, Order):
+        Delta().add_created_order(instance).apply()
+    elif getattr(instance, '_summary_delta', None) is not None:
+        instance._summary_delta.add(type(instance), [instance.pk]).apply()
+        instance._summary_delta = None
+
+
+def rebuild():
+    with transaction.atomic():
+        for model in (DailyRevenue, StatusCount, ProductSales):
+            model.objects.all().delete()
+        delta = Delta().add_rows(Order.objects.all(), OrderProduct.objects.all())
+        StatusCount.objects.bulk_create(
+            StatusCount(status=status, orders=count) for status, count in delta.statuses.items()
+        )
+        DailyRevenue.objects.bulk_create(
+            DailyRevenue(day=day, orders=count, revenue=delta.day_revenue.get(day, Decimal('0.00')))
+            for day, count in delta.day_orders.items()
+        )
+        ProductSales.objects.bulk_create(
+            ProductSales(product_id=product_id, units=count) for product_id, count in delta.units.items()
+        )
+    return delta
+
+
+def top_products(limit):
+    return (
+        ProductSales.objects.filter(units__gt=0)
+        .select_related('product')
+        .annotate(revenue=models.ExpressionWrapper(
+            F('units') * F('product__price'), output_field=models.DecimalField(max_digits=14, decimal_places=2)
+        ))
+        .order_by('-units', 'product_id')[:limit]
+    )
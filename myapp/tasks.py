@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.utils import timezone
+
+from .cache import invalidate_on_commit
+from .jobs import enqueue, task
+from .models import Order
+from .transitions import transition_orders
+
+
+@task(queue='orders')
+def refresh_totals(order_ids, touch=False):
+    # stored total_price, item_count and is_fulfillable
+    fields = {'updated_at': timezone.now()} if touch else {}
+    Order.objects.filter(pk__in=order_ids).refresh_totals(**fields)
+    invalidate_on_commit(Order, order_ids)
+
+
+def check_status(order_ids, status):
+    if status not in dict(Order.STATUS_CHOICES):
+        raise ValueError(f'Invalid status value: {status!r}.')
+
+
+@task(queue='orders', check=check_status)
+def set_status(order_ids, status):
+    # orders that cannot move to status (see Order.TRANSITIONS) are left as they are
+    check_status(order_ids, status)
+    transition_orders(Order.objects.filter(pk__in=order_ids), status)
+
+
+def refresh_totals_later(orders, touch=False):
+    # fan-outs like a product price change: a few orders are refreshed right away,
+    # more are left to the workers in batches so the request does not wait for them
+    pks = list(orders.order_by('pk').values_list('pk', flat=True).distinct())
+    batch_size = settings.ORDER_REFRESH_BATCH_SIZE
+    for start in range(0, len(pks), batch_size):
+        batch = pks[start:start + batch_size]
+        if len(pks) <= settings.ORDER_REFRESH_INLINE_LIMIT:
+            refresh_totals(batch, touch)
+        else:
+            enqueue('refresh_totals', {'order_ids': batch, 'touch': touch})
+    return len(pks)
@@ -0,0 +1,278 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command, CommandError
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.db import connection
+from myapp.benchmarks import compare
+from myapp.cache import stats as cache_stats
+from myapp.management.commands.benchmark_connections import mode_settings
+from myapp.jobs import enqueue
+from myapp.models import Product, Customer, Order, Job, OrderStatusChange, ProductSales
+
+
+class AuditIndexesCommandTest(TestCase):
+
+    def test_flags_sequential_scans_on_large_tables(self):
+        Product.objects.create(name='Racing Gloves', price=19.99, available=True)
+        out = StringIO()
+        call_command('audit_indexes', '--min-rows', '1', stdout=out)
+        output = out.getvalue()
+        self.assertIn('ok        product detail', output)
+        self.assertIn('ok        orders of the last week', output)
+
+    def test_small_tables_are_not_flagged(self):
+        out = StringIO()
+        call_command('audit_indexes', stdout=out)
+        self.assertIn('No sequential scans on large tables.', out.getvalue())
+
+
+class PopulateSampleDataCommandTest(TestCase):
+
+    def test_default_sample_data(self):
+        call_command('populate_sample_data', stdout=StringIO())
+        self.assertEqual(Product.objects.count(), 3)
+        self.assertEqual(Customer.objects.count(), 3)
+        self.assertEqual(Order.objects.count(), 3)
+
+    def test_generated_dataset(self):
+        Product.objects.create(name='Old product', price=1.00, available=True)
+        out = StringIO()
+        call_command(
+            'populate_sample_data', '--products', '30', '--customers', '10', '--orders', '55',
+            '--products-per-order', '2', '--batch-size', '20', '--seed', '7', stdout=out,
+        )
+        self.assertEqual(Product.objects.count(), 30)
+        self.assertEqual(Customer.objects.count(), 10)
+        self.assertEqual(Order.objects.count(), 55)
+        self.assertEqual(Order.products.through.objects.count(), 110)
+        self.assertFalse(Product.objects.filter(name='Old product').exists())
+        self.assertIn('rows/s', out.getvalue())
+
+        first = list(Order.objects.order_by('id').values_list('customer_id', 'status'))
+        call_command(
+            'populate_sample_data', '--products', '30', '--customers', '10', '--orders', '55',
+            '--products-per-order', '2', '--seed', '7', stdout=StringIO(),
+        )
+        self.assertEqual(list(Order.objects.order_by('id').values_list('customer_id', 'status')), first)
+
+
+class PopulateSampleDataRerunTest(TransactionTestCase):
+    # every run commits, so foreign keys are checked by the run itself
+
+    def test_runs_twice(self):
+        options = ['--products', '10', '--customers', '5', '--orders', '20', '--seed', '3']
+        call_command('populate_sample_data', *options, stdout=StringIO())
+        self.assertTrue(ProductSales.objects.exists())
+        OrderStatusChange.objects.create(order=Order.objects.first(), from_status='New', to_status='Sent')
+        call_command('populate_sample_data', *options, stdout=StringIO())
+        self.assertEqual(Order.objects.count(), 20)
+        self.assertFalse(OrderStatusChange.objects.exists())
+
+
+class BenchmarkApiCommandTest(TestCase):
+
+    def test_writes_results_and_compares_baseline(self):
+        Product.objects.create(name='Racing Gloves', price=19.99, available=True)
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            call_command(
+                'benchmark_api', '--scenario', 'product_detail', '--scenario', 'token_refresh',
+                '--requests', '3', '--warmup', '1', '--output', output, stdout=StringIO(),
+            )
+            with open(output) as f:
+                results = json.load(f)
+            scenario = results['scenarios']['product_detail']
+            self.assertEqual(scenario['errors'], 0)
+            for key in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps', 'queries_per_request', 'peak_memory_kib'):
+                self.assertIn(key, scenario)
+            self.assertEqual(results['environment']['dataset']['products'], 1)
+
+            baseline = {'scenarios': {'product_detail': dict(scenario, p95_ms=scenario['p95_ms'] / 10)}}
+            self.assertEqual(len(compare(results, baseline, threshold=0.2)), 1)
+            self.assertEqual(compare(results, results, threshold=0.2), [])
+
+    def test_runs_past_the_rate_limits(self):
+        # more anonymous token refreshes than THROTTLE_RATES['anon'] allows in a burst
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            call_command(
+                'benchmark_api', '--scenario', 'token_refresh', '--requests', '40', '--warmup', '5',
+                '--output', output, stdout=StringIO(),
+            )
+            with open(output) as f:
+                self.assertEqual(json.load(f)['scenarios']['token_refresh']['errors'], 0)
+
+
+class BenchmarkPaginationCommandTest(TestCase):
+
+    @override_settings(THROTTLE_RATES={'staff': (1, 0.001), 'read': (1, 0.001)})
+    def test_times_uncached_and_unthrottled_requests(self):
+        customer = Customer.objects.create(name='Lando Norris', address='McLaren Technology Centre')
+        for i in range(3):
+            Product.objects.create(name=f'Racing Gloves {i}', price=19.99, available=True)
+            Order.objects.create(customer=customer, status='New')
+        cache_stats.reset()
+        out = StringIO()
+        call_command('benchmark_pagination', '--page-size', '1', '--depth', '2', '--repeat', '3', stdout=out)
+        self.assertIn('deep page', out.getvalue())
+        self.assertEqual(cache_stats.snapshot()['hits'], 0)
+
+
+class BenchmarkConnectionsCommandTest(TestCase):
+
+    def test_mode_settings(self):
+        none = mode_settings('none', 4)
+        self.assertEqual(none['CONN_MAX_AGE'], 0)
+        self.assertNotIn('pool', none['OPTIONS'])
+        self.assertIsNone(mode_settings('persistent', 4)['CONN_MAX_AGE'])
+        pool = mode_settings('pool', 4)
+        self.assertEqual(pool['CONN_MAX_AGE'], 0)
+        self.assertEqual((pool['OPTIONS']['pool']['min_size'], pool['OPTIONS']['pool']['max_size']), (4, 4))
+
+    def test_pool_needs_postgresql(self):
+        with self.assertRaises(CommandError):
+            call_command('benchmark_connections', '--mode', 'pool', stdout=StringIO())
+
+
+class ExportDataCommandTest(TestCase):
+
+    def test_exports_to_file(self):
+        customer = Customer.objects.create(name='Lando Norris', address='McLaren Technology Centre')
+        order = Order.objects.create(customer=customer, status='New')
+        order.products.add(Product.objects.create(name='Racing Gloves', price=19.99, available=True))
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'orders.ndjson')
+            call_command('export_data', 'orders', '--output', output, stdout=StringIO())
+            with open(output) as f:
+                rows = [json.loads(line) for line in f]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['total_price'], '19.99')
+
+        out = StringIO()
+        call_command('export_data', 'products', '--format', 'csv', stdout=out)
+        self.assertEqual(out.getvalue().splitlines()[0], 'id,name,price,available,stock,updated_at')
+
+        with self.assertRaises(CommandError):
+            call_command('export_data', 'orders', '--since', 'soon', stdout=StringIO())
+
+
+class ImportDataCommandTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_upserts_and_rejects_rows(self):
+        Product.objects.create(id=1, name='Racing Gloves', price=19.99, available=True)
+        path = self.write('products.csv', 'id,name,price,available\n1,Racing Gloves,24.99,False\n2,Helmet,-5,True\n3,Helmet,299.00,True\n')
+        out = StringIO()
+        call_command('import_data', 'products', path, '--batch-size', '2', stdout=out)
+        self.assertIn('2 products imported, 1 rejected', out.getvalue())
+        self.assertEqual(str(Product.objects.get(id=1).price), '24.99')
+        self.assertFalse(Product.objects.get(id=1).available)
+        self.assertTrue(Product.objects.filter(id=3).exists())
+        with open(path + '.rejects.ndjson') as f:
+            rejects = [json.loads(line) for line in f]
+        self.assertEqual(rejects[0]['record'], 2)
+        self.assertEqual(rejects[0]['errors'], {'__all__': ['The price must be a positive value.']})
+        self.assertFalse(os.path.exists(path + '.checkpoint'))
+
+        customer = Customer.objects.create(name='Lando Norris', address='McLaren Technology Centre')
+        path = self.write('orders.ndjson', '\n'.join(json.dumps(row) for row in [
+            {'id': 10, 'customer_id': customer.id, 'status': 'New', 'products': [1, 3]},
+            {'id': 11, 'customer_id': customer.id, 'status': 'Lost', 'products': [1]},
+            {'id': 12, 'customer_id': 999, 'status': 'New', 'products': [1]},
+            {'id': 13, 'customer_id': customer.id, 'status': 'New', 'products': [2]},
+        ]) + '\nnot json\n')
+        call_command('import_data', 'orders', path, stdout=StringIO())
+        self.assertEqual(list(Order.objects.values_list('id', flat=True)), [10])
+        self.assertEqual(set(Order.objects.get(id=10).products.values_list('id', flat=True)), {1, 3})
+        with open(path + '.rejects.ndjson') as f:
+            errors = [json.loads(line)['errors'] for line in f]
+        self.assertEqual([list(error) for error in errors], [['status'], ['customer_id'], ['products'], ['__all__']])
+
+    def test_rejects_missing_and_malformed_prices(self):
+        path = self.write('products.csv', 'id,name,price,available\n1,NoPrice,,True\n2,Helmet,abc,True\n3,Helmet,299.00,True\n')
+        out = StringIO()
+        call_command('import_data', 'products', path, stdout=out)
+        self.assertIn('1 products imported, 2 rejected', out.getvalue())
+        with open(path + '.rejects.ndjson') as f:
+            errors = [json.loads(line)['errors'] for line in f]
+        self.assertEqual([list(error) for error in errors], [['price'], ['price']])
+
+    def test_repeated_ids_in_a_batch_keep_the_last_row(self):
+        path = self.write('products.csv', 'id,name,price,available\n1,Racing Gloves,19.99,True\n1,Racing Gloves,24.99,False\n')
+        with CaptureQueriesContext(connection) as queries:
+            call_command('import_data', 'products', path, stdout=StringIO())
+        product = Product.objects.get(id=1)
+        self.assertEqual((str(product.price), product.available), ('24.99', False))
+        [insert] = [query['sql'] for query in queries if query['sql'].startswith('INSERT INTO "myapp_product"')]
+        self.assertEqual(insert.count('24.99'), 1)
+        self.assertNotIn('19.99', insert)
+
+    def test_resumes_from_checkpoint(self):
+        path = self.write('products.ndjson', '{"id": 1, "name": "Racing Gloves", "price": "19.99"}\n{"id": 2, "name": "Helmet", "price": "299.00"}\n')
+        with open(path + '.checkpoint', 'w') as f:
+            json.dump({'path': path, 'name': 'products', 'records': 1}, f)
+        out = StringIO()
+        call_command('import_data', 'products', path, stdout=out)
+        self.assertIn('Resuming after record 1.', out.getvalue())
+        self.assertEqual(list(Product.objects.values_list('id', flat=True)), [2])
+
+        with open(path + '.checkpoint', 'w') as f:
+            json.dump({'path': path, 'name': 'orders', 'records': 1}, f)
+        with self.assertRaises(CommandError):
+            call_command('import_data', 'products', path, stdout=StringIO())
+        call_command('import_data', 'products', path, '--restart', stdout=StringIO())
+        self.assertEqual(Product.objects.count(), 2)
+
+
+class BenchmarkSerializationCommandTest(TestCase):
+
+    def test_compares_paths_on_identical_output(self):
+        customer = Customer.objects.create(name='Lando Norris', address='McLaren Technology Centre')
+        order = Order.objects.create(customer=customer, status='New')
+        order.products.add(Product.objects.create(name='Racing Gloves', price=19.99, available=True))
+        out = StringIO()
+        call_command('benchmark_serialization', '--rows', '10', '--repeat', '1', stdout=out)
+        output = out.getvalue()
+        self.assertIn('orders: 1 rows', output)
+        self.assertIn('products: 1 rows', output)
+        self.assertEqual(output.count('identical output'), 2)
+        self.assertEqual(output.count('speedup'), 2)
+
+
+class BenchmarkPlacementCommandTest(TestCase):
+
+    def test_options_must_be_positive(self):
+        with self.assertRaises(CommandError):
+            call_command('benchmark_placement', '--stock', '0', stdout=StringIO())
+
+
+class RunWorkerCommandTest(TransactionTestCase):
+
+    def test_burst_runs_queued_jobs(self):
+        customer = Customer.objects.create(name='Lando Norris', address='McLaren Technology Centre')
+        order = Order.objects.create(customer=customer, status='New')
+        enqueue('set_status', {'order_ids': [order.pk], 'status': 'Sent'})
+        enqueue('refresh_totals', {'order_ids': [order.pk]})
+        out = StringIO()
+        call_command('run_worker', '--burst', '--workers', '1', '--poll', '0.1', stdout=out)
+        self.assertIn('2 done', out.getvalue())
+        self.assertEqual(Order.objects.get(pk=order.pk).status, 'Sent')
+        self.assertFalse(Job.objects.exclude(status=Job.DONE).exists())
+
+    def test_unknown_queue(self):
+        with self.assertRaises(CommandError):
+            call_command('run_worker', '--queue', 'emails', '--burst', stdout=StringIO())
+
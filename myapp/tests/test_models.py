@@ -1,5 +1,15 @@
-from django.test import TestCase
-from myapp.models import Product, Customer, Order
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from datetime import timedelta
+from decimal import Decimal
+from importlib import import_module
+from django.apps import apps
+
+from myapp.models import Product, Customer, Order, DailyRevenue, StatusCount, ProductSales, Job, OrderStatusChange
+from myapp.jobs import enqueue, claim, execute
+from myapp.tasks import refresh_totals_later
+from myapp.transitions import transition_orders
+from myapp.summaries import rebuild
 from django.core.exceptions import ValidationError
 
 class ProductModelTest(TestCase):
@@ -208,3 +218,264 @@ class OrderModelTest(TestCase):
         order.products.add(self.product2)
         is_fulfilled = order.check_order_fulfillment()
         self.assertFalse(is_fulfilled)
+
+    def test_with_totals_annotates_batch(self):
+        order1 = Order.objects.create(customer=self.customer, status="New")
+        order1.products.add(self.product1, self.product2)
+        order2 = Order.objects.create(customer=self.customer, status="New")
+
+        orders = {order.id: order for order in Order.objects.with_totals()}
+        self.assertEqual(orders[order1.id].products_total, 30.00)
+        self.assertEqual(orders[order2.id].products_total, 0)
+        with self.assertNumQueries(0):
+            self.assertEqual(orders[order1.id].calculate_total_price(), 30.00)
+
+    def test_with_fulfillment_annotates_batch(self):
+        order1 = Order.objects.create(customer=self.customer, status="New")
+        order1.products.add(self.product1)
+        order2 = Order.objects.create(customer=self.customer, status="New")
+        order2.products.add(self.product1, self.product2)
+
+        orders = {order.id: order for order in Order.objects.with_totals().with_fulfillment()}
+        with self.assertNumQueries(0):
+            self.assertTrue(orders[order1.id].check_order_fulfillment())
+            self.assertFalse(orders[order2.id].check_order_fulfillment())
+        self.assertEqual(orders[order2.id].calculate_total_price(), 30.00)
+
+
+class SummaryTablesTest(TestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name='Lando Norris', address='McLaren Technology Centre')
+        self.gloves = Product.objects.create(name='Racing Gloves', price=19.99, available=True)
+        self.helmet = Product.objects.create(name='Helmet', price=299.00, available=True)
+
+    def snapshot(self):
+        return (
+            {row.day: (row.orders, row.revenue) for row in DailyRevenue.objects.all() if row.orders or row.revenue},
+            {row.status: row.orders for row in StatusCount.objects.all() if row.orders},
+            {row.product_id: row.units for row in ProductSales.objects.all() if row.units},
+        )
+
+    def assertMatchesRebuild(self):
+        incremental = self.snapshot()
+        rebuild()
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_incremental_updates_match_rebuild(self):
+        order = Order.objects.create(customer=self.customer, status='New')
+        order.products.add(self.gloves, self.helmet)
+        other = Order.objects.create(customer=self.customer, status='New')
+        other.products.add(self.gloves)
+        self.assertEqual(self.snapshot()[0][order.date_created.date()], (2, Decimal('338.98')))
+        self.assertEqual(self.snapshot()[2], {self.gloves.id: 2, self.helmet.id: 1})
+        self.assertMatchesRebuild()
+
+        order.status = 'Sent'
+        order.date_created -= timedelta(days=1)
+        order.save()
+        self.assertEqual(self.snapshot()[1], {'New': 1, 'Sent': 1})
+        self.assertMatchesRebuild()
+
+        self.gloves.price = Decimal('29.99')
+        self.gloves.save()
+        order.products.remove(self.helmet)
+        self.helmet.order_set.add(other)
+        self.assertMatchesRebuild()
+
+        self.gloves.order_set.clear()
+        other.products.clear()
+        self.assertMatchesRebuild()
+
+        order.products.add(self.helmet)
+        self.helmet.delete()
+        other.delete()
+        self.assertEqual(self.snapshot(), ({order.date_created.date(): (1, Decimal('0.00'))}, {'Sent': 1}, {}))
+        self.assertMatchesRebuild()
+
+    def test_migration_fills_the_tables(self):
+        order = Order.objects.create(customer=self.customer, status='New')
+        order.products.add(self.gloves, self.helmet)
+        Order.objects.create(customer=self.customer, status='Sent').products.add(self.gloves)
+        expected = self.snapshot()
+        # as on a database whose orders predate the summary tables
+        for model in (DailyRevenue, StatusCount, ProductSales):
+            model.objects.all().delete()
+        import_module('myapp.migrations.0009_summaries').rebuild_summaries(apps, None)
+        self.assertEqual(self.snapshot(), expected)
+
+
+class OrderStoredTotalsTest(TestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name='Lando Norris', address='McLaren Technology Centre')
+        self.gloves = Product.objects.create(name='Racing Gloves', price=10.00, available=True)
+        self.helmet = Product.objects.create(name='Helmet', price=20.00, available=True)
+        self.order = Order.objects.create(customer=self.customer, status='New')
+
+    def stored(self, order=None):
+        order = Order.objects.get(pk=(order or self.order).pk)
+        return order.total_price, order.item_count, order.is_fulfillable
+
+    def test_follows_products_changes(self):
+        self.assertEqual(self.stored(), (Decimal('0.00'), 0, True))
+        self.order.products.add(self.gloves, self.helmet)
+        self.assertEqual(self.stored(), (Decimal('30.00'), 2, True))
+        self.assertEqual(self.order.total_price, Decimal('30.00'))
+
+        self.helmet.order_set.remove(self.order)
+        self.assertEqual(self.stored(), (Decimal('10.00'), 1, True))
+        self.helmet.order_set.add(self.order)
+        self.gloves.order_set.clear()
+        self.assertEqual(self.stored(), (Decimal('20.00'), 1, True))
+
+        self.order.products.clear()
+        self.assertEqual(self.stored(), (Decimal('0.00'), 0, True))
+
+    def test_follows_product_price_and_availability(self):
+        other = Order.objects.create(customer=self.customer, status='New')
+        self.order.products.add(self.gloves, self.helmet)
+        other.products.add(self.gloves)
+
+        self.gloves.price = 15.00
+        self.gloves.available = False
+        self.gloves.save()
+        self.assertEqual(self.stored(), (Decimal('35.00'), 2, False))
+        self.assertEqual(self.stored(other), (Decimal('15.00'), 1, False))
+
+        self.gloves.delete()
+        self.assertEqual(self.stored(), (Decimal('20.00'), 1, True))
+        self.assertEqual(self.stored(other), (Decimal('0.00'), 0, True))
+
+    def test_save_does_not_write_back_stale_totals(self):
+        stale = Order.objects.get(pk=self.order.pk)
+        self.order.products.add(self.gloves)
+        stale.status = 'Sent'
+        stale.save()
+        self.assertEqual(self.stored(), (Decimal('10.00'), 1, True))
+
+
+@override_settings(JOB_QUEUES={'default': 4, 'orders': 2}, JOB_RETRY_SECONDS=10)
+class JobQueueTest(TestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name='Lando Norris', address='McLaren Technology Centre')
+        self.orders = [Order.objects.create(customer=self.customer, status='New') for _ in range(3)]
+        self.ids = [order.pk for order in self.orders]
+
+    def test_idempotency_key(self):
+        job = enqueue('set_status', {'order_ids': self.ids, 'status': 'Sent'}, key='warehouse-run-1')
+        self.assertEqual(job.queue, 'orders')
+        self.assertEqual(enqueue('set_status', {'order_ids': [], 'status': 'Sent'}, key='warehouse-run-1'), job)
+        self.assertEqual(Job.objects.count(), 1)
+        with self.assertRaises(ValueError):
+            enqueue('set_status', {'order_ids': self.ids})
+        with self.assertRaises(ValueError):
+            enqueue('unknown')
+
+    def test_claim_respects_queue_limit_and_lease(self):
+        for _ in range(3):
+            enqueue('refresh_totals', {'order_ids': self.ids})
+        self.assertEqual(len(claim('orders', 10, 'worker-1')), 2)
+        # the limit counts the jobs of every worker
+        self.assertEqual(claim('orders', 10, 'worker-2'), [])
+        Job.objects.filter(locked_by='worker-1').update(locked_until=timezone.now() - timedelta(seconds=1))
+        # the abandoned jobs come first, being the oldest
+        jobs = claim('orders', 10, 'worker-2')
+        self.assertEqual([job.attempts for job in jobs], [2, 2])
+
+    def test_execute(self):
+        job = enqueue('set_status', {'order_ids': self.ids[:2], 'status': 'Sent'})
+        [job] = claim('orders', 1, 'worker-1')
+        self.assertEqual(execute(job.pk), Job.DONE)
+        self.assertEqual(Order.objects.filter(status='Sent').count(), 2)
+        self.assertEqual(StatusCount.objects.get(status='Sent').orders, 2)
+        job.refresh_from_db()
+        self.assertIsNotNone(job.finished_at)
+
+    def test_payload_is_checked_when_enqueued(self):
+        for name, payload in (
+            ('set_status', [self.ids, 'Sent']),
+            ('set_status', 'Sent'),
+            ('set_status', {'order_ids': self.ids, 'status': 'Lost'}),
+        ):
+            with self.assertRaisesMessage(ValueError, 'Invalid payload for set_status'):
+                enqueue(name, payload)
+        self.assertFalse(Job.objects.exists())
+
+    def test_retries_then_fails(self):
+        # queued before its status was checked on enqueue
+        Job.objects.create(
+            queue='orders', task='set_status', payload={'order_ids': self.ids, 'status': 'Lost'}, max_attempts=3,
+        )
+        for attempt in range(1, 4):
+            Job.objects.update(run_at=timezone.now())
+            [job] = claim('orders', 1, 'worker-1')
+            started = timezone.now()
+            with self.assertLogs('myapp.jobs', 'ERROR'):
+                status = execute(job.pk)
+            job.refresh_from_db()
+            self.assertIn('Invalid status value', job.last_error)
+            if attempt < 3:
+                self.assertEqual(status, Job.QUEUED)
+                # backoff doubles from JOB_RETRY_SECONDS
+                self.assertGreaterEqual(job.run_at, started + timedelta(seconds=10 * 2 ** (attempt - 1)))
+        self.assertEqual(status, Job.FAILED)
+        self.assertEqual(Order.objects.filter(status='New').count(), 3)
+
+    @override_settings(ORDER_REFRESH_INLINE_LIMIT=2, ORDER_REFRESH_BATCH_SIZE=2)
+    def test_large_fan_outs_are_left_to_the_workers(self):
+        product = Product.objects.create(name='Racing Gloves', price=Decimal('19.99'), available=True)
+        product.order_set.add(*self.orders)
+        product.price = Decimal('29.99')
+        product.save()
+        self.assertEqual(Order.objects.get(pk=self.ids[0]).total_price, Decimal('19.99'))
+        self.assertEqual(Job.objects.filter(task='refresh_totals').count(), 2)
+        for job in claim('orders', 2, 'worker-1'):
+            execute(job.pk)
+        self.assertEqual(set(Order.objects.values_list('total_price', flat=True)), {Decimal('29.99')})
+        self.assertEqual(refresh_totals_later(Order.objects.filter(pk=self.ids[0])), 1)
+        self.assertEqual(Job.objects.count(), 2)
+
+
+class OrderStatusTransitionTest(TestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name='Lando Norris', address='McLaren Technology Centre')
+
+    def test_default_status_is_a_choice(self):
+        order = Order.objects.create(customer=self.customer)
+        self.assertEqual(order.status, 'New')
+        order.full_clean()
+
+    def test_clean_checks_the_transition(self):
+        order = Order.objects.create(customer=self.customer, status='Sent')
+        order.status = 'New'
+        with self.assertRaisesMessage(ValidationError, "Cannot change the status from 'Sent' to 'New'"):
+            order.full_clean()
+        order.status = 'Completed'
+        order.full_clean()
+        self.assertEqual(Order.sources('Sent'), ['New', 'In Process'])
+
+    def test_saves_are_recorded(self):
+        order = Order.objects.create(customer=self.customer)
+        order.status = 'In Process'
+        order.save()
+        order.save()
+        change = OrderStatusChange.objects.get()
+        self.assertEqual((change.order, change.from_status, change.to_status), (order, 'New', 'In Process'))
+
+    def test_transition_orders(self):
+        orders = [Order.objects.create(customer=self.customer, status=status) for status in ('New', 'In Process', 'Completed')]
+        current, moved = transition_orders(Order.objects.all(), 'Sent')
+        self.assertEqual(moved, [orders[0].pk, orders[1].pk])
+        self.assertEqual(current[orders[2].pk], 'Completed')
+        self.assertEqual(list(Order.objects.order_by('pk').values_list('status', flat=True)), ['Sent', 'Sent', 'Completed'])
+        self.assertEqual(
+            sorted(OrderStatusChange.objects.values_list('from_status', 'to_status')),
+            [('In Process', 'Sent'), ('New', 'Sent')],
+        )
+        self.assertEqual(
+            {row.status: row.orders for row in StatusCount.objects.all() if row.orders}, {'Sent': 2, 'Completed': 1}
+        )
+
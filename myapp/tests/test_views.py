@@ -1,9 +1,30 @@
-from rest_framework.test import APITestCase, APIClient
+from rest_framework.test import APITestCase, APITransactionTestCase, APIClient, APIRequestFactory
 from rest_framework import status
 from django.urls import reverse
-from myapp.models import Product, Customer, Order
+from myapp.models import Product, Customer, Order, OrderStatusChange
 from django.contrib.auth.models import User
 from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework.request import Request
+from myapp.pagination import IdCursorPagination
+from myapp.cache import stats as cache_stats
+from django.core.cache import caches
+from django.test import override_settings, RequestFactory, SimpleTestCase, AsyncClient
+from asgiref.sync import async_to_sync
+import json
+from decimal import Decimal
+from django.http import HttpResponse
+from myapp.routers import ReplicaRouter, ReplicaRoutingMiddleware
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, connections
+from myapp.instrumentation import Histogram, reset_metrics
+from myapp.authentication import deny_token, tokens_for_user, users as cached_users
+from myapp.throttling import local_buckets, monitor
+from myapp.placement import place_order
+from django.core.management import call_command
+from io import StringIO
+from django.conf import settings
+import subprocess
+import sys
 
 class ProductApiTest(APITestCase):
     def setUp(self):
@@ -27,20 +48,20 @@ class ProductApiTest(APITestCase):
         self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
         response = self.client.get(self.product_list_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['name'], 'Temporary Product')
-        self.assertEqual(response.data[0]['price'], '1.99')
-        self.assertTrue(response.data[0]['available'])
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['name'], 'Temporary Product')
+        self.assertEqual(response.data['results'][0]['price'], '1.99')
+        self.assertTrue(response.data['results'][0]['available'])
 
         # admin
         self.token = str(AccessToken.for_user(self.admin_user))
         self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
         response = self.client.get(self.product_list_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['name'], 'Temporary Product')
-        self.assertEqual(response.data[0]['price'], '1.99')
-        self.assertTrue(response.data[0]['available'])
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['name'], 'Temporary Product')
+        self.assertEqual(response.data['results'][0]['price'], '1.99')
+        self.assertTrue(response.data['results'][0]['available'])
 
 
     def test_get_single_product(self):
@@ -139,4 +160,1179 @@ class ProductApiTest(APITestCase):
         # missing 'name'
         data = {"price": 10.00, "available": True}
         response = self.client.post(self.product_list_url, data, format='json')
-        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class PaginationApiTest(APITestCase):
+    def setUp(self):
+        Product.objects.bulk_create(
+            Product(name=f"Product {i}", price=1.99, available=True) for i in range(5)
+        )
+        self.regular_user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client = APIClient()
+        self.token = str(AccessToken.for_user(self.regular_user))
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+
+    def test_page_size_and_cursor(self):
+        response = self.client.get(reverse('product-list'), {'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([p['name'] for p in response.data['results']], ["Product 0", "Product 1"])
+        self.assertIsNone(response.data['previous'])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual([p['name'] for p in response.data['results']], ["Product 2", "Product 3"])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual([p['name'] for p in response.data['results']], ["Product 4"])
+        self.assertIsNone(response.data['next'])
+
+    def test_page_size_is_capped(self):
+        request = Request(APIRequestFactory().get(reverse('product-list'), {'page_size': 100000}))
+        paginator = IdCursorPagination()
+        self.assertEqual(paginator.get_page_size(request), paginator.max_page_size)
+
+    def test_orders_newest_first(self):
+        customer = Customer.objects.create(name="John Doe", address="123 Main St")
+        first = Order.objects.create(customer=customer, status="New")
+        second = Order.objects.create(customer=customer, status="New")
+        response = self.client.get(reverse('order-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([o['id'] for o in response.data['results']], [second.id, first.id])
+
+
+class OrderQueryCountTest(APITestCase):
+    def setUp(self):
+        self.customer = Customer.objects.create(name="John Doe", address="123 Main St")
+        self.products = [
+            Product.objects.create(name=f"Product {i}", price=10.00, available=True) for i in range(3)
+        ]
+        self.regular_user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client = APIClient()
+        self.token = str(tokens_for_user(self.regular_user).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+
+    def create_orders(self, count):
+        for _ in range(count):
+            order = Order.objects.create(customer=self.customer, status="New")
+            order.products.add(*self.products)
+
+    def test_order_list_query_count_is_constant(self):
+        # orders joined with customer, prefetched products
+        self.create_orders(2)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('order-list'))
+        self.assertEqual(len(response.data['results']), 2)
+
+        self.create_orders(20)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('order-list'))
+        self.assertEqual(len(response.data['results']), 22)
+        self.assertEqual(len(response.data['results'][0]['products']), 3)
+
+    def test_order_detail_query_count(self):
+        self.create_orders(1)
+        order = Order.objects.get()
+        # Last-Modified, order joined with customer, prefetched products
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('order-detail', kwargs={'pk': order.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(response.data['products']), sorted(p.id for p in self.products))
+
+    def test_order_total_and_fulfillment_fields(self):
+        self.create_orders(1)
+        order = Order.objects.get()
+        response = self.client.get(reverse('order-detail', kwargs={'pk': order.id}))
+        self.assertEqual(response.data['total_price'], '30.00')
+        self.assertTrue(response.data['is_fulfillable'])
+
+        admin_user = User.objects.create_superuser(username="testadmin", password="adminpassword")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(admin_user)}")
+        unavailable = Product.objects.create(name="Unavailable", price=5.00, available=False)
+        response = self.client.patch(
+            reverse('order-detail', kwargs={'pk': order.id}),
+            {'products': [self.products[0].id, unavailable.id]},
+            format='json',
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_price'], '15.00')
+        self.assertFalse(response.data['is_fulfillable'])
+
+
+class BulkApiTest(APITestCase):
+    def setUp(self):
+        self.customer = Customer.objects.create(name="John Doe", address="123 Main St")
+        self.product = Product.objects.create(name="Existing", price=5.00, available=True)
+        self.bulk_products_url = reverse('product-bulk')
+        self.bulk_orders_url = reverse('order-bulk')
+
+        self.regular_user = User.objects.create_user(username="testuser", password="testpassword")
+        self.admin_user = User.objects.create_superuser(username="testadmin", password="adminpassword")
+        self.client = APIClient()
+        self.token = str(AccessToken.for_user(self.admin_user))
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+
+    def test_bulk_create_products(self):
+        data = [{"name": f"Product {i}", "price": "2.50", "available": True} for i in range(50)]
+        response = self.client.post(self.bulk_products_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data), 50)
+        self.assertEqual(response.data[0]['name'], "Product 0")
+        self.assertEqual(Product.objects.count(), 51)
+
+    def test_bulk_create_reports_errors_per_item(self):
+        data = [
+            {"name": "Valid", "price": "2.50"},
+            {"name": "Free", "price": "0.00"},
+            {"price": "1.00"},
+        ]
+        response = self.client.post(self.bulk_products_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('price', response.data[1])
+        self.assertIn('name', response.data[2])
+        self.assertEqual(Product.objects.count(), 1)
+
+    def test_bulk_requires_admin(self):
+        self.token = str(AccessToken.for_user(self.regular_user))
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        response = self.client.post(self.bulk_products_url, [{"name": "A", "price": "1.00"}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_bulk_update_products(self):
+        other = Product.objects.create(name="Other", price=1.00, available=True)
+        data = [
+            {"id": self.product.id, "price": "7.00"},
+            {"id": other.id, "available": False},
+        ]
+        response = self.client.patch(self.bulk_products_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.product.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.product.price, 7)
+        self.assertFalse(other.available)
+        self.assertEqual(other.price, 1)
+
+    def test_bulk_update_unknown_id(self):
+        data = [{"id": self.product.id, "price": "7.00"}, {"id": 9999, "price": "1.00"}]
+        response = self.client.patch(self.bulk_products_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('id', response.data[1])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.price, 5)
+
+    def test_bulk_delete_products(self):
+        other = Product.objects.create(name="Other", price=1.00, available=True)
+        response = self.client.delete(self.bulk_products_url, [self.product.id, 9999], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Product.objects.count(), 2)
+
+        response = self.client.delete(self.bulk_products_url, [self.product.id, other.id], format='json')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(Product.objects.count(), 0)
+
+    def test_bulk_create_orders_with_products(self):
+        other = Product.objects.create(name="Other", price=1.00, available=False)
+        data = [
+            {"customer": self.customer.id, "status": "New", "products": [self.product.id, other.id]}
+            for _ in range(20)
+        ]
+        # auth user, customers, products, 2 savepoints, order insert, through insert, stored totals,
+        # summaries (3 reads, 3 upserts), 2 releases, reload (orders + products) -- independent of the batch size
+        with self.assertNumQueries(18):
+            response = self.client.post(self.bulk_orders_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Order.objects.count(), 20)
+        self.assertEqual(response.data[0]['total_price'], '6.00')
+        self.assertFalse(response.data[0]['is_fulfillable'])
+
+    def test_bulk_create_orders_unknown_product(self):
+        data = [
+            {"customer": self.customer.id, "status": "New", "products": [self.product.id]},
+            {"customer": self.customer.id, "status": "New", "products": [9999]},
+        ]
+        response = self.client.post(self.bulk_orders_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('products', response.data[1])
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_bulk_update_order_products(self):
+        order = Order.objects.create(customer=self.customer, status="New")
+        order.products.add(self.product)
+        other = Product.objects.create(name="Other", price=1.00, available=True)
+        data = [{"id": order.id, "status": "Sent", "products": [other.id]}]
+        response = self.client.patch(self.bulk_orders_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        order.refresh_from_db()
+        self.assertEqual(order.status, "Sent")
+        self.assertEqual(list(order.products.all()), [other])
+        self.assertEqual(response.data[0]['total_price'], '1.00')
+
+
+class ProductSearchApiTest(APITestCase):
+    def setUp(self):
+        for name in ["Racing Gloves", "Racing Suit", "Helmet", "Gloves for racing"]:
+            Product.objects.create(name=name, price=1.99, available=True)
+        self.regular_user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client = APIClient()
+        self.token = str(AccessToken.for_user(self.regular_user))
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+
+    def test_search_matches_word_prefixes(self):
+        response = self.client.get(reverse('product-list'), {'search': 'rac glo'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            sorted(p['name'] for p in response.data['results']),
+            ["Gloves for racing", "Racing Gloves"],
+        )
+
+        response = self.client.get(reverse('product-list'), {'search': 'elmet'})
+        self.assertEqual(response.data['results'], [])
+
+    def test_ranked_search(self):
+        response = self.client.get(reverse('product-search'), {'q': 'rac', 'limit': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([p['name'] for p in response.data], ["Racing Gloves", "Racing Suit"])
+
+    def test_ranked_search_ignores_punctuation(self):
+        response = self.client.get(reverse('product-search'), {'q': "'&|!:*"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [])
+
+
+class CachedResponseApiTest(APITestCase):
+    def setUp(self):
+        caches['api'].clear()
+        cache_stats.reset()
+        self.product = Product.objects.create(name="Temporary Product", price=1.99, available=True)
+        self.product_list_url = reverse('product-list')
+        self.product_detail_url = reverse('product-detail', kwargs={'pk': self.product.id})
+        self.regular_user = User.objects.create_user(username="testuser", password="testpassword")
+        self.admin_user = User.objects.create_superuser(username="testadmin", password="adminpassword")
+        self.client = APIClient()
+        self.token = str(tokens_for_user(self.regular_user).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+
+    def test_second_read_is_served_from_cache(self):
+        response = self.client.get(self.product_detail_url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        # only the Last-Modified lookup remains
+        with self.assertNumQueries(1):
+            response = self.client.get(self.product_detail_url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.data['price'], '1.99')
+
+        self.client.get(self.product_list_url)
+        response = self.client.get(self.product_list_url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.data['results'][0]['name'], 'Temporary Product')
+
+    def test_save_invalidates_detail_and_list(self):
+        self.client.get(self.product_detail_url)
+        self.client.get(self.product_list_url)
+        self.product.price = 2.99
+        self.product.save()
+
+        response = self.client.get(self.product_detail_url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['price'], '2.99')
+        response = self.client.get(self.product_list_url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][0]['price'], '2.99')
+
+    def test_other_objects_stay_cached(self):
+        other = Product.objects.create(name="Other", price=5.00, available=True)
+        self.client.get(self.product_detail_url)
+        other.price = 6.00
+        other.save()
+        response = self.client.get(self.product_detail_url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+    def test_bulk_update_and_delete_invalidate(self):
+        self.client.get(self.product_detail_url)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.admin_user)}")
+        self.client.patch(reverse('product-bulk'), [{"id": self.product.id, "price": "3.50"}], format='json')
+        response = self.client.get(self.product_detail_url)
+        self.assertEqual(response.data['price'], '3.50')
+
+        self.client.delete(reverse('product-bulk'), [self.product.id], format='json')
+        response = self.client.get(self.product_detail_url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cache_stats(self):
+        self.client.get(self.product_detail_url)
+        self.client.get(self.product_detail_url)
+        response = self.client.get(reverse('cache_stats'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.admin_user)}")
+        response = self.client.get(reverse('cache_stats'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['hits'], 1)
+        self.assertEqual(response.data['misses'], 1)
+
+
+class ConditionalGetApiTest(APITestCase):
+    def setUp(self):
+        caches['api'].clear()
+        self.customer = Customer.objects.create(name="John Doe", address="123 Main St")
+        self.product = Product.objects.create(name="Temporary Product", price=1.99, available=True)
+        self.order = Order.objects.create(customer=self.customer, status="New")
+        self.order.products.add(self.product)
+        self.regular_user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client = APIClient()
+        self.token = str(AccessToken.for_user(self.regular_user))
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+
+    def test_detail_not_modified(self):
+        url = reverse('product-detail', kwargs={'pk': self.product.id})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('Last-Modified', response)
+        etag = response['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.product.price = 2.99
+        self.product.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_list_not_modified(self):
+        url = reverse('product-list')
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Product.objects.create(name="New Product", price=1.00, available=True)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_order_etag_follows_products(self):
+        url = reverse('order-detail', kwargs={'pk': self.order.id})
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.product.price = 5.00
+        self.product.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_price'], '5.00')
+
+        etag = response['ETag']
+        self.order.products.clear()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['products'], [])
+
+        list_etag = self.client.get(reverse('order-list'))['ETag']
+        self.product.price = 6.00
+        self.product.save()
+        response = self.client.get(reverse('order-list'), HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_missing_object_is_not_found(self):
+        response = self.client.get(reverse('order-detail', kwargs={'pk': 9999}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class InstrumentationTest(APITestCase):
+    def setUp(self):
+        reset_metrics()
+        Product.objects.create(name="Racing Gloves", price=19.99, available=True)
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('product-list'))
+        timings = dict(part.split(';', 1) for part in response['Server-Timing'].split(', '))
+        self.assertEqual(set(timings), {'db', 'view', 'serialize', 'total'})
+        self.assertIn('desc="2 queries"', timings['db'])
+
+    @override_settings(SLOW_REQUEST_MS=0)
+    def test_slow_requests_are_logged_with_their_queries(self):
+        with self.assertLogs('myapp.instrumentation', 'WARNING') as logs:
+            self.client.get(reverse('product-list'))
+        self.assertIn('GET /api/products/ 200', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('product-list'))
+        self.client.get(reverse('product-list'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.content.decode()
+        self.assertIn('http_request_duration_seconds_count{route="product-list",method="GET"} 2', body)
+        self.assertIn('http_request_db_queries_bucket{route="product-list",method="GET",le="2"} 2', body)
+
+    def test_metrics_endpoint_is_local_only(self):
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='203.0.113.7')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram('latency', 'Latency.', (0.1, 1.0), ('route',))
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(('home',), value)
+        lines = histogram.render()
+        self.assertIn('latency_bucket{route="home",le="0.1"} 2', lines)
+        self.assertIn('latency_bucket{route="home",le="1.0"} 3', lines)
+        self.assertIn('latency_bucket{route="home",le="+Inf"} 4', lines)
+        self.assertIn('latency_count{route="home"} 4', lines)
+
+
+class ClaimsAuthenticationTest(APITestCase):
+    def setUp(self):
+        caches['auth'].clear()
+        self.addCleanup(caches['auth'].clear)
+        self.product = Product.objects.create(name="Racing Gloves", price=19.99, available=True)
+        self.regular_user = User.objects.create_user(username="testuser", password="testpassword")
+        self.admin_user = User.objects.create_superuser(username="testadmin", password="adminpassword")
+
+    def authenticate(self, user):
+        refresh = tokens_for_user(user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+        return refresh
+
+    def test_token_obtain_includes_claims(self):
+        response = self.client.post(
+            reverse('token_obtain_pair'), {'username': 'testadmin', 'password': 'adminpassword'}, format='json'
+        )
+        token = AccessToken(response.data['access'])
+        self.assertEqual(token['username'], 'testadmin')
+        self.assertTrue(token['is_staff'])
+
+    def test_reads_do_not_look_up_the_user(self):
+        self.authenticate(self.regular_user)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('product-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_permission_is_decided_from_claims(self):
+        self.authenticate(self.regular_user)
+        with self.assertNumQueries(0):
+            response = self.client.delete(reverse('product-detail', kwargs={'pk': self.product.id}))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.authenticate(self.admin_user)
+        response = self.client.delete(reverse('product-detail', kwargs={'pk': self.product.id}))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_tokens_without_claims_use_the_user_cache(self):
+        cached_users.clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.regular_user)}")
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('product-list'))
+            self.client.get(reverse('customer-list'))
+        user_lookups = [query for query in queries.captured_queries if 'auth_user' in query['sql']]
+        self.assertEqual(len(user_lookups), 1)
+
+    def test_refresh_reads_current_claims(self):
+        refresh = self.authenticate(self.regular_user)
+        self.regular_user.username = "renameduser"
+        self.regular_user.save()
+        response = self.client.post(reverse('token_refresh'), {'refresh': str(refresh)}, format='json')
+        self.assertEqual(AccessToken(response.data['access'])['username'], "renameduser")
+
+    def test_changing_staff_status_revokes_tokens(self):
+        admin = self.admin_user
+        refresh = self.authenticate(admin)
+        data = {'name': 'Gloves', 'price': '9.99', 'available': True}
+        self.assertEqual(self.client.post(reverse('product-list'), data).status_code, status.HTTP_201_CREATED)
+
+        admin.is_staff = admin.is_superuser = False
+        admin.save()
+        response = self.client.post(reverse('product-list'), data)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.client.post(reverse('token_refresh'), {'refresh': str(refresh)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revoked_tokens_are_rejected(self):
+        refresh = self.authenticate(self.regular_user)
+        response = self.client.post(reverse('token_revoke'), {'refresh': str(refresh)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        response = self.client.get(reverse('product-list'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.client.post(reverse('token_refresh'), {'refresh': str(refresh)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revocations_reach_other_processes(self):
+        access = tokens_for_user(self.regular_user).access_token
+        deny_token(access)
+        # another worker process, with a cache instance of its own
+        script = (
+            'import sys, django; django.setup()\n'
+            'from rest_framework_simplejwt.tokens import AccessToken\n'
+            'from myapp.authentication import check_not_denied\n'
+            'check_not_denied(AccessToken(sys.argv[1]))\n'
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', script, str(access)], cwd=settings.BASE_DIR, capture_output=True, text=True,
+        )
+        self.assertIn('Token has been revoked', result.stderr)
+
+    def test_deactivating_a_user_revokes_their_tokens(self):
+        self.authenticate(self.regular_user)
+        self.regular_user.is_active = False
+        self.regular_user.save()
+        response = self.client.get(reverse('product-list'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'])
+class ReplicaRoutingTest(SimpleTestCase):
+    def setUp(self):
+        caches['api'].clear()
+        self.factory = RequestFactory()
+        self.router = ReplicaRouter()
+        self.middleware = ReplicaRoutingMiddleware(self.route_reads)
+
+    def route_reads(self, request):
+        self.read_from = self.router.db_for_read(Product)
+        return HttpResponse(status=201 if request.method == 'POST' else 200)
+
+    def request(self, method, path='/api/products/', user_id=1):
+        # tokens for users that need not exist, as the routing only reads the user id
+        token = AccessToken()
+        token['user_id'] = user_id
+        request = getattr(self.factory, method)(path, HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.response = self.middleware(request)
+        return self.read_from
+
+    def test_reads_alternate_between_replicas(self):
+        reads = [self.request('get'), self.request('head'), self.request('get')]
+        self.assertEqual(sorted(reads[:2]), ['replica1', 'replica2'])
+        self.assertEqual(reads[2], reads[0])
+
+    def test_writes_and_other_paths_use_the_primary(self):
+        self.assertEqual(self.request('post'), 'default')
+        self.assertEqual(self.request('get', path='/admin/'), 'default')
+        self.assertEqual(self.router.db_for_write(Product), 'default')
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+
+    def test_client_sticks_to_the_primary_after_a_write(self):
+        self.request('post', user_id=1)
+        self.assertIn('replica_sticky', self.response.cookies)
+        # a new token of the same user, e.g. after a refresh
+        self.assertEqual(self.request('get', user_id=1), 'default')
+        self.assertIn(self.request('get', user_id=2), ['replica1', 'replica2'])
+
+        with override_settings(REPLICA_STICKY_SECONDS=0):
+            self.request('post', user_id=3)
+        self.assertIn(self.request('get', user_id=3), ['replica1', 'replica2'])
+
+    def test_sticky_cookie(self):
+        request = self.factory.get('/api/products/')
+        request.COOKIES['replica_sticky'] = '1'
+        self.middleware(request)
+        self.assertEqual(self.read_from, 'default')
+
+    def test_replicas_are_not_migrated(self):
+        self.assertFalse(self.router.allow_migrate('replica1', 'myapp'))
+        self.assertTrue(self.router.allow_migrate('default', 'myapp'))
+
+
+# a second database standing in for a lagging replica: rows only get there when copied. It
+# is added before the test databases are set up, so the runner creates and migrates it.
+REPLICA = 'replica_test'
+connections.settings[REPLICA] = connections.configure_settings({
+    **connections.settings, REPLICA: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ''},
+})[REPLICA]
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA])
+class ReplicaDatabaseTest(APITransactionTestCase):
+    databases = {'default', REPLICA}
+
+    def setUp(self):
+        caches['api'].clear()
+        self.admin = User.objects.create_superuser(username="testadmin", password="adminpassword")
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.product = Product.objects.create(name="Racing Gloves", price=Decimal('10.00'), available=True)
+        self.replicate(self.product)
+        self.order = Order.objects.create(customer=Customer.objects.create(name="Jan Kowalski"))
+
+    def replicate(self, instance):
+        model = type(instance)
+        fields = {field.attname: getattr(instance, field.attname) for field in model._meta.concrete_fields}
+        model.objects.using(REPLICA).bulk_create([model(**fields)])
+
+    def client_for(self, user):
+        # a client of its own, without the cookie another client got
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(user).access_token}")
+        return client
+
+    def test_cache_is_filled_from_the_primary(self):
+        url = reverse('product-detail', args=[self.product.id])
+        self.client_for(self.admin).patch(url, {'price': '20.00'}, format='json')
+
+        # another client, whose uncached reads go to the replica
+        reader = self.client_for(self.user)
+        response = reader.get(reverse('order-list'))
+        self.assertEqual(response.data['results'], [])
+        self.assertNotIn('ETag', response)
+
+        response = reader.get(url)
+        self.assertEqual((response.data['price'], response['X-Cache']), ('20.00', 'MISS'))
+        response = reader.get(url)
+        self.assertEqual((response.data['price'], response['X-Cache']), ('20.00', 'HIT'))
+
+    def test_writer_reads_the_primary_with_a_refreshed_token(self):
+        url = reverse('product-detail', args=[self.product.id])
+        self.client_for(self.admin).patch(url, {'price': '20.00'}, format='json')
+
+        response = self.client_for(self.admin).get(reverse('order-list'))
+        self.assertEqual([order['id'] for order in response.data['results']], [self.order.id])
+        response = self.client_for(self.user).get(reverse('order-list'))
+        self.assertEqual(response.data['results'], [])
+
+
+class AsyncReadViewTest(APITestCase):
+    def setUp(self):
+        caches['api'].clear()
+        self.products = [
+            Product.objects.create(name=f"Product {i}", price=10 + i, available=i != 2) for i in range(3)
+        ]
+        customer = Customer.objects.create(name="John Doe", address="123 Main St")
+        self.order = Order.objects.create(customer=customer, status="New")
+        self.order.products.add(*self.products)
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.token = str(tokens_for_user(self.user).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+
+    def async_get(self, path, token=None):
+        headers = {'Authorization': f'Bearer {token or self.token}'} if token is not False else {}
+
+        async def get():
+            response = await AsyncClient().get(path, headers=headers)
+            if response.streaming:
+                return response, b''.join([chunk async for chunk in response.streaming_content])
+            return response, response.content
+
+        response, content = async_to_sync(get)()
+        return response, json.loads(content)
+
+    def test_product_list_matches_sync_viewset(self):
+        expected = self.client.get(reverse('product-list'), {'page_size': 2}).data
+        response, data = self.async_get(reverse('async-product-list') + '?page_size=2')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(data['results'], json.loads(json.dumps(expected['results'])))
+        self.assertIsNone(data['previous'])
+
+        expected = self.client.get(expected['next']).data
+        response, data = self.async_get(data['next'])
+        self.assertEqual([product['id'] for product in data['results']], [self.products[2].id])
+        self.assertEqual(data['results'], json.loads(json.dumps(expected['results'])))
+
+    def test_order_detail_matches_sync_viewset(self):
+        expected = self.client.get(reverse('order-detail', kwargs={'pk': self.order.id})).data
+        response, data = self.async_get(reverse('async-order-detail', kwargs={'pk': self.order.id}))
+        self.assertEqual(data, json.loads(json.dumps(expected)))
+        self.assertEqual(data['total_price'], '33.00')
+        self.assertFalse(data['is_fulfillable'])
+
+        response, data = self.async_get(reverse('async-order-list'))
+        self.assertEqual(data['results'][0]['id'], self.order.id)
+
+    def test_authentication_and_missing_objects(self):
+        response, data = self.async_get(reverse('async-product-list'), token=False)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer realm="api"')
+
+        response, data = self.async_get(reverse('async-product-list'), token='not-a-token')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        response, data = self.async_get(reverse('async-product-detail', kwargs={'pk': 999}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(data, {'detail': 'No Product matches the given query.'})
+
+
+class ExportApiTest(APITestCase):
+    def setUp(self):
+        self.products = [
+            Product.objects.create(name=f"Product {i}", price=10 + i, available=True) for i in range(2)
+        ]
+        customer = Customer.objects.create(name="John Doe", address="123 Main St")
+        self.old_order = Order.objects.create(customer=customer, status="Completed")
+        Order.objects.filter(pk=self.old_order.pk).update(date_created='2024-01-01T10:00:00Z')
+        self.old_order.products.add(self.products[0])
+        self.new_order = Order.objects.create(customer=customer, status="New")
+        self.new_order.products.add(*self.products)
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(self.user).access_token}")
+
+    def export(self, name, **params):
+        response = self.client.get(reverse(f'{name}-export'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_orders_as_ndjson(self):
+        response, body = self.export('order')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([row['id'] for row in rows], [self.old_order.id, self.new_order.id])
+        self.assertEqual(rows[1]['customer_name'], 'John Doe')
+        self.assertEqual(rows[1]['total_price'], '21.00')
+        self.assertEqual(rows[1]['products'], [product.id for product in self.products])
+
+    def test_orders_as_csv_since(self):
+        response, body = self.export('order', format='csv', since='2025-01-01')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="orders.csv"')
+        lines = body.splitlines()
+        self.assertEqual(lines[0], 'id,customer_id,customer_name,status,date_created,updated_at,total_price,products')
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith(f'{self.new_order.id},'))
+        self.assertTrue(lines[1].endswith(f',21.00,{self.products[0].id} {self.products[1].id}'))
+
+    def test_products_export(self):
+        response, body = self.export('product', format='csv')
+        self.assertEqual(body.splitlines()[1].split(',')[:4], [str(self.products[0].id), 'Product 0', '10.00', 'True'])
+
+    def test_invalid_since(self):
+        response = self.client.get(reverse('order-export'), {'since': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class SummaryApiTest(APITestCase):
+    def setUp(self):
+        self.products = [
+            Product.objects.create(name=f"Product {i}", price=10 + i, available=True) for i in range(2)
+        ]
+        customer = Customer.objects.create(name="John Doe", address="123 Main St")
+        old_order = Order.objects.create(customer=customer, status="Completed")
+        old_order.products.add(self.products[0])
+        Order.objects.filter(pk=old_order.pk).update(date_created='2024-01-01T10:00:00Z')
+        new_order = Order.objects.create(customer=customer, status="New")
+        new_order.products.add(*self.products)
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(self.user).access_token}")
+
+    def test_revenue(self):
+        # the date was moved with update(), which the summaries only see after a rebuild
+        call_command('rebuild_summaries', stdout=StringIO())
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('summary_revenue'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0], {'day': '2024-01-01', 'orders': 1, 'revenue': '10.00'})
+        self.assertEqual(response.data[1]['revenue'], '21.00')
+
+        response = self.client.get(reverse('summary_revenue'), {'since': '2025-01-01'})
+        self.assertEqual(len(response.data), 1)
+        response = self.client.get(reverse('summary_revenue'), {'until': 'soon'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_statuses_and_top_products(self):
+        response = self.client.get(reverse('summary_statuses'))
+        self.assertEqual(response.data, {'New': 1, 'In Process': 0, 'Sent': 0, 'Completed': 1})
+
+        response = self.client.get(reverse('summary_products'), {'limit': 1})
+        self.assertEqual(response.data, [
+            {'product': self.products[0].id, 'name': 'Product 0', 'units': 2, 'revenue': '20.00'},
+        ])
+
+    def test_read_only(self):
+        response = self.client.post(reverse('summary_statuses'), {})
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+class OrderFilterApiTest(APITestCase):
+    def setUp(self):
+        cheap = Product.objects.create(name="Cap", price=5.00, available=True)
+        dear = Product.objects.create(name="Helmet", price=300.00, available=False)
+        customer = Customer.objects.create(name="John Doe", address="123 Main St")
+        self.orders = [Order.objects.create(customer=customer, status="New") for _ in range(3)]
+        self.orders[0].products.add(cheap)
+        self.orders[1].products.add(cheap, dear)
+        self.orders[2].products.add(dear)
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(self.user).access_token}")
+
+    def ids(self, **params):
+        response = self.client.get(reverse('order-list'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [order['id'] for order in response.data['results']]
+
+    def test_filters_on_stored_totals(self):
+        first, second, third = (order.id for order in self.orders)
+        self.assertEqual(set(self.ids(total_price__gte='300')), {second, third})
+        self.assertEqual(self.ids(total_price__lte='100'), [first])
+        self.assertEqual(set(self.ids(is_fulfillable='false')), {second, third})
+        self.assertEqual(self.ids(item_count__gte=2), [second])
+
+        response = self.client.get(reverse('order-list'), {'total_price__gte': 'a lot'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('total_price__gte', response.data)
+
+    def test_ordering(self):
+        first, second, third = (order.id for order in self.orders)
+        self.assertEqual(self.ids(ordering='-total_price'), [second, third, first])
+        self.assertEqual(self.ids(ordering='total_price', page_size=1), [first])
+
+class FilterOrderingApiTest(APITestCase):
+    def setUp(self):
+        self.gloves = Product.objects.create(name="Racing Gloves", price=19.99, available=True)
+        self.helmet = Product.objects.create(name="Helmet", price=299.00, available=False)
+        self.lando = Customer.objects.create(name="Lando Norris", address="McLaren Technology Centre")
+        self.lewis = Customer.objects.create(name="Lewis Hamilton", address="Mercedes")
+        self.old_order = Order.objects.create(customer=self.lando, status="Completed")
+        Order.objects.filter(pk=self.old_order.pk).update(date_created='2024-01-01T10:00:00Z')
+        self.new_order = Order.objects.create(customer=self.lewis, status="New")
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(self.user).access_token}")
+
+    def ids(self, name, **params):
+        response = self.client.get(reverse(f'{name}-list'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['id'] for item in response.data['results']]
+
+    def test_products(self):
+        self.assertEqual(self.ids('product', available='true'), [self.gloves.id])
+        self.assertEqual(self.ids('product', price__gte='100'), [self.helmet.id])
+        self.assertEqual(self.ids('product', price__lte='100', available='false'), [])
+        self.assertEqual(self.ids('product', ordering='name'), [self.helmet.id, self.gloves.id])
+        self.assertEqual(self.ids('product', ordering='-price'), [self.helmet.id, self.gloves.id])
+
+    def test_customers(self):
+        self.assertEqual(self.ids('customer', name__istartswith='le'), [self.lewis.id])
+        self.assertEqual(self.ids('customer', ordering='-name'), [self.lewis.id, self.lando.id])
+
+    def test_orders(self):
+        self.assertEqual(self.ids('order', status='Completed'), [self.old_order.id])
+        self.assertEqual(self.ids('order', customer=self.lewis.id), [self.new_order.id])
+        self.assertEqual(self.ids('order', date_created__lte='2024-06-01'), [self.old_order.id])
+        self.assertEqual(self.ids('order', date_created__gte='2024-06-01'), [self.new_order.id])
+        response = self.client.get(reverse('order-list'), {'status': 'Lost'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SparseFieldsApiTest(APITestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name="Racing Gloves", price=19.99, available=True)
+        self.customer = Customer.objects.create(name="Lando Norris", address="McLaren Technology Centre")
+        self.order = Order.objects.create(customer=self.customer, status="New")
+        self.order.products.add(self.product)
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(self.user).access_token}")
+
+    def test_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('order-list'), {'fields': 'id,status'})
+        self.assertEqual(response.data['results'], [{'id': self.order.id, 'status': 'New'}])
+        # the products are neither shown nor prefetched, and only the requested columns are read
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('total_price', queries[0]['sql'])
+
+        response = self.client.get(reverse('product-detail', args=[self.product.id]), {'fields': 'name'})
+        self.assertEqual(response.data, {'name': 'Racing Gloves'})
+        # cached separately from the full representation
+        response = self.client.get(reverse('product-detail', args=[self.product.id]))
+        self.assertEqual(response.data['price'], '19.99')
+
+    def test_expand(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('order-list'), {'expand': 'customer,products', 'fields': 'id,customer,products'})
+        order = response.data['results'][0]
+        self.assertEqual(order['customer']['name'], 'Lando Norris')
+        self.assertEqual(order['products'][0]['price'], '19.99')
+
+        response = self.client.get(reverse('order-detail', args=[self.order.id]), {'expand': 'customer'})
+        self.assertEqual(response.data['customer']['id'], self.customer.id)
+        self.assertEqual(response.data['products'], [self.product.id])
+
+    def test_unknown_names(self):
+        response = self.client.get(reverse('order-list'), {'fields': 'id,secret'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('fields', response.data)
+        response = self.client.get(reverse('order-list'), {'expand': 'status'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ValuesListApiTest(APITestCase):
+    def setUp(self):
+        self.customer = Customer.objects.create(name="Oscar Piastri", address="Woking")
+        for i, name in enumerate(["Kask été", "Line\u2028Separator", "Wheel \U0001F3CE"]):
+            product = Product.objects.create(name=name, price=Decimal(f"{i + 1}9.99"), available=bool(i % 2))
+            order = Order.objects.create(customer=self.customer, status="New")
+            order.products.add(product)
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(self.user).access_token}")
+
+    def test_same_json_as_serializers(self):
+        content = {}
+        for name, params in (('product-list', {'ordering': '-price'}), ('order-list', {})):
+            fast = self.client.get(reverse(name), params)
+            # an empty ?expand= goes through the serializers without changing the representation
+            slow = self.client.get(reverse(name), {**params, 'expand': ''})
+            self.assertEqual(fast.content, slow.content)
+            content[name] = fast.content
+        self.assertIn(b'"name":"Line\\u2028Separator"', content['product-list'])
+        self.assertIn('"Kask été"'.encode(), content['product-list'])
+
+    def test_queries_and_cursor(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('order-list'), {'page_size': 2})
+        self.assertEqual(len(response.data['results']), 2)
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['total_price'], '19.99')
+
+
+class OrderPlacementApiTest(APITestCase):
+    def setUp(self):
+        self.gloves = Product.objects.create(name="Racing Gloves", price=19.99, available=True, stock=1)
+        self.suit = Product.objects.create(name="Racing Suit", price=199.99, available=True)
+        self.helmet = Product.objects.create(name="Helmet", price=59.99, available=False)
+        self.customer = Customer.objects.create(name="Lando Norris", address="McLaren Technology Centre")
+        self.admin = User.objects.create_user(username="testadmin", password="adminpassword", is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(self.admin).access_token}")
+        self.url = reverse('order-place')
+
+    def test_reserves_stock(self):
+        response = self.client.post(
+            self.url, {'customer': self.customer.id, 'products': [self.gloves.id, self.suit.id]}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['products'], [self.gloves.id, self.suit.id])
+        self.assertEqual(response.data['total_price'], '219.98')
+        self.assertTrue(response.data['is_fulfillable'])
+        self.gloves.refresh_from_db()
+        self.suit.refresh_from_db()
+        self.assertEqual(self.gloves.stock, 0)
+        # untracked
+        self.assertIsNone(self.suit.stock)
+
+    def test_rejects_unfulfillable_orders(self):
+        self.client.post(self.url, {'customer': self.customer.id, 'products': [self.gloves.id]}, format='json')
+        for products in ([self.suit.id, self.gloves.id], [self.helmet.id]):
+            response = self.client.post(self.url, {'customer': self.customer.id, 'products': products}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+            self.assertEqual(response.data['products'], [products[-1]])
+        self.assertEqual(Order.objects.count(), 1)
+        # nothing is left reserved by the rejected orders
+        self.assertEqual(Product.objects.get(pk=self.suit.id).updated_at, self.suit.updated_at)
+
+    def test_validation(self):
+        for data in ({'customer': self.customer.id, 'products': []}, {'customer': 0, 'products': [self.suit.id]}):
+            response = self.client.post(self.url, data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(self.url, {'customer': self.customer.id, 'products': [0x7fffffff]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_staff_only(self):
+        user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(user).access_token}")
+        response = self.client.post(self.url, {'customer': self.customer.id, 'products': [self.gloves.id]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(Product.objects.get(pk=self.gloves.id).stock, 1)
+
+    def test_other_writes_cannot_take_tracked_stock(self):
+        data = {'customer': self.customer.id, 'status': 'New', 'products': [self.suit.id, self.gloves.id]}
+        for url, payload in ((reverse('order-list'), data), (reverse('order-bulk'), [data])):
+            response = self.client.post(url, payload, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Order.objects.exists())
+        response = self.client.post(reverse('order-list'), {**data, 'products': [self.suit.id]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        detail = reverse('order-detail', args=[response.data['id']])
+        response = self.client.patch(detail, {'products': [self.suit.id, self.gloves.id]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Product.objects.get(pk=self.gloves.id).stock, 1)
+        # products already on an order stay editable
+        order = place_order(self.customer, [self.gloves.id])
+        response = self.client.patch(
+            reverse('order-detail', args=[order.id]), {'products': [self.gloves.id, self.suit.id]}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class JobApiTest(APITestCase):
+    def setUp(self):
+        customer = Customer.objects.create(name="Lando Norris", address="McLaren Technology Centre")
+        self.order = Order.objects.create(customer=customer, status="New")
+        self.admin = User.objects.create_user(username="admin", password="adminpassword", is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(self.admin).access_token}")
+
+    def test_enqueue_with_idempotency_key(self):
+        data = {'task': 'set_status', 'payload': {'order_ids': [self.order.id], 'status': 'Sent'}}
+        response = self.client.post(reverse('job-list'), data, format='json', HTTP_IDEMPOTENCY_KEY='run-1')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual((response.data['queue'], response.data['status']), ('orders', 'queued'))
+        again = self.client.post(reverse('job-list'), data, format='json', HTTP_IDEMPOTENCY_KEY='run-1')
+        self.assertEqual(again.data['id'], response.data['id'])
+        response = self.client.get(reverse('job-detail', args=[response.data['id']]))
+        self.assertEqual(response.data['key'], 'run-1')
+
+    def test_validation_and_permissions(self):
+        for data in (
+            {'task': 'unknown'},
+            {'task': 'set_status', 'payload': {'status': 'Sent'}},
+            {'task': 'set_status', 'payload': [[self.order.id], 'Sent']},
+            {'task': 'set_status', 'payload': {'order_ids': [self.order.id], 'status': 'X'}},
+        ):
+            response = self.client.post(reverse('job-list'), data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('task', response.data)
+        user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(user).access_token}")
+        self.assertEqual(self.client.get(reverse('job-list')).status_code, status.HTTP_403_FORBIDDEN)
+
+
+class OrderTransitionApiTest(APITestCase):
+    def setUp(self):
+        customer = Customer.objects.create(name="Lando Norris", address="McLaren Technology Centre")
+        self.orders = [Order.objects.create(customer=customer, status=status) for status in ("New", "In Process", "Completed")]
+        self.admin = User.objects.create_superuser(username="testadmin", password="adminpassword")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(self.admin).access_token}")
+        self.url = reverse('order-transition')
+
+    def test_transition_ids(self):
+        ids = [order.id for order in self.orders] + [9999]
+        # lock, one UPDATE, the history and the status counts, in a savepoint
+        with self.assertNumQueries(6):
+            response = self.client.post(self.url, {'status': 'Sent', 'ids': ids}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['moved'], ids[:2])
+        self.assertEqual(response.data['rejected'], {ids[2]: 'Completed'})
+        self.assertEqual(response.data['missing'], [9999])
+        change = OrderStatusChange.objects.get(order=self.orders[1])
+        self.assertEqual((change.from_status, change.changed_by), ('In Process', self.admin))
+
+        response = self.client.get(reverse('order-history', args=[self.orders[0].id]))
+        self.assertEqual([(row['from_status'], row['to_status']) for row in response.data], [('New', 'Sent')])
+
+    def test_transition_filtered_orders(self):
+        response = self.client.post(f"{self.url}?status=In Process", {'status': 'Sent'}, format='json')
+        self.assertEqual(response.data['moved'], [self.orders[1].id])
+        self.assertEqual(Order.objects.get(pk=self.orders[0].id).status, 'New')
+        response = self.client.post(self.url, {'status': 'Lost'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_updates_follow_the_state_machine(self):
+        url = reverse('order-detail', args=[self.orders[2].id])
+        response = self.client.patch(url, {'status': 'New'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('status', response.data)
+
+        data = [{'id': self.orders[0].id, 'status': 'In Process'}, {'id': self.orders[1].id, 'status': 'New'}]
+        response = self.client.patch(reverse('order-bulk'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.patch(reverse('order-bulk'), data[:1], format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        change = OrderStatusChange.objects.get()
+        self.assertEqual((change.order_id, change.to_status, change.changed_by), (self.orders[0].id, 'In Process', self.admin))
+
+    def test_buyers_cannot_move_orders(self):
+        user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(user).access_token}")
+        response = self.client.post(self.url, {'status': 'Sent'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+
+@override_settings(THROTTLE_RATES={'staff': None, 'write': (1, 0.01), 'read': (2, 0.01), 'anon': (1, 0.01)})
+class ThrottlingApiTest(APITestCase):
+    def setUp(self):
+        local_buckets.clear()
+        caches['default'].clear()
+        self.product = Product.objects.create(name="Racing Gloves", price=Decimal('9.99'), available=True)
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(self.user).access_token}")
+        self.url = reverse('product-list')
+
+    def test_reads_past_the_burst_are_throttled(self):
+        for _ in range(2):
+            self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertGreater(int(response['Retry-After']), 0)
+
+        # each user has their own buckets
+        other = User.objects.create_user(username="otheruser", password="testpassword")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(other).access_token}")
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+
+    def test_staff_is_not_throttled(self):
+        admin = User.objects.create_superuser(username="testadmin", password="adminpassword")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(admin).access_token}")
+        for _ in range(5):
+            self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+
+    def test_anonymous_requests_are_throttled_by_address(self):
+        data = {'username': 'testuser', 'password': 'testpassword'}
+        self.assertEqual(self.client.post(reverse('token_obtain_pair'), data).status_code, status.HTTP_200_OK)
+        response = self.client.post(reverse('token_obtain_pair'), data)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    @override_settings(THROTTLE_SCOPES={'search': (1, 0.01)})
+    def test_search_has_its_own_bucket(self):
+        self.assertEqual(self.client.get(self.url, {'search': 'rac'}).status_code, status.HTTP_200_OK)
+        response = self.client.get(reverse('product-search'), {'q': 'rac'})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+
+    @override_settings(THROTTLE_CACHE='default')
+    def test_shared_buckets(self):
+        for _ in range(2):
+            self.client.get(self.url)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(len(local_buckets.states), 0)
+
+    def test_async_views_are_throttled(self):
+        headers = {'Authorization': f"Bearer {tokens_for_user(self.user).access_token}"}
+        codes = [
+            async_to_sync(AsyncClient().get)(reverse('async-product-list'), headers=headers).status_code
+            for _ in range(3)
+        ]
+        self.assertEqual(codes, [200, 200, 429])
+
+
+@override_settings(SHED_MAX_IN_FLIGHT=2, SHED_DB_LATENCY_MS=100)
+class LoadSheddingTest(APITestCase):
+    def setUp(self):
+        local_buckets.clear()
+        monitor.reset()
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.admin = User.objects.create_superuser(username="testadmin", password="adminpassword")
+        self.url = reverse('product-list')
+
+    def tearDown(self):
+        monitor.reset()
+
+    def get(self, user=None, method='get'):
+        if user is not None:
+            self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(user).access_token}")
+        return getattr(self.client, method)(self.url, {'name': 'Gloves', 'price': '9.99'} if method == 'post' else None)
+
+    def test_lowest_priority_is_shed_first(self):
+        # two requests in flight elsewhere
+        monitor.start()
+        monitor.start()
+        try:
+            response = self.get()
+            self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+            self.assertEqual(response['Retry-After'], '5')
+            self.assertEqual(self.get(self.user).status_code, status.HTTP_200_OK)
+        finally:
+            monitor.finish(0, 0.0)
+            monitor.finish(0, 0.0)
+        self.client.credentials()
+        self.assertEqual(self.get().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_slow_database_sheds_all_but_staff(self):
+        monitor.db_latency = 0.25
+        self.assertEqual(self.get(self.user).status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(self.get(self.user, 'post').status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(self.get(self.admin, 'post').status_code, status.HTTP_201_CREATED)
+        self.assertNotEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    @override_settings(SHED_DB_LATENCY_HALF_LIFE=0.001)
+    def test_latency_decays(self):
+        monitor.db_latency = 0.25
+        self.assertEqual(self.get(self.user).status_code, status.HTTP_200_OK)
@@ -0,0 +1,220 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+from rest_framework import exceptions
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import BaseThrottle
+
+from .authentication import ClaimsJWTAuthentication
+
+
+def priority(user, method):
+    # the class THROTTLE_RATES and SHED_LOAD are keyed by: staff, write, read or anon
+    if user is None or not user.is_authenticated:
+        return 'anon'
+    if user.is_staff:
+        return 'staff'
+    return 'read' if method in SAFE_METHODS else 'write'
+
+
+def take(state, capacity, rate, now):
+    # one token bucket step: state is (tokens, time of the last step) or None for a full
+    # bucket; returns the new state and the seconds until a token is available, 0 if one was taken
+    tokens, updated = state or (capacity, now)
+    tokens = min(capacity, tokens + max(now - updated, 0) * rate)
+    if tokens >= 1:
+        return (tokens - 1, now), 0
+    return (tokens, now), (1 - tokens) / rate
+
+
+class LocalBuckets:
+    # per process; least recently used buckets are dropped past maxsize, which at worst
+    # hands an idle client a full bucket again
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.states = OrderedDict()
+
+    def take(self, key, capacity, rate):
+        with self.lock:
+            state, wait = take(self.states.get(key), capacity, rate, time.monotonic())
+            self.states[key] = state
+            self.states.move_to_end(key)
+            if len(self.states) > self.maxsize:
+                self.states.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self.lock:
+            self.states.clear()
+
+
+class CacheBuckets:
+    # shared by every process using the cache; the read and write are not atomic, so a
+    # client racing itself from several processes may get a few tokens more than its rate
+    def __init__(self, alias):
+        self.alias = alias
+
+    def take(self, key, capacity, rate):
+        cache = caches[self.alias]
+        state, wait = take(cache.get(key), capacity, rate, time.time())
+        # a bucket refilled completely is the same as a missing one
+        cache.set(key, state, math.ceil(capacity / rate) + 1)
+        return wait
+
+
+local_buckets = LocalBuckets(100000)
+
+
+def get_buckets():
+    if settings.THROTTLE_CACHE:
+        return CacheBuckets(settings.THROTTLE_CACHE)
+    return local_buckets
+
+
+class TokenBucketThrottle(BaseThrottle):
+    # every client (the user, or the address when anonymous) has a bucket per priority
+    # class, and one more per throttle_scope of the view if THROTTLE_SCOPES rates it
+    def allow_request(self, request, view):
+        user = request.user
+        ident = f'user:{user.pk}' if user is not None and user.is_authenticated else f'ip:{self.get_ident(request)}'
+        klass = priority(user, request.method)
+        buckets = [(f'throttle:{klass}:{ident}', settings.THROTTLE_RATES.get(klass))]
+        scope = getattr(view, 'throttle_scope', None)
+        if scope is not None and klass != 'staff':
+            # first, so a request refused for its scope costs nothing from the class bucket
+            buckets.insert(0, (f'throttle:{scope}:{ident}', settings.THROTTLE_SCOPES.get(scope)))
+        store = get_buckets()
+        self.delay = 0
+        for key, rate in buckets:
+            if rate is None:
+                continue
+            self.delay = store.take(key, *rate)
+            if self.delay:
+                return False
+        return True
+
+    def wait(self):
+        return self.delay
+
+
+class LoadMonitor:
+    # requests in flight in this process, and the mean query time of recent requests as an
+    # average decaying with a half-life of SHED_DB_LATENCY_HALF_LIFE seconds
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.db_latency = 0.0
+        self.updated = time.monotonic()
+
+    def decayed(self, now):
+        return 0.5 ** ((now - self.updated) / settings.SHED_DB_LATENCY_HALF_LIFE)
+
+    def start(self):
+        with self.lock:
+            self.in_flight += 1
+
+    def finish(self, queries, duration):
+        now = time.monotonic()
+        with self.lock:
+            self.in_flight -= 1
+            if queries:
+                weight = self.decayed(now)
+                self.db_latency = self.db_latency * weight + duration / queries * (1 - weight)
+                self.updated = now
+
+    def load(self):
+        # 1.0 is the first threshold reached; without recent queries the latency decays to 0,
+        # so a shed class is let through again once the database has recovered
+        with self.lock:
+            db_latency = self.db_latency * self.decayed(time.monotonic())
+            in_flight = self.in_flight
+        load = 0.0
+        if settings.SHED_MAX_IN_FLIGHT:
+            load = in_flight / settings.SHED_MAX_IN_FLIGHT
+        if settings.SHED_DB_LATENCY_MS:
+            load = max(load, db_latency * 1000 / settings.SHED_DB_LATENCY_MS)
+        return load
+
+    def reset(self):
+        with self.lock:
+            self.db_latency = 0.0
+            self.updated = time.monotonic()
+
+
+monitor = LoadMonitor()
+
+
+def shed_response():
+    response = JsonResponse({'detail': 'The server is overloaded, try again later.'}, status=503)
+    response['Retry-After'] = str(settings.SHED_RETRY_AFTER)
+    return response
+
+
+class LoadSheddingMiddleware:
+    # turns requests away with 503 before they reach a view once the load passes the
+    # threshold of their priority class in SHED_LOAD; staff requests are never shed.
+    # The token is only checked when overloaded, and only to pick the class.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.authenticator = ClaimsJWTAuthentication()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        load = self.load(request)
+        if load and load >= settings.SHED_LOAD.get(priority(self.user(request), request.method), math.inf):
+            return shed_response()
+        monitor.start()
+        try:
+            return self.get_response(request)
+        finally:
+            self.finish(request)
+
+    async def __acall__(self, request):
+        load = self.load(request)
+        if load and load >= settings.SHED_LOAD.get(priority(await self.auser(request), request.method), math.inf):
+            return shed_response()
+        monitor.start()
+        try:
+            return await self.get_response(request)
+        finally:
+            self.finish(request)
+
+    def load(self, request):
+        if any(request.path.startswith(path) for path in settings.SHED_EXEMPT_PATHS):
+            return 0.0
+        load = monitor.load()
+        return load if load >= min(settings.SHED_LOAD.values(), default=math.inf) else 0.0
+
+    def user(self, request):
+        try:
+            result = self.authenticator.authenticate(request)
+        except exceptions.APIException:
+            return None
+        return result and result[0]
+
+    async def auser(self, request):
+        try:
+            result = await self.authenticator.aauthenticate(request)
+        except exceptions.APIException:
+            return None
+        return result and result[0]
+
+    def finish(self, request):
+        profile = getattr(request, '_profile', None)
+        if profile is None:
+            monitor.finish(0, 0.0)
+        else:
+            monitor.finish(len(profile.queries.queries), profile.queries.duration)
@@ -0,0 +1,68 @@
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import summaries
+from .cache import invalidate_on_commit
+from .models import Order, OrderStatusChange
+
+HISTORY_BATCH_SIZE = 5000
+
+
+class TransitionConflict(Exception):
+    pass
+
+
+def record_changes(changes, changed_by_id=None, changed_at=None):
+    # changes: (order pk, status before, status after) triples
+    changed_at = changed_at or timezone.now()
+    OrderStatusChange.objects.bulk_create(
+        [
+            OrderStatusChange(
+                order_id=pk, from_status=before, to_status=after, changed_at=changed_at, changed_by_id=changed_by_id,
+            )
+            for pk, before, after in changes
+        ],
+        batch_size=HISTORY_BATCH_SIZE,
+    )
+
+
+def transition_orders(orders, status, changed_by_id=None):
+    # moves every order of the queryset that may go to status there with a single conditional
+    # UPDATE ... WHERE status IN (...), and returns {pk: status before} for all of them
+    # together with the pks of the ones moved
+    sources = Order.sources(status)
+    orders = orders.select_related(None).prefetch_related(None).order_by('pk')
+    now = timezone.now()
+    with transaction.atomic():
+        # locked in pk order, so concurrent transitions cannot deadlock
+        current = dict(orders.select_for_update().values_list('pk', 'status'))
+        moved = [pk for pk, before in current.items() if before in sources]
+        if not moved:
+            return current, moved
+        if orders.filter(status__in=sources).update(status=status, updated_at=now) != len(moved):
+            # an order entered one of the sources after the others were locked
+            raise TransitionConflict('Orders changed while being moved, try again.')
+        record_changes([(pk, current[pk], status) for pk in moved], changed_by_id, now)
+        # the days of the orders stay the same, so the status counts are all that changes
+        delta = summaries.Delta()
+        for pk in moved:
+            delta.statuses[current[pk]] -= 1
+            delta.statuses[status] += 1
+        delta.apply()
+        invalidate_on_commit(Order)
+    return current, moved
+
+
+@contextmanager
+def recorded(orders, changed_by_id=None):
+    # for writes that send no model signals, like bulk_update; orders are the instances
+    # being changed, read before and after the write
+    orders = list(orders)
+    before = [order.status for order in orders]
+    yield
+    record_changes(
+        [(order.pk, status, order.status) for order, status in zip(orders, before) if order.status != status],
+        changed_by_id,
+    )
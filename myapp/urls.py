@@ -1,6 +1,10 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ProductViewSet, CustomerViewSet, OrderViewSet
+from .async_views import AsyncProductView, AsyncOrderView
+from .views import (
+    ProductViewSet, CustomerViewSet, OrderViewSet, JobViewSet, CacheStatsView, MetricsView, TokenRevokeView,
+    RevenueSummaryView, StatusSummaryView, TopProductsView,
+)
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
@@ -10,6 +14,7 @@ router = DefaultRouter()
 router.register(r'products', ProductViewSet, basename='product')
 router.register(r'customers', CustomerViewSet, basename='customer')
 router.register(r'orders', OrderViewSet, basename='order')
+router.register(r'jobs', JobViewSet, basename='job')
 
 
 schema_view = get_schema_view(
@@ -27,7 +32,17 @@ schema_view = get_schema_view(
 urlpatterns = [
     # Other previously defined patterns
     path('api/', include(router.urls)),
+    path('api/async/products/', AsyncProductView.as_view(), name='async-product-list'),
+    path('api/async/products/<int:pk>/', AsyncProductView.as_view(), name='async-product-detail'),
+    path('api/async/orders/', AsyncOrderView.as_view(), name='async-order-list'),
+    path('api/async/orders/<int:pk>/', AsyncOrderView.as_view(), name='async-order-detail'),
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/token/revoke/', TokenRevokeView.as_view(), name='token_revoke'),
+    path('api/summaries/revenue/', RevenueSummaryView.as_view(), name='summary_revenue'),
+    path('api/summaries/statuses/', StatusSummaryView.as_view(), name='summary_statuses'),
+    path('api/summaries/products/', TopProductsView.as_view(), name='summary_products'),
+    path('api/cache/stats/', CacheStatsView.as_view(), name='cache_stats'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('swagger/', schema_view.with_ui('swagger',cache_timeout = 0), name ='schema - swagger - ui'),
 ]
\ No newline at end of file
@@ -1,23 +1,256 @@
-from rest_framework import viewsets
-from .models import Product, Customer, Order
-from .serializers import ProductSerializer, CustomerSerializer, OrderSerializer
-from rest_framework.permissions import IsAuthenticated
-from .permissions import IsAdminOrReadOnly
-from rest_framework.filters import SearchFilter
-
-class ProductViewSet(viewsets.ModelViewSet):
+from contextlib import contextmanager
+
+from django import forms
+from rest_framework import mixins, viewsets
+from rest_framework.filters import OrderingFilter
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from .models import Product, Customer, Order, DailyRevenue, StatusCount, Job
+from .serializers import (
+    ProductSerializer, CustomerSerializer, OrderSerializer, OrderPlacementSerializer, DailyRevenueSerializer,
+    ProductSalesSerializer, JobSerializer, OrderTransitionSerializer, OrderStatusChangeSerializer,
+)
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.views import APIView
+from .permissions import IsAdminOrReadOnly, IsLocalRequest
+from .filters import FieldFilter
+from .search import ProductSearchFilter, rank_products, search_words
+from .pagination import OrderCursorPagination
+from .mixins import BulkModelMixin, ExportMixin, SparseFieldsViewMixin, ValuesListMixin
+from .cache import CachedResponseMixin, stats as cache_stats
+from .conditional import ConditionalGetMixin
+from .instrumentation import render_metrics
+from .authentication import TokenRevokeSerializer, deny_token
+from .summaries import top_products
+from .placement import OutOfStock, place_order
+from .tasks import refresh_totals_later
+from .jobs import enqueue
+from .transitions import TransitionConflict, recorded, transition_orders
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import ValidationError
+from django.http import HttpResponse
+
+class ProductViewSet(ConditionalGetMixin, CachedResponseMixin, SparseFieldsViewMixin, BulkModelMixin, ExportMixin,
+                     ValuesListMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticated, IsAdminOrReadOnly]
-    filter_backends = (SearchFilter,)
+    filter_backends = (ProductSearchFilter, FieldFilter, OrderingFilter)
     search_fields = ['name']
+    filter_fields = {
+        'available': forms.NullBooleanField(),
+        'price__gte': forms.DecimalField(),
+        'price__lte': forms.DecimalField(),
+    }
+    ordering_fields = ['id', 'name', 'price']
+    ordering = 'id'
+    export_name = 'products'
+    search_limit = 10
+    max_search_limit = 50
+
+    @property
+    def throttle_scope(self):
+        # ranked and ?search= lookups are the expensive reads
+        if self.action == 'search' or self.request.query_params.get('search'):
+            return 'search'
+        return None
+
+    def refresh_stored_values(self, instances, created):
+        if not created:
+            # a price or availability change alters the stored totals of every order containing the product
+            refresh_totals_later(Order.objects.filter(products__in=[instance.pk for instance in instances]))
 
-class CustomerViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        words = search_words([request.query_params.get('q', '')])
+        try:
+            limit = min(int(request.query_params.get('limit', self.search_limit)), self.max_search_limit)
+        except ValueError:
+            limit = self.search_limit
+        if not words or limit < 1:
+            return Response([])
+        queryset = rank_products(self.get_queryset(), words)[:limit]
+        return Response(self.get_serializer(queryset, many=True).data)
+
+class CustomerViewSet(ConditionalGetMixin, CachedResponseMixin, SparseFieldsViewMixin, viewsets.ModelViewSet):
     queryset = Customer.objects.all()
     serializer_class = CustomerSerializer
     permission_classes = [IsAuthenticated, IsAdminOrReadOnly]
+    filter_backends = (FieldFilter, OrderingFilter)
+    filter_fields = {'name__istartswith': forms.CharField()}
+    ordering_fields = ['id', 'name']
+    ordering = 'id'
 
-class OrderViewSet(viewsets.ModelViewSet):
-    queryset = Order.objects.all()
+class OrderViewSet(ConditionalGetMixin, SparseFieldsViewMixin, BulkModelMixin, ExportMixin, ValuesListMixin,
+                   viewsets.ModelViewSet):
+    queryset = Order.objects.select_related('customer').prefetch_related('products')
     serializer_class = OrderSerializer
-    permission_classes = [IsAuthenticated, IsAdminOrReadOnly]
\ No newline at end of file
+    permission_classes = [IsAuthenticated, IsAdminOrReadOnly]
+    pagination_class = OrderCursorPagination
+    filter_backends = (FieldFilter, OrderingFilter)
+    filter_fields = {
+        'total_price__gte': forms.DecimalField(),
+        'total_price__lte': forms.DecimalField(),
+        'item_count__gte': forms.IntegerField(),
+        'item_count__lte': forms.IntegerField(),
+        'is_fulfillable': forms.NullBooleanField(),
+        'status': forms.ChoiceField(choices=Order.STATUS_CHOICES),
+        'customer': forms.IntegerField(),
+        'date_created__gte': forms.DateTimeField(),
+        'date_created__lte': forms.DateTimeField(),
+    }
+    # indexed, so the cursor pagination can seek on them
+    ordering_fields = ['date_created', 'total_price', 'id']
+    ordering = OrderCursorPagination.ordering
+    # the customer is part of the response with ?expand=customer
+    last_modified_fields = ['updated_at', 'products__updated_at', 'customer__updated_at']
+    list_depends_on = (Product, Customer)
+    export_name = 'orders'
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        # re-read so the prefetched products reflect the new ones
+        serializer.instance = self.get_queryset().get(pk=serializer.instance.pk)
+
+    @contextmanager
+    def tracked_changes(self, model, instances):
+        # and the status history
+        with super().tracked_changes(model, instances), recorded(instances.values(), self.request.user.pk):
+            yield
+
+    def refresh_stored_values(self, instances, created):
+        Order.objects.filter(pk__in=[instance.pk for instance in instances]).refresh_totals()
+
+    # e.g. POST ?status=In Process&date_created__lte=... {"status": "Sent"}, or {"status": "Sent", "ids": [...]}
+    @action(detail=False, methods=['post'])
+    def transition(self, request):
+        serializer = OrderTransitionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data.get('ids')
+        orders = self.filter_queryset(self.get_queryset())
+        if ids is not None:
+            orders = orders.filter(pk__in=ids)
+        target = serializer.validated_data['status']
+        try:
+            current, moved = transition_orders(orders, target, request.user.pk)
+        except TransitionConflict as exc:
+            return Response({'detail': str(exc)}, status=409)
+        moved_ids = set(moved)
+        data = {
+            'status': target,
+            'moved': moved,
+            # orders the transition is not allowed for, with their status
+            'rejected': {pk: status for pk, status in current.items() if pk not in moved_ids},
+        }
+        if ids is not None:
+            data['missing'] = [pk for pk in dict.fromkeys(ids) if pk not in current]
+        return Response(data)
+
+    @action(detail=True, methods=['get'])
+    def history(self, request, pk=None):
+        order = self.get_object()
+        changes = order.status_changes.order_by('changed_at', 'id')
+        return Response(OrderStatusChangeSerializer(changes, many=True).data)
+
+    # reserves a unit of every product and rejects the order when one is gone; staff only,
+    # since users are not tied to customers and could otherwise order for anyone
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser])
+    def place(self, request):
+        serializer = OrderPlacementSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            order = place_order(serializer.validated_data['customer'], serializer.validated_data['products'])
+        except OutOfStock as exc:
+            return Response({'detail': str(exc), 'products': exc.product_ids}, status=409)
+        return Response(self.get_serializer(order).data, status=201)
+
+class JobViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
+    # e.g. {"task": "set_status", "payload": {"order_ids": [1, 2], "status": "Sent"}}; the key may
+    # also be sent as an Idempotency-Key header, and repeating a request returns the first job
+    queryset = Job.objects.all()
+    serializer_class = JobSerializer
+    permission_classes = [IsAdminUser]
+    filter_backends = (FieldFilter,)
+    filter_fields = {
+        'status': forms.ChoiceField(choices=Job.STATUS_CHOICES),
+        'queue': forms.CharField(),
+        'task': forms.CharField(),
+    }
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        job = enqueue(
+            serializer.validated_data['task'],
+            serializer.validated_data.get('payload'),
+            key=serializer.validated_data.get('key') or request.headers.get('Idempotency-Key'),
+        )
+        return Response(self.get_serializer(job).data, status=202)
+
+class CacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(cache_stats.snapshot())
+
+class TokenRevokeView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = TokenRevokeSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        deny_token(request.auth)
+        if 'refresh' in serializer.validated_data:
+            deny_token(serializer.validated_data['refresh'])
+        return Response(status=204)
+
+class MetricsView(APIView):
+    # scraped by Prometheus; the histograms are per process
+    authentication_classes = []
+    permission_classes = [IsLocalRequest]
+
+    def get(self, request):
+        return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# Dashboard reads from the summary tables (see myapp.summaries), independent of the number of orders
+class RevenueSummaryView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        queryset = DailyRevenue.objects.filter(orders__gt=0).order_by('day')
+        for param, lookup in (('since', 'day__gte'), ('until', 'day__lte')):
+            value = request.query_params.get(param)
+            if not value:
+                continue
+            try:
+                day = parse_date(value)
+            except ValueError:
+                day = None
+            if day is None:
+                raise ValidationError({param: ['Expected a date (YYYY-MM-DD).']})
+            queryset = queryset.filter(**{lookup: day})
+        return Response(DailyRevenueSerializer(queryset, many=True).data)
+
+class StatusSummaryView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        counts = dict(StatusCount.objects.values_list('status', 'orders'))
+        data = {status: counts.pop(status, 0) for status, _ in Order.STATUS_CHOICES}
+        # orders saved with a status outside the choices are still counted
+        data.update((status, count) for status, count in counts.items() if count)
+        return Response(data)
+
+class TopProductsView(APIView):
+    permission_classes = [IsAuthenticated]
+    limit = 10
+    max_limit = 50
+
+    def get(self, request):
+        try:
+            limit = min(int(request.query_params.get('limit', self.limit)), self.max_limit)
+        except ValueError:
+            limit = self.limit
+        if limit < 1:
+            return Response([])
+        return Response(ProductSalesSerializer(top_products(limit), many=True).data)